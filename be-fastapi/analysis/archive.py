@@ -0,0 +1,172 @@
+import hashlib
+import io
+import logging
+import mmap
+import os
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Mapping, Optional, Tuple
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+from analysis.ingest import SIGNATURE_BYTES, decode_image, sniff_format
+from monitoring.metrics import ARCHIVE_WRITES
+
+"""
+content-addressed archive of uploaded originals
+an image is stored once under the sha256 of its bytes, sharded two levels deep
+(root/ab/cd/abcd...) so no directory grows past a few thousand entries, with a
+small jpeg thumbnail next to it (abcd....thumb.jpg). uploads of the same bytes,
+from any worker, end up as one file: writes go to a temp file in the shard and are
+os.replace'd into place, so readers never see a partial image.
+store() queues the write on a background thread and returns a future that resolves
+to the digest once the original is on disk (None if the write failed), so a scan is
+only ever linked to a file that exists; callers that already hashed the upload pass
+the digest in. when more than max_pending writes are queued the image is skipped
+(and the scan isn't linked) rather than letting the backlog hold uploads in memory.
+read() maps the file instead of reading it, callers get a memoryview over the
+page cache
+"""
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (256, 256)
+MEDIA_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png"}
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+def media_type(data: memoryview) -> str:
+    return MEDIA_TYPES.get(sniff_format(bytes(data[:SIGNATURE_BYTES])) or "", "application/octet-stream")
+
+def content_hash(contents: bytes) -> str:
+    return hashlib.sha256(contents).hexdigest()
+
+def byte_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    # single "bytes=start-end" / "bytes=start-" / "bytes=-suffix" range -> (start, end inclusive)
+    # None serves the whole file: no header, other units, or several ranges
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start, _, end = header[len("bytes="):].strip().partition("-")
+    try:
+        if start:
+            first = int(start)
+            last = int(end) if end else size - 1
+        else:
+            first, last = size - int(end), size - 1
+    except ValueError:
+        return None
+    first = max(first, 0)
+    if first >= size or last < first:
+        raise RangeNotSatisfiable(f"bytes */{size}")
+    return first, min(last, size - 1)
+
+class MappedResponse(Response):
+    # sends slices of the mapping, bytes are copied only by the socket write
+    chunk_size = 256 * 1024
+
+    def __init__(self, data: memoryview, status_code: int = 200, headers: Optional[Mapping[str, str]] = None, media_type: Optional[str] = None):
+        self.data = data
+        super().__init__(None, status_code, {**(headers or {}), "content-length": str(len(data))}, media_type)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        for offset in range(0, len(self.data), self.chunk_size):
+            await send({"type": "http.response.body", "body": self.data[offset:offset + self.chunk_size], "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+def _done(digest: Optional[str]) -> "Future[Optional[str]]":
+    future: "Future[Optional[str]]" = Future()
+    future.set_result(digest)
+    return future
+
+class ImageArchive:
+    def __init__(self, root: str, max_pending: int = 64, thumbnail_size: Tuple[int, int] = THUMBNAIL_SIZE):
+        self.root = Path(root)
+        self.max_pending = max_pending
+        self.thumbnail_size = thumbnail_size
+        self._pending: Dict[str, "Future[Optional[str]]"] = {}
+        self._lock = threading.Lock()
+        # one writer thread: writes are disk bound and ordering keeps dedup simple
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="archive")
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def thumbnail_path_for(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:4] / f"{digest}.thumb.jpg"
+
+    def store(self, contents: bytes, digest: Optional[str] = None) -> "Future[Optional[str]]":
+        # -> future of the digest to link to the scan, None when the write was skipped or failed
+        digest = digest or content_hash(contents)
+        with self._lock:
+            pending = self._pending.get(digest)
+            if pending is not None:
+                return pending
+            if self.path_for(digest).exists():
+                ARCHIVE_WRITES.labels(result="duplicate").inc()
+                return _done(digest)
+            if len(self._pending) >= self.max_pending:
+                ARCHIVE_WRITES.labels(result="dropped").inc()
+                logger.warning("archive_backlog_full", extra={"pending": len(self._pending)})
+                return _done(None)
+            future = self._pending[digest] = self._executor.submit(self._write, digest, contents)
+        return future
+
+    def _write(self, digest: str, contents: bytes) -> Optional[str]:
+        try:
+            path = self.path_for(digest)
+            if path.exists(): # stored by another worker meanwhile
+                ARCHIVE_WRITES.labels(result="duplicate").inc()
+                return digest
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # thumbnail first: an original on disk means both files are there
+            self._write_atomic(self.thumbnail_path_for(digest), self._thumbnail(contents))
+            self._write_atomic(path, contents)
+            ARCHIVE_WRITES.labels(result="stored").inc()
+            return digest
+        except Exception:
+            ARCHIVE_WRITES.labels(result="failed").inc()
+            logger.exception("archive_write_failed", extra={"digest": digest})
+            return None
+        finally:
+            with self._lock:
+                self._pending.pop(digest, None)
+
+    def _thumbnail(self, contents: bytes) -> bytes:
+        # jpeg decodes straight at a reduced DCT scale
+        image = decode_image(contents, self.thumbnail_size, "RGB")
+        image.thumbnail(self.thumbnail_size)
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=80)
+        return buffer.getvalue()
+
+    def _write_atomic(self, path: Path, data: bytes) -> None:
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def read(self, digest: str, thumbnail: bool = False) -> Optional[memoryview]:
+        path = self.thumbnail_path_for(digest) if thumbnail else self.path_for(digest)
+        try:
+            with open(path, "rb") as f:
+                # the mapping outlives the file object and is unmapped once the last view is gone
+                return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def flush(self) -> None:
+        # waits for every write queued so far
+        self._executor.submit(lambda: None).result()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
@@ -1,8 +1,19 @@
-from typing import Dict
+import threading
+from typing import Callable, Dict, Iterable, Optional
 from models.schemas import Baseline
 
+"""
+built-in baselines plus calibrated custom ones from the custom baselines table
+custom baselines live in an in-memory registry: loaded once through load_custom,
+then swapped out whole by reload() after every write, so get_baseline on the
+/analyze hot path is a dict lookup and never touches the database
+"""
+
 class BaselineManager:
-    def __init__(self):
+    def __init__(self, load_custom: Optional[Callable[[], Iterable[Baseline]]] = None):
+        self.load_custom = load_custom
+        self._custom: Optional[Dict[str, Baseline]] = None
+        self._lock = threading.Lock()
         self.baselines: Dict[str, Baseline]={
             "clean_surface": Baseline(
                 id="clean_surface",
@@ -29,12 +40,34 @@ class BaselineManager:
                 expected_score=75.0
             )
         }
+    def reload(self) -> int:
+        # build the new registry first, readers keep using the old one until the swap
+        custom = {baseline.id: baseline for baseline in self.load_custom()} if self.load_custom else {}
+        self._custom = custom
+        return len(custom)
+
+    def _registry(self) -> Dict[str, Baseline]:
+        custom = self._custom
+        if custom is None:
+            with self._lock:
+                if self._custom is None:
+                    self.reload()
+                custom = self._custom
+        return custom or {}
+
+    def is_builtin(self, baseline_id: str) -> bool:
+        return baseline_id in self.baselines
+
+    def get_custom(self, baseline_id: str) -> Optional[Baseline]:
+        return self._registry().get(baseline_id)
+
     def get_baseline(self, baseline_id: str) -> Baseline:
-        return self.baselines.get(
-            baseline_id,
-            self.baselines["clean_surface"] # get baseline by ID return default if not found 
+        return (
+            self.baselines.get(baseline_id)
+            or self._registry().get(baseline_id)
+            or self.baselines["clean_surface"] # get baseline by ID return default if not found 
         )
     
     def list_baselines(self) -> Dict[str, Baseline]:
-        return self.baselines
+        return {**self.baselines, **self._registry()}
     
\ No newline at end of file
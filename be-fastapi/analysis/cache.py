@@ -0,0 +1,175 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+from models.schemas import AnalysisMetrics
+
+"""
+content-addressed cache for scoring results
+key = sha256 of the uploaded bytes + digest of the scorer config, so retuning the
+scorer never serves stale results. two tiers:
+- in-memory LRU per process, bounded by entry count and TTL
+- optional sqlite file (WAL mode) that survives restarts and is shared by all
+  gunicorn workers on the host; every purge_every sets a worker deletes expired
+  rows and the oldest ones beyond max_rows, so the file stops growing
+only score + metrics are cached, baseline/delta/label are derived per request
+"""
+
+CachedResult = Tuple[float, AnalysisMetrics]
+
+def content_digest(contents: bytes) -> str:
+    # ~1ms per MB, callers on the event loop run it in a thread
+    return hashlib.sha256(contents).hexdigest()
+
+def result_key(digest: str, scorer_config: Dict[str, Any]) -> str:
+    config_digest = hashlib.sha256(json.dumps(scorer_config, sort_keys=True, default=list).encode()).hexdigest()[:16]
+    return f"{config_digest}:{digest}"
+
+def cache_key(contents: bytes, scorer_config: Dict[str, Any]) -> str:
+    return result_key(content_digest(contents), scorer_config)
+
+class LRUCache:
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, CachedResult]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.time() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: CachedResult, stored_at: Optional[float] = None) -> None:
+        with self._lock:
+            self._entries[key] = (stored_at or time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+class SQLiteCache:
+    def __init__(self, path: Path, ttl_seconds: float = 3600, max_rows: int = 100_000, purge_every: int = 1000):
+        self.path = Path(path)
+        self.ttl_seconds = ttl_seconds
+        self.max_rows = max_rows
+        self.purge_every = purge_every
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._sets = 0
+        self._sets_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, score REAL NOT NULL, metrics TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_results_stored_at ON results (stored_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # one connection per thread, WAL lets readers from every worker run concurrently
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Tuple[float, CachedResult]]:
+        row = self._connect().execute(
+            "SELECT score, metrics, stored_at FROM results WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        score, metrics, stored_at = row
+        if time.time() - stored_at > self.ttl_seconds:
+            return None
+        return stored_at, (score, AnalysisMetrics(**json.loads(metrics)))
+
+    def set(self, key: str, value: CachedResult, stored_at: float) -> None:
+        score, metrics = value
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, score, metrics, stored_at) VALUES (?, ?, ?, ?)",
+                (key, score, json.dumps(metrics.dict()), stored_at)
+            )
+        with self._sets_lock:
+            self._sets += 1
+            due = self._sets % self.purge_every == 0
+        if due:
+            self.purge()
+
+    def purge(self) -> int:
+        # expired rows, then the oldest beyond max_rows (like the LRU tier evicts); -> rows deleted
+        with self._connect() as conn:
+            deleted = conn.execute(
+                "DELETE FROM results WHERE stored_at < ?", (time.time() - self.ttl_seconds,)
+            ).rowcount
+            deleted += conn.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_rows,)
+            ).rowcount
+        return deleted
+
+class ResultCache:
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600, sqlite_path: Optional[Path] = None, sqlite_max_rows: int = 100_000):
+        self.memory = LRUCache(max_entries, ttl_seconds)
+        self.sqlite = SQLiteCache(sqlite_path, ttl_seconds, sqlite_max_rows) if sqlite_path else None
+        self.enabled = max_entries > 0
+        self.memory_hits = 0
+        self.sqlite_hits = 0
+        self.misses = 0
+
+    @property
+    def blocking(self) -> bool:
+        # the sqlite tier does file i/o on get/set, the memory tier alone doesn't
+        return self.enabled and self.sqlite is not None
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        if not self.enabled:
+            return None
+        value = self.memory.get(key)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+        if self.sqlite is not None:
+            entry = self.sqlite.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                self.memory.set(key, value, stored_at)
+                self.sqlite_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: CachedResult) -> None:
+        if not self.enabled:
+            return
+        stored_at = time.time()
+        self.memory.set(key, value, stored_at)
+        if self.sqlite is not None:
+            self.sqlite.set(key, value, stored_at)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.sqlite_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self.memory),
+            "memory_hits": self.memory_hits,
+            "sqlite_hits": self.sqlite_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.sqlite_hits) / lookups, 4) if lookups else 0.0,
+        }
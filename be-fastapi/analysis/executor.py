@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional, Tuple
+from analysis.pool import DeadlineExceededError, create_scoring_pool, score_before_deadline, score_image_bytes, timed_call
+from analysis.scorer import ContaminationScorer
+from models.schemas import AnalysisMetrics, TileHeatmap
+from monitoring.metrics import QUEUE_DEPTH, SCORING_IN_FLIGHT, SCORING_QUEUE_SECONDS, SCORING_RUN_SECONDS, TIMEOUTS
+
+"""
+bounded scoring executor with backpressure
+backends: thread (default), process, inline (runs on the event loop, for tests/debug)
+at most max_workers jobs run and max_queue wait, anything beyond that is rejected
+right away with ExecutorBusyError instead of piling up until the request timeout.
+a job whose deadline passes while it is still queued is cancelled, and one that gets
+picked up after its deadline is skipped by the worker, so timed out requests don't
+leave computations behind. a job already running when its caller times out finishes
+but its result is discarded.
+a process pool whose worker died (oom kill, a crash in a codec) refuses every job
+after that, so it is replaced and the job is submitted once more
+"""
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("thread", "process", "inline")
+
+class ExecutorBusyError(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("Scoring queue is full")
+        self.retry_after = retry_after
+
+class ScoringExecutor:
+    def __init__(self, scorer: ContaminationScorer, backend: str = "thread", max_workers: Optional[int] = None, max_queue: int = 32, name: Optional[str] = None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown scoring backend {backend!r}. Allowed: {list(BACKENDS)}")
+        self.scorer = scorer
+        self.backend = backend
+        self.name = name or backend # metrics label
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._pending = 0 # queued + running, released when the worker is actually done
+        self._avg_seconds = 0.0 # moving average of submit-to-done time, used for Retry-After
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+        self._queue_seconds = SCORING_QUEUE_SECONDS.labels(executor=self.name)
+        self._run_seconds = SCORING_RUN_SECONDS.labels(executor=self.name)
+        self._timeouts = TIMEOUTS.labels(executor=self.name)
+        self._queue_gauge = QUEUE_DEPTH.labels(executor=self.name)
+        self._in_flight_gauge = SCORING_IN_FLIGHT.labels(executor=self.name)
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    @property
+    def in_flight(self) -> int:
+        return self._pending
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self._pending - self.max_workers)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+    def retry_after(self) -> int:
+        # rough time for the current backlog to drain
+        backlog = self.queue_depth + 1
+        return max(1, math.ceil(backlog * self._avg_seconds / self.max_workers))
+
+    def _get_executor(self) -> Executor:
+        # created on first use so idle workers don't each spawn a pool at boot
+        if self._executor is None:
+            if self.backend == "process":
+                self._executor = create_scoring_pool(self.max_workers, self.scorer.config)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="scoring")
+        return self._executor
+
+    def _drop_broken_pool(self, pool: Executor) -> None:
+        # the next _get_executor() starts a fresh pool; a concurrent caller may have done so already
+        with self._lock:
+            if self._executor is pool:
+                self._executor = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, pool: Executor, contents: bytes, deadline: Optional[float], tiled: bool) -> Future:
+        if self.backend == "process":
+            return pool.submit(timed_call, score_image_bytes, contents, deadline, tiled)
+        return pool.submit(timed_call, score_before_deadline, self.scorer, contents, deadline, tiled)
+
+    def _acquire(self) -> None:
+        with self._lock:
+            if self._pending >= self.capacity:
+                self.rejected += 1
+                raise ExecutorBusyError(self.retry_after())
+            self._pending += 1
+            self._update_gauges()
+
+    def _update_gauges(self) -> None:
+        self._in_flight_gauge.set(self._pending)
+        self._queue_gauge.set(self.queue_depth)
+
+    def _release(self, started: float, finished: bool = True) -> None:
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._pending -= 1
+            self._update_gauges()
+            if finished:
+                self.completed += 1
+                self._avg_seconds = elapsed if self.completed == 1 else 0.8 * self._avg_seconds + 0.2 * elapsed
+
+    def _job_done(self, future, submitted: float) -> None:
+        self._release(submitted, finished=not future.cancelled())
+        if future.cancelled() or future.exception() is not None:
+            return
+        started, _ = future.result()
+        self._queue_seconds.observe(started - submitted)
+        self._run_seconds.observe(time.monotonic() - started)
+
+    async def score(self, contents: bytes, timeout: Optional[float] = None) -> Tuple[float, AnalysisMetrics]:
+        return await self._run(contents, timeout)
+
+    async def score_tiled(self, contents: bytes, timeout: Optional[float] = None) -> Tuple[float, AnalysisMetrics, TileHeatmap]:
+        # full resolution plus the per-tile heatmap, see ContaminationScorer.analyze_tiled
+        return await self._run(contents, timeout, tiled=True)
+
+    async def _run(self, contents: bytes, timeout: Optional[float], tiled: bool = False) -> Any:
+        self._acquire()
+        started = time.monotonic()
+        deadline = started + timeout if timeout is not None else None
+
+        if self.backend == "inline":
+            try:
+                with self._run_seconds.time():
+                    return score_before_deadline(self.scorer, contents, None, tiled)
+            finally:
+                self._release(started)
+
+        for attempt in range(2):
+            if attempt:
+                self._acquire() # the failed job's slot was released when it finished
+            pool = self._get_executor()
+            try:
+                future = self._submit(pool, contents, deadline, tiled)
+            except BrokenProcessPool:
+                # broke while idle, nothing was submitted
+                self._release(started, finished=False)
+                self._drop_broken_pool(pool)
+                if attempt:
+                    raise
+                continue
+            except Exception:
+                self._release(started, finished=False)
+                raise
+            future.add_done_callback(lambda f: self._job_done(f, started))
+
+            try:
+                # cancelling the wrapper also cancels the job if it hasn't started yet
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                _, result = await asyncio.wait_for(asyncio.wrap_future(future), timeout=remaining)
+                return result
+            except (asyncio.TimeoutError, DeadlineExceededError):
+                with self._lock:
+                    self.timed_out += 1
+                self._timeouts.inc()
+                raise asyncio.TimeoutError()
+            except BrokenProcessPool:
+                # a worker died while this (or another) job was running on it
+                logger.warning("scoring_pool_broken", extra={"executor": self.name, "retry": not attempt})
+                self._drop_broken_pool(pool)
+                if attempt:
+                    raise
+        raise BrokenProcessPool("scoring pool broke twice")
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,67 @@
+import io
+from typing import Optional, Tuple
+from PIL import Image, UnidentifiedImageError
+
+"""
+single-decode ingest for uploaded images
+format and dimensions are checked from the header before any pixel data is decoded,
+then the image is decoded exactly once, straight into the mode the scorer wants.
+jpeg uses DCT-domain downscaling (PIL draft) to decode at the smallest 1/2, 1/4 or 1/8
+scale that is still >= target_size, so a 4032x3024 phone photo decodes at 1008x756.
+sniff_format only needs the first SIGNATURE_BYTES of an upload, so a part can be
+turned away before it's read into memory
+"""
+
+ALLOWED_FORMATS = {"JPEG", "PNG"}
+# leading bytes of each allowed format
+SIGNATURES = {
+    b"\xff\xd8\xff": "JPEG",
+    b"\x89PNG\r\n\x1a\n": "PNG",
+}
+SIGNATURE_BYTES = 8
+MIN_IMAGE_DIM = 100
+MAX_IMAGE_DIM = 4096
+
+class InvalidImageError(ValueError):
+    pass
+
+def sniff_format(head: bytes) -> Optional[str]:
+    for signature, format in SIGNATURES.items():
+        if head.startswith(signature):
+            return format
+    return None
+
+def open_image(contents: bytes) -> Image.Image:
+    # lazy open, only the header is parsed
+    try:
+        img = Image.open(io.BytesIO(contents))
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        raise InvalidImageError("Invalid or corrupted image")
+
+    if img.format not in ALLOWED_FORMATS:
+        raise InvalidImageError(f"Invalid image format. Allowed: {sorted(ALLOWED_FORMATS)}")
+
+    width, height = img.size
+    if width < MIN_IMAGE_DIM or height < MIN_IMAGE_DIM or width > MAX_IMAGE_DIM or height > MAX_IMAGE_DIM:
+        raise InvalidImageError(
+            f"Image dimensions must be between {MIN_IMAGE_DIM}x{MIN_IMAGE_DIM} and {MAX_IMAGE_DIM}x{MAX_IMAGE_DIM}"
+        )
+    return img
+
+def probe_image(contents: bytes) -> Tuple[str, int, int]:
+    img = open_image(contents)
+    return str(img.format), img.size[0], img.size[1] # format was checked by open_image
+
+def decode_image(contents: bytes, target_size: Optional[Tuple[int, int]] = None, mode: str = "RGB") -> Image.Image:
+    img = open_image(contents)
+    if target_size is not None and img.format == "JPEG":
+        # decoder picks the reduced scale and, for "L", skips the chroma planes
+        img.draft(mode, target_size)
+    try:
+        if img.mode != mode:
+            return img.convert(mode)
+        img.load()
+        return img
+    except (OSError, SyntaxError, ValueError):
+        # truncated or corrupted pixel data only shows up on decode
+        raise InvalidImageError("Invalid or corrupted image")
@@ -0,0 +1,100 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+"""
+per-connection state for live frame scoring over a websocket
+preview frames go into a single slot: a frame that arrives before the previous
+one was picked up replaces it (latest-frame-wins), so a slow scorer never builds
+a backlog and the gauge always shows the newest view. captured frames are queued
+separately and never dropped; at most max_captures wait at a time, a capture beyond
+that is rejected (CapturesFullError) instead of piling up frames in memory.
+frames() paces the consumer: the next frame is handed out no sooner than
+1 / max_fps after the previous one, and no sooner than busy / cpu_budget, where
+busy is the time the consumer spent on the previous frame. with cpu_budget=0.25 a
+session scoring 40ms frames gets at most ~6 frames per second
+"""
+
+class CapturesFullError(Exception):
+    pass
+
+@dataclass
+class Frame:
+    index: int
+    contents: bytes
+    capture: Optional[Dict[str, Any]] = None # form-like fields for a frame the client wants stored
+
+class ScoreSmoother:
+    def __init__(self, alpha: float = 0.3):
+        self.alpha = alpha
+        self.value: Optional[float] = None
+
+    def update(self, score: float) -> float:
+        self.value = score if self.value is None else self.alpha * score + (1 - self.alpha) * self.value
+        return self.value
+
+class LiveSession:
+    def __init__(self, max_fps: float = 5.0, cpu_budget: float = 0.5, smoothing: float = 0.3, max_captures: int = 8):
+        self.max_fps = max_fps
+        self.cpu_budget = cpu_budget
+        self.max_captures = max_captures
+        self.smoother = ScoreSmoother(smoothing)
+
+        self._latest: Optional[Frame] = None
+        self._captures: Deque[Frame] = deque()
+        self._ready = asyncio.Event()
+        self._closed = False
+        self.received = 0
+        self.scored = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    def push(self, contents: bytes, capture: Optional[Dict[str, Any]] = None) -> Frame:
+        if capture is not None and len(self._captures) >= self.max_captures:
+            self.received += 1
+            self.rejected += 1
+            raise CapturesFullError(f"{self.max_captures} captures are already waiting")
+        frame = Frame(self.received, contents, capture)
+        self.received += 1
+        if capture is not None:
+            self._captures.append(frame)
+        else:
+            if self._latest is not None:
+                self.dropped += 1
+            self._latest = frame
+        self._ready.set()
+        return frame
+
+    def close(self) -> None:
+        self._closed = True
+        self._ready.set()
+
+    def _take(self) -> Optional[Frame]:
+        if self._captures:
+            return self._captures.popleft()
+        frame, self._latest = self._latest, None
+        return frame
+
+    async def frames(self) -> AsyncIterator[Frame]:
+        while True:
+            frame = self._take()
+            if frame is None:
+                if self._closed:
+                    return
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+
+            started = time.monotonic()
+            yield frame
+            self.scored += 1
+
+            busy = time.monotonic() - started
+            interval = max(1 / self.max_fps if self.max_fps > 0 else 0, busy / self.cpu_budget if self.cpu_budget > 0 else 0)
+            if interval > busy and not self._closed:
+                await asyncio.sleep(interval - busy)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"received": self.received, "scored": self.scored, "dropped": self.dropped, "rejected": self.rejected}
@@ -0,0 +1,65 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional, Tuple, Union
+from analysis.scorer import ContaminationScorer
+from models.schemas import AnalysisMetrics, TileHeatmap
+
+"""
+process pool for scoring images off the event loop
+each worker process builds its own ContaminationScorer once and reuses it,
+images are shipped as raw bytes so nothing heavy gets pickled
+"""
+
+_scorer: Optional[ContaminationScorer] = None
+
+# (score, metrics), tiled adds the heatmap
+ScoringResult = Union[
+    Tuple[float, AnalysisMetrics],
+    Tuple[float, AnalysisMetrics, TileHeatmap],
+]
+
+class DeadlineExceededError(Exception):
+    pass
+
+def score_before_deadline(
+    scorer: ContaminationScorer,
+    contents: bytes,
+    deadline: Optional[float] = None,
+    tiled: bool = False
+) -> ScoringResult:
+    # the caller already gave up, skip the work instead of running a zombie job
+    # (monotonic clock is system wide, so this also holds across processes)
+    if deadline is not None and time.monotonic() > deadline:
+        raise DeadlineExceededError()
+    if tiled:
+        return scorer.analyze_tiled_bytes(contents)
+    return scorer.analyze_bytes(contents)
+
+def timed_call(fn, *args) -> Tuple[float, Any]:
+    # start time on the worker, so the caller can split queue wait from run time
+    return time.monotonic(), fn(*args)
+
+def _init_worker(scorer_config: Dict[str, Any]) -> None:
+    global _scorer
+    _scorer = ContaminationScorer(**scorer_config)
+
+def score_image_bytes(
+    contents: bytes,
+    deadline: Optional[float] = None,
+    tiled: bool = False
+) -> ScoringResult:
+    # runs inside the worker process
+    global _scorer
+    if _scorer is None:
+        _scorer = ContaminationScorer()
+    return score_before_deadline(_scorer, contents, deadline, tiled)
+
+def create_scoring_pool(max_workers: int, scorer_config: Dict[str, Any]) -> ProcessPoolExecutor:
+    # spawn instead of fork: the parent runs an event loop and threads
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(scorer_config,),
+    )
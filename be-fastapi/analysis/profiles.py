@@ -0,0 +1,73 @@
+from dataclasses import dataclass
+from typing import Dict
+import numpy as np
+
+"""
+versioned scoring formulas
+a profile is the weighted sum that turns metrics into a 0-100 score plus the
+cutoffs that turn a score into a label. profiles are never edited once scans
+have been stored with them: a retune adds a new version, SCORING_PROFILE picks
+the one new scans use, and rescore.py rewrites stored scans from their metrics.
+score() and label() are the per-request versions, score_array() and
+label_array() give the same results for numpy arrays of stored metrics
+"""
+
+LABELS = np.array(["low", "moderate", "high"])
+
+class UnknownProfileError(ValueError):
+    pass
+
+@dataclass(frozen=True)
+class ScoringProfile:
+    version: str
+    spot_weight: float = 0.5
+    edge_weight: float = 0.35
+    texture_weight: float = 0.15
+    texture_scale: float = 128 # texture variance that counts as fully textured
+    moderate_cutoff: float = 33 # scores below this are low
+    high_cutoff: float = 67 # scores from this up are high
+
+    def score(self, spot_coverage: float, edge_density: float, texture_variance: float) -> float:
+        score = (
+            spot_coverage * self.spot_weight * 100
+            + edge_density * self.edge_weight * 100
+            + (texture_variance / self.texture_scale) * self.texture_weight * 100
+        )
+        return max(0, min(100, score))
+
+    def label(self, score: float) -> str:
+        if score < self.moderate_cutoff:
+            return "low"
+        elif score < self.high_cutoff:
+            return "moderate"
+        else:
+            return "high"
+
+    def score_array(self, spot_coverage: np.ndarray, edge_density: np.ndarray, texture_variance: np.ndarray) -> np.ndarray:
+        # same operations in the same order as score(), so results match it exactly
+        score = (
+            spot_coverage * self.spot_weight * 100
+            + edge_density * self.edge_weight * 100
+            + (texture_variance / self.texture_scale) * self.texture_weight * 100
+        )
+        return np.clip(score, 0, 100)
+
+    def label_codes(self, scores: np.ndarray) -> np.ndarray:
+        # index into LABELS; side="right": a score equal to a cutoff lands in the upper label, like label()
+        return np.searchsorted([self.moderate_cutoff, self.high_cutoff], scores, side="right")
+
+    def label_array(self, scores: np.ndarray) -> np.ndarray:
+        return LABELS[self.label_codes(scores)]
+
+PROFILES: Dict[str, ScoringProfile] = {
+    profile.version: profile for profile in [
+        ScoringProfile("v1"),
+    ]
+}
+DEFAULT_PROFILE = "v1"
+
+def get_profile(version: str) -> ScoringProfile:
+    try:
+        return PROFILES[version]
+    except KeyError:
+        raise UnknownProfileError(f"Unknown scoring profile {version!r}. Available: {sorted(PROFILES)}")
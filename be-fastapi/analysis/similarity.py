@@ -0,0 +1,97 @@
+import itertools
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import cv2
+import numpy as np
+
+"""
+perceptual hashing + similarity index for scans
+dhash: shrink the gray image to 9x8 and record whether each pixel is brighter
+than its right neighbour, giving a 64-bit hash that survives rescaling and
+recompression. similar surfaces -> small hamming distance.
+
+the index is multi-index hashing: each hash is split into 4 16-bit chunks with
+one hash table per chunk. if two hashes are within distance d, at least one chunk
+is within d // 4 (pigeonhole), so a lookup only probes the chunk values within
+that radius and verifies the candidates, instead of scanning every row
+"""
+
+HASH_BITS = 64
+CHUNKS = 4
+CHUNK_BITS = HASH_BITS // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+def dhash(gray: np.ndarray) -> int:
+    small = np.asarray(cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA), dtype=np.uint8)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def format_hash(value: int) -> str:
+    return f"{value:016x}"
+
+def parse_hash(value: str) -> int:
+    return int(value, 16)
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def _chunks(value: int) -> List[int]:
+    return [(value >> (i * CHUNK_BITS)) & CHUNK_MASK for i in range(CHUNKS)]
+
+def _neighbours(chunk: int, radius: int) -> Iterable[int]:
+    # every chunk value within `radius` flipped bits
+    for r in range(radius + 1):
+        for positions in itertools.combinations(range(CHUNK_BITS), r):
+            flipped = chunk
+            for p in positions:
+                flipped ^= 1 << p
+            yield flipped
+
+class SimilarityIndex:
+    def __init__(self):
+        self._tables: List[Dict[int, List[int]]] = [defaultdict(list) for _ in range(CHUNKS)]
+        self._hashes: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock() # separate, searches don't wait for a load
+        self.last_id = 0 # high-water mark of scan ids already indexed
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def add(self, scan_id: int, value: int) -> None:
+        with self._lock:
+            if scan_id in self._hashes:
+                return
+            self._hashes[scan_id] = value
+            for table, chunk in zip(self._tables, _chunks(value)):
+                table[chunk].append(scan_id)
+            self.last_id = max(self.last_id, scan_id)
+
+    def refresh(self, load_since: Callable[[int], Iterable[Tuple[int, str]]]) -> int:
+        # pull rows written since the last refresh (by this or any other worker),
+        # the first call loads the whole history once. one refresh at a time: a
+        # caller that waited reads last_id again and only loads what came after
+        with self._refresh_lock:
+            added = 0
+            for scan_id, value in load_since(self.last_id):
+                self.add(scan_id, parse_hash(value))
+                added += 1
+            return added
+
+    def search(self, value: int, max_distance: int, limit: Optional[int] = None) -> List[Tuple[int, int]]:
+        radius = max_distance // CHUNKS
+        seen = set()
+        matches: List[Tuple[int, int]] = []
+        with self._lock:
+            for table, chunk in zip(self._tables, _chunks(value)):
+                for candidate in _neighbours(chunk, radius):
+                    for scan_id in table.get(candidate, ()):
+                        if scan_id in seen:
+                            continue
+                        seen.add(scan_id)
+                        distance = hamming(value, self._hashes[scan_id])
+                        if distance <= max_distance:
+                            matches.append((scan_id, distance))
+        matches.sort(key=lambda m: (m[1], -m[0]))
+        return matches[:limit] if limit is not None else matches
@@ -0,0 +1,65 @@
+from collections import deque
+from concurrent.futures import Executor
+from typing import Any, Callable, Iterator, NamedTuple, Tuple
+import numpy as np
+
+"""
+tile streaming for full-resolution analysis
+the gray image is the only full-size buffer: tiles are views into it, and each
+worker allocates its blur/threshold/edge temporaries for one padded tile only.
+at most max_in_flight tiles are submitted at a time, so peak memory is the gray
+image plus max_in_flight tiles of temporaries whatever the image size.
+results come back in row-major order as they finish
+"""
+
+TILE_HALO = 16 # context around each tile so the 5x5 blur + 11x11 threshold see the same neighbourhood as on the whole image
+
+class Tile(NamedTuple):
+    row: int
+    col: int
+    y0: int
+    y1: int
+    x0: int
+    x1: int
+
+def tile_grid(shape: Tuple[int, ...], tile_size: int) -> Tuple[int, int]:
+    height, width = shape[:2]
+    return -(-height // tile_size), -(-width // tile_size)
+
+def iter_tiles(shape: Tuple[int, ...], tile_size: int) -> Iterator[Tile]:
+    height, width = shape[:2]
+    rows, cols = tile_grid(shape, tile_size)
+    for row in range(rows):
+        for col in range(cols):
+            y0, x0 = row * tile_size, col * tile_size
+            yield Tile(row, col, y0, min(y0 + tile_size, height), x0, min(x0 + tile_size, width))
+
+def padded(gray: np.ndarray, tile: Tile, halo: int = TILE_HALO) -> Tuple[np.ndarray, Tuple[slice, slice]]:
+    # view of the tile plus its halo, and where the tile itself sits inside it
+    height, width = gray.shape[:2]
+    y0, y1 = max(0, tile.y0 - halo), min(height, tile.y1 + halo)
+    x0, x1 = max(0, tile.x0 - halo), min(width, tile.x1 + halo)
+    core = (slice(tile.y0 - y0, tile.y1 - y0), slice(tile.x0 - x0, tile.x1 - x0))
+    return gray[y0:y1, x0:x1], core
+
+def map_tiles(
+    fn: Callable[[np.ndarray, Tile], Any],
+    gray: np.ndarray,
+    tile_size: int,
+    executor: Executor,
+    max_in_flight: int
+) -> Iterator[Tuple[Tile, Any]]:
+    pending = deque()
+    try:
+        for tile in iter_tiles(gray.shape, tile_size):
+            pending.append((tile, executor.submit(fn, gray, tile)))
+            if len(pending) >= max_in_flight:
+                tile, future = pending.popleft()
+                yield tile, future.result()
+        while pending:
+            tile, future = pending.popleft()
+            yield tile, future.result()
+    finally:
+        # caller stopped early (error, deadline), drop what hasn't started
+        for _, future in pending:
+            future.cancel()
@@ -0,0 +1,71 @@
+import io
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+import numpy as np
+from PIL import Image
+
+"""
+per-worker warm-up after a (cold) start
+opencv allocates its thread pool and dispatch tables on the first call, the
+first decode pulls in PIL's codec plugins and the async engine opens its first
+sqlite connection lazily, so without a warm-up the first /analyze on every
+worker pays for all of it. the steps run once, in order, as a background task
+started by the app's startup; /ready answers 503 until they are done (or after
+one of them failed), /health doesn't wait for them
+"""
+
+logger = logging.getLogger(__name__)
+
+WARM_UP_SIZE = (1024, 768) # bigger than target_size so the resize path runs too
+
+def synthetic_surface(width: int = WARM_UP_SIZE[0], height: int = WARM_UP_SIZE[1], format: str = "JPEG") -> bytes:
+    # light noisy surface with a row of dark spots, same kind of input as a real scan
+    rng = np.random.RandomState(0)
+    pixels = np.clip(rng.normal(225, 6, (height, width, 3)), 0, 255).astype(np.uint8)
+    for x in range(width // 8, width, width // 4):
+        y = height // 2
+        pixels[y - 20:y + 20, x - 20:x + 20] = 110
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format=format)
+    return buffer.getvalue()
+
+class WarmUp:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.done = not enabled
+        self.error: Optional[str] = None
+        self.steps: Dict[str, float] = {} # step -> seconds
+        self.seconds: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.done and self.error is None
+
+    async def run(self, steps: Iterable[Tuple[str, Callable[[], Awaitable[Any]]]]) -> None:
+        if not self.enabled:
+            return
+        warm_up_started = time.monotonic()
+        for name, step in steps:
+            started = time.monotonic()
+            try:
+                await step()
+            except Exception as e:
+                # stays not ready: a scorer that can't score a synthetic image won't score uploads either
+                self.error = f"{name}: {e}"
+                logger.exception("warm_up_failed", extra={"step": name})
+                break
+            finally:
+                self.steps[name] = round(time.monotonic() - started, 4)
+        self.seconds = round(time.monotonic() - warm_up_started, 4)
+        self.done = True
+        logger.info("warm_up_finished", extra={"seconds": self.seconds, "steps": self.steps})
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "done": self.done,
+            "seconds": self.seconds,
+            "steps": dict(self.steps),
+            "error": self.error
+        }
@@ -0,0 +1,52 @@
+import io
+import random
+from typing import Iterator, NamedTuple
+import numpy as np
+from PIL import Image, ImageDraw
+
+"""
+deterministic synthetic surfaces for benchmarks
+same idea as create_test_image in test/test_api.py (gray spots on a light
+surface) but seeded, sized and encoded on demand, plus a little sensor noise so
+jpeg/png sizes and edge counts look like camera frames rather than flat fills.
+the same (width, height, spots, format, seed) always gives the same bytes
+"""
+
+RESOLUTIONS = [(640, 480), (1600, 1200), (4032, 3024)]
+FORMATS = ["JPEG", "PNG"]
+SPOT_DENSITIES = {"clean": 0, "moderate": 150, "dirty": 800} # spots per megapixel
+
+class ImageCase(NamedTuple):
+    name: str
+    width: int
+    height: int
+    format: str
+    spots: int
+    contents: bytes
+
+def create_test_image(width: int = 800, height: int = 600, spots: int = 100, format: str = "PNG", seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    img = Image.new('RGB', (width, height), color=(232, 228, 220))
+    draw = ImageDraw.Draw(img)
+    for _ in range(spots):
+        x, y, r = rng.randint(0, width), rng.randint(0, height), rng.randint(3, 20)
+        shade = rng.randint(90, 200)
+        draw.ellipse([x - r, y - r, x + r, y + r], fill=(shade, shade, shade - 10))
+
+    noise = np.random.RandomState(seed).randint(-6, 7, (height, width, 1), dtype=np.int16)
+    img = Image.fromarray(np.clip(np.asarray(img, dtype=np.int16) + noise, 0, 255).astype(np.uint8))
+
+    img_bytes = io.BytesIO()
+    img.save(img_bytes, format=format, **({"quality": 90} if format == "JPEG" else {}))
+    return img_bytes.getvalue()
+
+def iter_cases(resolutions=RESOLUTIONS, formats=FORMATS, densities=SPOT_DENSITIES, seed: int = 0) -> Iterator[ImageCase]:
+    for width, height in resolutions:
+        for format in formats:
+            for density, per_megapixel in densities.items():
+                spots = round(per_megapixel * width * height / 1e6)
+                yield ImageCase(
+                    f"{width}x{height}-{format.lower()}-{density}",
+                    width, height, format, spots,
+                    create_test_image(width, height, spots, format, seed)
+                )
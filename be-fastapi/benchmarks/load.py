@@ -0,0 +1,339 @@
+import argparse
+import asyncio
+import functools
+import json
+import math
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from benchmarks.images import create_test_image
+from benchmarks.startup import API_KEY, ROOT, free_port, server_command, server_env
+
+"""
+load generator and saturation report for a local server
+requests arrive open-loop: a seeded poisson schedule at --rates requests/s for
+--duration seconds, each one /analyze, /stats or /baselines by --mix. arrivals
+don't wait for earlier responses; at most --concurrency are on the wire and the
+rest queue in the client, and latency counts from the scheduled arrival, so a
+server that falls behind shows up as latency instead of as a slower sender.
+uploads are synthetic surfaces (benchmarks/images.py) in several sizes and both
+formats, --distinct-images of them.
+per run: p50/p95/p99 latency, throughput, and error / 429 / 503 / 504 rates,
+overall and per endpoint.
+
+without --url the server is started here (server:app under gunicorn or uvicorn,
+a fresh database, rate limits and the result cache off unless --keep-rate-limits /
+--keep-cache, so every upload is scored) once per
+--workers value, which gives the saturation curve: the highest rate that stays
+within --slo-ms p95 and --max-error-rate per worker count.
+--record writes the generated schedule as json lines ({"offset_s", "method",
+"path", "image": {width, height, format, spots, seed}}) and --replay sends such a
+file instead, at its own timing scaled by --speed. the generator runs on the
+same machine, so leave it a core: its multipart encoding is not free
+
+    python -m benchmarks.load --workers 1 2 4 --rates 2 4 8 16 --duration 20
+    python -m benchmarks.load --url http://127.0.0.1:8000 --api-key KEY --rates 5
+    python -m benchmarks.load --rates 5 --record schedule.jsonl
+    python -m benchmarks.load --replay schedule.jsonl --workers 2
+"""
+
+ENDPOINTS = {
+    "analyze": ("POST", "/analyze"),
+    "stats": ("GET", "/stats"),
+    "baselines": ("GET", "/baselines"),
+}
+DEFAULT_MIX = {"analyze": 0.7, "stats": 0.2, "baselines": 0.1}
+IMAGE_SPECS = [(640, 480, "JPEG"), (640, 480, "PNG"), (1600, 1200, "JPEG"), (1600, 1200, "PNG"), (4032, 3024, "JPEG")]
+SPOTS_PER_MEGAPIXEL = [0, 150, 800]
+CONTENT_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png"}
+UNLIMITED_TIERS = {"default": {"analyze": "1000000/minute", "batch": "1000000/minute", "baselines": "1000000/minute"}}
+
+def parse_mix(text: str) -> Dict[str, float]:
+    # "analyze=0.7,stats=0.2,baselines=0.1"
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint {name!r}. Allowed: {list(ENDPOINTS)}")
+        mix[name.strip()] = float(weight)
+    return mix
+
+def image_specs(count: int) -> List[Dict[str, Any]]:
+    specs = []
+    for seed in range(count):
+        width, height, format = IMAGE_SPECS[seed % len(IMAGE_SPECS)]
+        per_megapixel = SPOTS_PER_MEGAPIXEL[seed // len(IMAGE_SPECS) % len(SPOTS_PER_MEGAPIXEL)]
+        spots = round(per_megapixel * width * height / 1e6)
+        specs.append({"width": width, "height": height, "format": format, "spots": spots, "seed": seed})
+    return specs
+
+@functools.lru_cache(maxsize=None)
+def _image_bytes(width: int, height: int, format: str, spots: int, seed: int) -> bytes:
+    return create_test_image(width, height, spots, format, seed)
+
+def image_bytes(spec: Dict[str, Any]) -> bytes:
+    return _image_bytes(spec["width"], spec["height"], spec["format"], spec["spots"], spec["seed"])
+
+def build_schedule(rate: float, duration: float, mix: Dict[str, float] = DEFAULT_MIX, distinct_images: int = 15, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    images = image_specs(distinct_images)
+    names, weights = list(mix), list(mix.values())
+    schedule, offset = [], 0.0
+    while True:
+        offset += rng.expovariate(rate)
+        if offset >= duration:
+            return schedule
+        method, path = ENDPOINTS[rng.choices(names, weights)[0]]
+        item: Dict[str, Any] = {"offset_s": round(offset, 4), "method": method, "path": path}
+        if path == "/analyze":
+            item["image"] = rng.choice(images)
+        schedule.append(item)
+
+def save_schedule(path: Path, schedule: List[Dict[str, Any]]) -> None:
+    path.write_text("".join(json.dumps(item) + "\n" for item in schedule))
+
+def load_schedule(path: Path) -> List[Dict[str, Any]]:
+    schedule = [json.loads(line) for line in path.read_text().splitlines() if line.strip()]
+    return sorted(schedule, key=lambda item: item["offset_s"])
+
+async def run_schedule(
+    base_url: str,
+    schedule: List[Dict[str, Any]],
+    concurrency: int = 64,
+    api_key: str = API_KEY,
+    speed: float = 1.0,
+    timeout: float = 60
+) -> Tuple[List[Dict[str, Any]], float]:
+    # -> (one result per request, seconds from the first arrival to the last response)
+    import httpx
+
+    for item in schedule: # encode outside the timed part
+        if item.get("image"):
+            image_bytes(item["image"])
+
+    results: List[Dict[str, Any]] = []
+    slots = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits, headers={"X-API-Key": api_key}) as client:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+
+        async def send(item: Dict[str, Any], scheduled: float) -> None:
+            async with slots:
+                sent = loop.time()
+                files = None
+                if item.get("image"):
+                    spec = item["image"]
+                    files = {"image": (f"load.{spec['format'].lower()}", image_bytes(spec), CONTENT_TYPES[spec["format"]])}
+                try:
+                    status = (await client.request(item["method"], item["path"], files=files)).status_code
+                except httpx.HTTPError:
+                    status = 0 # connection error or client timeout
+                finished = loop.time()
+            results.append({
+                "path": item["path"],
+                "status": status,
+                "latency_ms": (finished - scheduled) * 1000,
+                "service_ms": (finished - sent) * 1000,
+            })
+
+        tasks = []
+        for item in schedule:
+            scheduled = start + item["offset_s"] / speed
+            delay = scheduled - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send(item, scheduled)))
+        await asyncio.gather(*tasks)
+        elapsed = loop.time() - start
+    return results, elapsed
+
+def percentile(sorted_values: Sequence[float], fraction: float) -> float:
+    # nearest rank
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+def summarize(results: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    latencies = sorted(result["latency_ms"] for result in results)
+    statuses: Dict[str, int] = {}
+    for result in results:
+        statuses[str(result["status"])] = statuses.get(str(result["status"]), 0) + 1
+    count = len(results) or 1
+    ok = sum(1 for result in results if 200 <= result["status"] < 300)
+    return {
+        "requests": len(results),
+        "throughput_rps": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "ok_rps": round(ok / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50), 1),
+        "p95_ms": round(percentile(latencies, 0.95), 1),
+        "p99_ms": round(percentile(latencies, 0.99), 1),
+        "error_rate": round((len(results) - ok) / count, 4),
+        "rate_429": round(statuses.get("429", 0) / count, 4),
+        "rate_503": round(statuses.get("503", 0) / count, 4),
+        "rate_504": round(statuses.get("504", 0) / count, 4),
+        "statuses": statuses,
+    }
+
+def report_run(results: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    return {
+        "all": summarize(results, elapsed),
+        "endpoints": {
+            path: summarize([result for result in results if result["path"] == path], elapsed)
+            for path in sorted({result["path"] for result in results})
+        },
+    }
+
+@contextmanager
+def local_server(server: str = "gunicorn", workers: int = 1, keep_rate_limits: bool = False, keep_cache: bool = False, timeout: float = 120) -> Iterator[str]:
+    import httpx
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if keep_rate_limits:
+            # shared counters, like production
+            overrides = {"RATE_LIMIT_STORAGE": f"sqlite:///{Path(tmp) / 'ratelimit.db'}"}
+        else:
+            overrides = {"RATE_LIMIT_TIERS": json.dumps(UNLIMITED_TIERS)}
+        if not keep_cache:
+            # a handful of distinct images would otherwise be scored once each
+            overrides["RESULT_CACHE_SIZE"] = "0"
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        log = Path(tmp) / "server.log"
+        with open(log, "wb") as output:
+            process = subprocess.Popen(
+                server_command(server, "server:app", port, workers), cwd=ROOT, env=server_env(tmp, **overrides),
+                stdout=output, stderr=subprocess.STDOUT
+            )
+        try:
+            with httpx.Client(base_url=url, timeout=timeout) as client:
+                deadline = time.monotonic() + timeout
+                # every worker warms up on its own and /ready lands on any of them:
+                # a run of ready answers makes it likely they all finished
+                streak = 0
+                while streak < 4 * workers:
+                    if process.poll() is not None or time.monotonic() > deadline:
+                        raise RuntimeError(f"{server} -w {workers} did not get ready:\n{log.read_text()[-2000:]}")
+                    try:
+                        ready = client.get("/ready").status_code == 200
+                    except httpx.HTTPError:
+                        ready = False # not listening yet
+                    streak = streak + 1 if ready else 0
+                    if not ready:
+                        time.sleep(0.05)
+            yield url
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+@contextmanager
+def _existing(url: str) -> Iterator[str]:
+    yield url.rstrip("/")
+
+def max_rate_within_slo(rows: List[Dict[str, Any]], slo_ms: float, max_error_rate: float) -> Optional[float]:
+    passing = [row["rate"] for row in rows if row["all"]["p95_ms"] <= slo_ms and row["all"]["error_rate"] <= max_error_rate]
+    return max(passing) if passing else None
+
+def run(
+    workers: Sequence[int],
+    rates: Sequence[float],
+    duration: float,
+    mix: Dict[str, float] = DEFAULT_MIX,
+    concurrency: int = 64,
+    server: str = "gunicorn",
+    url: Optional[str] = None,
+    api_key: str = API_KEY,
+    keep_rate_limits: bool = False,
+    keep_cache: bool = False,
+    replay: Optional[List[Dict[str, Any]]] = None,
+    speed: float = 1.0,
+    distinct_images: int = 15,
+    slo_ms: float = 1000,
+    max_error_rate: float = 0.01,
+    seed: int = 0
+) -> Dict[str, Any]:
+    curves = []
+    for worker_count in ([None] if url else workers):
+        with (_existing(url) if url is not None else local_server(server, worker_count or 1, keep_rate_limits, keep_cache)) as base_url:
+            rows = []
+            schedules = [(None, replay)] if replay is not None else [(rate, build_schedule(rate, duration, mix, distinct_images, seed)) for rate in rates]
+            for rate, schedule in schedules:
+                print(f"  workers={worker_count or 'external'} rate={rate or 'replay'}: {len(schedule)} requests", file=sys.stderr)
+                results, elapsed = asyncio.run(run_schedule(base_url, schedule, concurrency, api_key, speed))
+                rows.append({"rate": rate, **report_run(results, elapsed)})
+        curves.append({
+            "workers": worker_count,
+            "runs": rows,
+            "max_rate_within_slo": None if replay is not None else max_rate_within_slo(rows, slo_ms, max_error_rate),
+        })
+    return {
+        "meta": {
+            "server": "external" if url else server,
+            "duration_s": duration,
+            "mix": mix,
+            "concurrency": concurrency,
+            "rate_limits": "kept" if keep_rate_limits or url else "lifted",
+            "result_cache": "kept" if keep_cache or url else "off",
+            "replay": replay is not None,
+            "slo_p95_ms": slo_ms,
+            "max_error_rate": max_error_rate,
+        },
+        "curves": curves,
+    }
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="open-loop load test and saturation curve for a local server")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2], help="worker counts to start the server with")
+    parser.add_argument("--rates", type=float, nargs="+", default=[2, 4, 8], help="arrivals per second")
+    parser.add_argument("--duration", type=float, default=15, help="seconds of arrivals per rate")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="e.g. analyze=0.7,stats=0.2,baselines=0.1")
+    parser.add_argument("--concurrency", type=int, default=64, help="max requests on the wire")
+    parser.add_argument("--server", choices=["gunicorn", "uvicorn"], default="gunicorn")
+    parser.add_argument("--url", default=None, help="test a running server instead of starting one")
+    parser.add_argument("--api-key", default=API_KEY)
+    parser.add_argument("--keep-rate-limits", action="store_true", help="keep the server's rate limit tiers")
+    parser.add_argument("--keep-cache", action="store_true", help="keep the server's result cache")
+    parser.add_argument("--distinct-images", type=int, default=15)
+    parser.add_argument("--slo-ms", type=float, default=1000, help="p95 latency a rate must stay under")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--record", type=Path, default=None, help="write the generated schedule (needs one rate)")
+    parser.add_argument("--replay", type=Path, default=None, help="send a recorded schedule instead of --rates")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay time scale, 2 = twice as fast")
+    parser.add_argument("--output", type=Path, default=None, help="also write the report as json")
+    args = parser.parse_args(argv)
+
+    if args.record:
+        if len(args.rates) != 1:
+            parser.error("--record needs exactly one --rates value")
+        save_schedule(args.record, build_schedule(args.rates[0], args.duration, args.mix, args.distinct_images, args.seed))
+    replay = load_schedule(args.replay) if args.replay else None
+
+    report = run(
+        args.workers, args.rates, args.duration, args.mix, args.concurrency, args.server, args.url, args.api_key,
+        args.keep_rate_limits, args.keep_cache, replay, args.speed, args.distinct_images, args.slo_ms, args.max_error_rate, args.seed
+    )
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+    print(f"{'workers':>8} {'rate':>6} {'rps':>7} {'ok rps':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'err':>6} {'429':>6} {'503':>6} {'504':>6}")
+    for curve in report["curves"]:
+        for row in curve["runs"]:
+            summary = row["all"]
+            print(
+                f"{curve['workers'] or 'ext':>8} {row['rate'] or 'replay':>6} {summary['throughput_rps']:>7.2f} {summary['ok_rps']:>7.2f} "
+                f"{summary['p50_ms']:>8.1f} {summary['p95_ms']:>8.1f} {summary['p99_ms']:>8.1f} {summary['error_rate']:>6.1%} "
+                f"{summary['rate_429']:>6.1%} {summary['rate_503']:>6.1%} {summary['rate_504']:>6.1%}"
+            )
+        if not report["meta"]["replay"]:
+            print(f"{'':>8} max rate within p95 {args.slo_ms:.0f}ms / {args.max_error_rate:.0%} errors: {curve['max_rate_within_slo']}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List, Optional
+
+"""
+per-request overhead of the http middleware stack
+requests go through the full asgi app in-process (httpx ASGITransport, no
+sockets), so what's measured is routing + middleware + handler. /analyze is sent
+a text/plain upload with a valid key: it passes auth, rate limiting, form parsing
+and upload validation, then stops with a 400 before scoring or writing a scan
+
+    python -m benchmarks.middleware [--requests 2000]
+"""
+
+API_KEY = "bench-key"
+
+def _configure_env() -> None:
+    # before main is imported: a key to check, no rate limit in the way
+    os.environ.setdefault("API_KEYS", API_KEY)
+    os.environ.setdefault("RATE_LIMIT_STORAGE", "memory://")
+    os.environ.setdefault("RATE_LIMIT_TIERS", json.dumps({"default": {"analyze": "1000000/minute", "batch": "1000000/minute", "baselines": "10/minute"}}))
+
+async def _time_requests(client, method: str, path: str, count: int, **kwargs) -> Dict[str, float]:
+    for _ in range(50):
+        await client.request(method, path, **kwargs)
+    samples: List[float] = []
+    for _ in range(count):
+        started = time.perf_counter()
+        await client.request(method, path, **kwargs)
+        samples.append((time.perf_counter() - started) * 1e6)
+    samples.sort()
+    return {
+        "median_us": round(statistics.median(samples), 1),
+        "p95_us": round(samples[int(len(samples) * 0.95)], 1),
+    }
+
+async def run(count: int) -> Dict[str, Dict[str, float]]:
+    _configure_env()
+    import httpx
+    from main import app
+
+    headers = {"X-API-Key": API_KEY}
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        return {
+            "health": await _time_requests(client, "GET", "/health", count),
+            "analyze": await _time_requests(
+                client, "POST", "/analyze", count, headers=headers, files={"image": ("a.txt", b"not an image", "text/plain")}
+            ),
+            "analyze_unauthenticated": await _time_requests(
+                client, "POST", "/analyze", count, files={"image": ("a.txt", b"not an image", "text/plain")}
+            ),
+        }
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="time requests through the middleware stack")
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args.requests))
+    for path, timing in results.items():
+        print(f"{path:<25} median {timing['median_us']:>8.1f} us  p95 {timing['p95_us']:>8.1f} us")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+import argparse
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+import cv2
+import numpy as np
+from PIL import Image
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from analysis.ingest import decode_image, probe_image
+from analysis.scorer import ContaminationScorer
+from benchmarks.images import FORMATS, RESOLUTIONS, SPOT_DENSITIES, iter_cases
+from database.aggregates import install_triggers
+from database.db import _apply_pragmas
+from database.models import Base, Scan
+from database.rollups import install_rollup_triggers
+
+"""
+micro-benchmarks for each stage of the scoring pipeline
+every stage is timed on its own, per synthetic image case (resolution x format x
+spot density), repeats times after a warm-up call, and reported as median/p95/min
+in milliseconds. results go to a json file; with --baseline the medians are
+compared against a saved run and the exit code is 1 when a stage got slower than
+--threshold (relative) and --min-delta-ms (absolute, so sub-millisecond noise
+doesn't fail the run)
+
+    python -m benchmarks.pipeline --save-baseline                # on the reference machine
+    python -m benchmarks.pipeline --baseline benchmarks/baseline.json
+"""
+
+DEFAULT_OUTPUT = Path(__file__).parent / "results.json"
+DEFAULT_BASELINE = Path(__file__).parent / "baseline.json"
+
+def measure(fn: Callable[[], Any], repeats: int) -> Dict[str, float]:
+    fn() # warm-up: lazy imports, allocator, opencv thread pool
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "median_ms": round(statistics.median(samples), 4),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+        "min_ms": round(samples[0], 4),
+    }
+
+def bench_image_stages(scorer: ContaminationScorer, contents: bytes, repeats: int) -> Dict[str, Dict[str, float]]:
+    rgb = np.asarray(decode_image(contents))
+    gray_full = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+    gray = cv2.resize(gray_full, scorer.target_size)
+
+    stages = {
+        "verify": lambda: probe_image(contents),
+        "decode": lambda: decode_image(contents, scorer.target_size, scorer.input_mode),
+        "decode_full_rgb": lambda: decode_image(contents),
+        "color_convert": lambda: cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY),
+        "resize": lambda: cv2.resize(gray_full, scorer.target_size),
+        "spot_coverage": lambda: scorer._calculate_spot_coverage(gray),
+        "edge_density": lambda: scorer._calculate_edge_density(gray),
+        "texture_variance": lambda: scorer._calculate_texture_variance(gray),
+        "analyze_bytes": lambda: scorer.analyze_bytes(contents),
+    }
+    return {stage: measure(fn, repeats) for stage, fn in stages.items()}
+
+def bench_db_insert(repeats: int) -> Dict[str, Dict[str, float]]:
+    # a throwaway database with the production schema, pragmas and triggers
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'bench.db'}")
+        event.listen(engine, "connect", _apply_pragmas)
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            install_triggers(conn)
+            install_rollup_triggers(conn)
+        session_factory = sessionmaker(bind=engine)
+
+        def scan(i: int) -> Scan:
+            return Scan(
+                score=float(i % 100), baseline_id="clean_surface", baseline_score=15.0, delta=0.0,
+                label="low", spot_coverage=0.1, edge_density=0.1, texture_variance=10.0,
+                mean_intensity=200.0, phash="0123456789abcdef", location=f"bench-{i % 4}"
+            )
+
+        def insert(count: int) -> None:
+            with session_factory() as db:
+                db.add_all([scan(i) for i in range(count)])
+                db.commit()
+
+        results = {
+            "db_insert": measure(lambda: insert(1), repeats),
+            "db_insert_batch100": measure(lambda: insert(100), repeats),
+        }
+        engine.dispose()
+    return results
+
+def run(repeats: int, quick: bool = False) -> Dict[str, Any]:
+    scorer = ContaminationScorer()
+    resolutions = RESOLUTIONS[:2] if quick else RESOLUTIONS
+    results: Dict[str, Dict[str, float]] = {}
+
+    for case in iter_cases(resolutions, FORMATS, SPOT_DENSITIES):
+        print(f"  {case.name}", file=sys.stderr)
+        for stage, timing in bench_image_stages(scorer, case.contents, repeats).items():
+            results[f"{case.name}/{stage}"] = timing
+    for stage, timing in bench_db_insert(repeats).items():
+        results[f"db/{stage}"] = timing
+
+    return {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "opencv": cv2.getVersionString(),
+            "pillow": Image.__version__,
+            "scorer": {key: list(value) if isinstance(value, tuple) else value for key, value in scorer.config.items()},
+            "repeats": repeats,
+            "quick": quick,
+        },
+        "results": results,
+    }
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float = 0.2, min_delta_ms: float = 0.5) -> List[Dict[str, Any]]:
+    rows = []
+    for key, timing in current["results"].items():
+        reference = baseline["results"].get(key)
+        if reference is None:
+            continue
+        before, after = reference["median_ms"], timing["median_ms"]
+        ratio = after / before if before > 0 else float("inf")
+        rows.append({
+            "stage": key,
+            "baseline_ms": before,
+            "current_ms": after,
+            "ratio": round(ratio, 3),
+            "regression": ratio > 1 + threshold and after - before > min_delta_ms,
+        })
+    return rows
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="time each stage of the scoring pipeline")
+    parser.add_argument("--repeats", type=int, default=7)
+    parser.add_argument("--quick", action="store_true", help="skip the 4032x3024 cases")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", type=Path, default=None, help="saved run to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help=f"also write this run to {DEFAULT_BASELINE.name}")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown of a median")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5, help="ignore slowdowns smaller than this")
+    args = parser.parse_args(argv)
+
+    report = run(args.repeats, args.quick)
+    if args.baseline:
+        report["comparison"] = compare(report, json.loads(args.baseline.read_text()), args.threshold, args.min_delta_ms)
+
+    args.output.write_text(json.dumps(report, indent=2))
+    if args.save_baseline:
+        DEFAULT_BASELINE.write_text(json.dumps(report, indent=2))
+
+    width = max(len(key) for key in report["results"])
+    for key, timing in report["results"].items():
+        print(f"{key:<{width}}  {timing['median_ms']:>10.3f} ms  p95 {timing['p95_ms']:>10.3f} ms")
+
+    regressions = [row for row in report.get("comparison", []) if row["regression"]]
+    for row in regressions:
+        print(f"REGRESSION {row['stage']}: {row['baseline_ms']:.3f} -> {row['current_ms']:.3f} ms (x{row['ratio']})")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import argparse
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from benchmarks.images import create_test_image
+
+"""
+cold start timings of a real server process
+each run starts uvicorn or gunicorn on a free port with a fresh sqlite file (so
+schema creation is included), then records from process spawn: first 200 from
+/health, first 200 from /ready (the per-worker warm-up finished), and the
+latency of the first and second /analyze after that. the warm-up step timings
+come from /ready. separately `python -X importtime -c "import main"` gives the
+import cost of the heavy packages. the disk cache is whatever the machine has,
+so on a warm page cache the import numbers are a lower bound
+
+    python -m benchmarks.startup                          # server:app vs main:app on uvicorn
+    python -m benchmarks.startup --server gunicorn --workers 4 --targets server:app
+"""
+
+ROOT = Path(__file__).parent.parent
+API_KEY = "bench-key"
+PACKAGES = ["fastapi", "pydantic", "sqlalchemy", "numpy", "cv2", "PIL", "slowapi", "prometheus_client", "uvicorn"]
+
+def import_breakdown(module: str = "main") -> Dict[str, float]:
+    # cumulative seconds of the first (= real) import of each package, plus the whole module
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, env=server_env(tempfile.gettempdir())
+    )
+    seconds: Dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| *(\S+)", line)
+        if match and match.group(2) in PACKAGES + [module]:
+            seconds.setdefault(match.group(2), round(int(match.group(1)) / 1e6, 4))
+    return seconds
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def server_env(tmp: str, **overrides: str) -> Dict[str, str]:
+    # a throwaway database, no shared metrics dir or archive from the calling shell
+    env = {key: value for key, value in os.environ.items() if key not in ("PROMETHEUS_MULTIPROC_DIR", "IMAGE_ARCHIVE_DIR")}
+    return {
+        **env,
+        "DATABASE_PATH": str(Path(tmp) / "startup.db"),
+        "RATE_LIMIT_STORAGE": "memory://",
+        "API_KEYS": API_KEY,
+        **overrides,
+    }
+
+def server_command(server: str, target: str, port: int, workers: int) -> List[str]:
+    if server == "gunicorn":
+        return [sys.executable, "-m", "gunicorn", target, "-k", "uvicorn.workers.UvicornWorker", "-w", str(workers), "-b", f"127.0.0.1:{port}"]
+    return [sys.executable, "-m", "uvicorn", target, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"] + (
+        ["--workers", str(workers)] if workers > 1 else []
+    )
+
+def wait_for(client, path: str, started: float, timeout: float):
+    # polls until a 200, -> (seconds since spawn, response)
+    while time.monotonic() - started < timeout:
+        try:
+            response = client.get(path)
+            if response.status_code == 200:
+                return round(time.monotonic() - started, 4), response
+        except Exception:
+            pass # not listening yet
+        time.sleep(0.005)
+    raise TimeoutError(f"{path} not ready after {timeout}s")
+
+def measure_start(server: str, target: str, workers: int = 1, timeout: float = 60) -> Dict[str, Any]:
+    import httpx
+
+    port = free_port()
+    uploads = [create_test_image(1600, 1200, 300, "JPEG", seed) for seed in (1, 2)] # distinct bytes, no cache hit
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.monotonic()
+        process = subprocess.Popen(server_command(server, target, port, workers), cwd=ROOT, env=server_env(tmp), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=timeout) as client:
+                healthy_s, _ = wait_for(client, "/health", started, timeout)
+                ready_s, ready = wait_for(client, "/ready", started, timeout)
+                analyze_ms = []
+                for contents in uploads:
+                    sent = time.perf_counter()
+                    response = client.post("/analyze", headers={"X-API-Key": API_KEY}, files={"image": ("s.jpg", contents, "image/jpeg")})
+                    response.raise_for_status()
+                    analyze_ms.append(round((time.perf_counter() - sent) * 1000, 2))
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    return {
+        "first_healthy_s": healthy_s,
+        "ready_s": ready_s,
+        "first_analyze_ms": analyze_ms[0],
+        "second_analyze_ms": analyze_ms[1],
+        "warm_up": ready.json().get("warm_up"),
+    }
+
+def run(targets: List[str], server: str = "uvicorn", workers: int = 1, runs: int = 3) -> Dict[str, Any]:
+    report: Dict[str, Any] = {"meta": {"server": server, "workers": workers, "runs": runs}, "imports": import_breakdown(), "targets": {}}
+    for target in targets:
+        samples = [measure_start(server, target, workers) for _ in range(runs)]
+        report["targets"][target] = {
+            "median": {
+                key: statistics.median(sample[key] for sample in samples)
+                for key in ("first_healthy_s", "ready_s", "first_analyze_ms", "second_analyze_ms")
+            },
+            "runs": samples,
+        }
+    return report
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="time a server from process start to healthy, ready and first analyze")
+    parser.add_argument("--targets", nargs="+", default=["server:app", "main:app"], help="asgi apps to compare")
+    parser.add_argument("--server", choices=["uvicorn", "gunicorn"], default="uvicorn")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--output", type=Path, default=None, help="also write the report as json")
+    args = parser.parse_args(argv)
+
+    report = run(args.targets, args.server, args.workers, args.runs)
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+    print("import main (cumulative, s): " + ", ".join(f"{name} {seconds:.3f}" for name, seconds in report["imports"].items()))
+    for target, result in report["targets"].items():
+        median = result["median"]
+        print(
+            f"{target:<12} healthy {median['first_healthy_s']:.3f}s  ready {median['ready_s']:.3f}s  "
+            f"first analyze {median['first_analyze_ms']:.1f}ms  second {median['second_analyze_ms']:.1f}ms"
+        )
+        print(f"{'':<12} warm-up steps (last run): {result['runs'][-1]['warm_up']['steps']}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
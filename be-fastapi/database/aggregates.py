@@ -0,0 +1,112 @@
+from typing import Dict, Optional
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+"""
+maintained aggregates for /stats
+scan_stats (one row) and scan_label_counts are updated by sqlite triggers inside
+the same transaction as every insert/update/delete on scans, whoever writes them
+(any worker, batch inserts, bulk updates). /stats then reads two tiny tables
+instead of scanning scans three times.
+min/max only need a rescan when the current min/max row itself is updated or
+deleted, and that lookup goes through ix_scans_score
+tiled scans (scoring_mode='tiled') are scored at full resolution, a different scale
+than every other scan, so they're left out of these and the rollups; GET /scans
+still lists them. a scan's scoring_mode is set on insert and never updated
+"""
+
+def aggregated(row: Optional[str] = None) -> str:
+    # sql condition: does the row (NEW/OLD in a trigger, else the scans row) count towards the aggregates
+    column = f"{row}.scoring_mode" if row else "scoring_mode"
+    return f"{column} IS NOT 'tiled'"
+
+TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS scans_stats_insert AFTER INSERT ON scans WHEN {aggregated("NEW")}
+    BEGIN
+        INSERT INTO scan_stats (id, total, score_sum, min_score, max_score)
+        VALUES (1, 1, NEW.score, NEW.score, NEW.score)
+        ON CONFLICT(id) DO UPDATE SET
+            total = total + 1,
+            score_sum = score_sum + NEW.score,
+            min_score = CASE WHEN min_score IS NULL OR NEW.score < min_score THEN NEW.score ELSE min_score END,
+            max_score = CASE WHEN max_score IS NULL OR NEW.score > max_score THEN NEW.score ELSE max_score END;
+        INSERT INTO scan_label_counts (label, count) VALUES (NEW.label, 1)
+        ON CONFLICT(label) DO UPDATE SET count = count + 1;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS scans_stats_delete AFTER DELETE ON scans WHEN {aggregated("OLD")}
+    BEGIN
+        UPDATE scan_stats SET
+            total = total - 1,
+            score_sum = score_sum - OLD.score,
+            min_score = CASE WHEN OLD.score <= min_score THEN (SELECT MIN(score) FROM scans WHERE {aggregated()}) ELSE min_score END,
+            max_score = CASE WHEN OLD.score >= max_score THEN (SELECT MAX(score) FROM scans WHERE {aggregated()}) ELSE max_score END
+        WHERE id = 1;
+        UPDATE scan_label_counts SET count = count - 1 WHERE label = OLD.label;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS scans_stats_update AFTER UPDATE OF score, label ON scans
+    WHEN {aggregated("OLD")} AND {aggregated("NEW")}
+    BEGIN
+        UPDATE scan_stats SET
+            score_sum = score_sum - OLD.score + NEW.score,
+            min_score = CASE
+                WHEN NEW.score <= min_score THEN NEW.score
+                WHEN OLD.score <= min_score THEN (SELECT MIN(score) FROM scans WHERE {aggregated()})
+                ELSE min_score END,
+            max_score = CASE
+                WHEN NEW.score >= max_score THEN NEW.score
+                WHEN OLD.score >= max_score THEN (SELECT MAX(score) FROM scans WHERE {aggregated()})
+                ELSE max_score END
+        WHERE id = 1;
+        UPDATE scan_label_counts SET count = count - 1 WHERE label = OLD.label AND OLD.label != NEW.label;
+        INSERT INTO scan_label_counts (label, count) SELECT NEW.label, 1 WHERE OLD.label != NEW.label
+        ON CONFLICT(label) DO UPDATE SET count = count + 1;
+    END
+    """,
+]
+
+def install_triggers(conn: Connection) -> None:
+    for trigger in TRIGGERS:
+        conn.execute(text(trigger))
+    # first start on a database that already has scans
+    if conn.execute(text("SELECT COUNT(*) FROM scan_stats")).scalar() == 0:
+        rebuild_scan_stats(conn)
+
+def rebuild_scan_stats(conn: Connection) -> None:
+    # recovery path: recompute everything from the raw rows in one transaction
+    conn.execute(text("DELETE FROM scan_stats"))
+    conn.execute(text("DELETE FROM scan_label_counts"))
+    conn.execute(text(
+        "INSERT INTO scan_stats (id, total, score_sum, min_score, max_score) "
+        f"SELECT 1, COUNT(*), COALESCE(SUM(score), 0.0), MIN(score), MAX(score) FROM scans WHERE {aggregated()}"
+    ))
+    conn.execute(text(
+        f"INSERT INTO scan_label_counts (label, count) SELECT label, COUNT(*) FROM scans WHERE {aggregated()} GROUP BY label"
+    ))
+
+async def read_scan_stats(db: AsyncSession) -> Dict:
+    row = (await db.execute(text("SELECT total, score_sum, min_score, max_score FROM scan_stats WHERE id = 1"))).first()
+    by_label = {"low": 0, "moderate": 0, "high": 0}
+    if row is None or row.total == 0:
+        return {
+            "total_scans": 0,
+            "average_score": 0.0,
+            "min_score": 0.0,
+            "max_score": 0.0,
+            "by_label": by_label
+        }
+
+    for label, count in await db.execute(text("SELECT label, count FROM scan_label_counts WHERE count > 0")):
+        by_label[label] = count
+    return {
+        "total_scans": row.total,
+        "average_score": round(row.score_sum / row.total, 2),
+        "min_score": round(row.min_score or 0.0, 2),
+        "max_score": round(row.max_score or 0.0, 2),
+        "by_label": by_label
+    }
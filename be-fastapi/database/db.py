@@ -1,39 +1,150 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker, Session
-from contextlib import contextmanager
-from sqlalchemy.pool import StaticPool 
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from contextlib import asynccontextmanager, contextmanager
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from pathlib import Path
+from typing import AsyncIterator, Iterator
+import os
+from datetime import datetime
+from typing import Optional
 
 from database.models import Base
+from monitoring.metrics import DB_SESSION_SECONDS
+from database.aggregates import install_triggers, rebuild_scan_stats
+from database.rollups import install_rollup_triggers, rebuild_rollups
 
 db_dir = Path(__file__).parent.parent / "data"
 db_dir.mkdir(exist_ok=True)
 
-db_path = db_dir / "contamination_gauge.db"
+# DATABASE_PATH points a server at another file (benchmarks, load tests)
+db_path = Path(os.getenv("DATABASE_PATH") or db_dir / "contamination_gauge.db")
 
 database_url = f"sqlite:///{db_path}"
+async_database_url = f"sqlite+aiosqlite:///{db_path}"
 
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL", # readers never block the writer and vice versa
+    "synchronous": "NORMAL", # fsync at checkpoints only, still crash-safe in WAL mode
+    "busy_timeout": os.getenv("DB_BUSY_TIMEOUT_MS", "5000"), # wait for the write lock instead of failing with "database is locked"
+    "cache_size": "-16000", # 16MB page cache per connection
+    "temp_store": "MEMORY",
+}
+
+def _apply_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+# sync engine: init_db.py, maintenance scripts, tests and the remaining sync handlers
 engine = create_engine(
     database_url,
     connect_args={"check_same_thread": False},
-    poolclass=StaticPool,
     echo=False,
 )
+event.listen(engine, "connect", _apply_pragmas)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-def init_db():
-    Base.metadata.create_all(bind=engine)
+# async engine for request handlers, aiosqlite runs every connection on its own thread
+# so queries don't block the event loop. a real pool instead of aiosqlite's default NullPool
+async_engine = create_async_engine(
+    async_database_url,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+    max_overflow=int(os.getenv("DB_POOL_OVERFLOW", "5")),
+    echo=False,
+)
+event.listen(async_engine.sync_engine, "connect", _apply_pragmas)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+_SESSION_SECONDS = {engine: DB_SESSION_SECONDS.labels(engine=engine, phase="session") for engine in ("sync", "async")}
+_COMMIT_SECONDS = {engine: DB_SESSION_SECONDS.labels(engine=engine, phase="commit") for engine in ("sync", "async")}
+
+def init_db(attempts: int = 3):
+    # every worker runs this at startup: on a fresh database they race on CREATE TABLE /
+    # CREATE INDEX, the losers get "already exists" and find everything in place on a retry
+    for attempt in range(attempts):
+        try:
+            Base.metadata.create_all(bind=engine)
+            _migrate()
+            _install_triggers()
+            return
+        except OperationalError as e:
+            if "already exists" not in str(e) or attempt == attempts - 1:
+                raise
+
+def _install_triggers():
+    # dropped and re-created on every start so existing databases pick up changed trigger
+    # definitions. pysqlite doesn't open a transaction for DDL, without BEGIN IMMEDIATE each
+    # drop would commit on its own and other workers could insert scans that no trigger counts
+    with engine.connect() as conn:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        names = conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'scans'")).scalars().all()
+        for name in names:
+            conn.execute(text(f'DROP TRIGGER "{name}"'))
+        install_triggers(conn)
+        install_rollup_triggers(conn)
+        conn.commit()
+
+def rebuild_stats(start: Optional[datetime] = None, end: Optional[datetime] = None):
+    # scan_stats is always rebuilt in full, the rollups only over [start, end]
+    with engine.begin() as conn:
+        rebuild_scan_stats(conn)
+        rebuild_rollups(conn, start, end)
+
+# indexes superseded by a composite one, dropped from existing databases
+OBSOLETE_INDEXES = ["ix_scans_timestamp"]
+
+def _migrate():
+    # create_all only creates missing tables, so columns and indexes added to
+    # the models later have to be added to existing databases here
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for name in OBSOLETE_INDEXES:
+            conn.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable:
+                    raise RuntimeError(f"cannot add NOT NULL column {table.name}.{column.name} to an existing table")
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+        # refresh planner statistics for new indexes
+        conn.execute(text("PRAGMA optimize"))
 
 @contextmanager
-def get_db() -> Session:
+def get_db() -> Iterator[Session]:
     db=SessionLocal()
-    try:
-        yield db
-        db.commit()
-    except Exception:
-        db.rollback()
-        raise
-    finally:
-        db.close()
+    with _SESSION_SECONDS["sync"].time():
+        try:
+            yield db
+            with _COMMIT_SECONDS["sync"].time():
+                db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
         
+
+@asynccontextmanager
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    db = AsyncSessionLocal()
+    with _SESSION_SECONDS["async"].time():
+        try:
+            yield db
+            with _COMMIT_SECONDS["async"].time():
+                await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+        finally:
+            await db.close()
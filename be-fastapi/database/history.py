@@ -0,0 +1,140 @@
+import base64
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+from database.db import get_async_db
+from database.models import Scan
+
+"""
+scan history queries with keyset pagination
+pages are ordered by (timestamp, id) and the cursor is the last row's key, so every
+page is a range scan starting right after the previous one. page 10,000 costs the
+same as page 1, unlike OFFSET which has to walk past every skipped row
+
+exports stream plain rows (no ORM objects) from a server-side cursor in chunks of
+EXPORT_CHUNK_ROWS, so memory stays flat no matter how many scans match
+"""
+
+MAX_PAGE_SIZE = 500
+EXPORT_CHUNK_ROWS = 1000
+EXPORT_COLUMNS = [column.name for column in Scan.__table__.columns]
+
+class InvalidCursorError(ValueError):
+    pass
+
+def encode_cursor(timestamp: datetime, scan_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{scan_id}".encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        timestamp, scan_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(scan_id)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursorError("Invalid cursor")
+
+def scan_filters(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    location: Optional[str] = None,
+    baseline_id: Optional[str] = None,
+    label: Optional[str] = None,
+    min_score: Optional[float] = None,
+    max_score: Optional[float] = None,
+    uid: Optional[str] = None
+) -> List[Any]:
+    filters = []
+    if start is not None:
+        filters.append(Scan.timestamp >= start)
+    if end is not None:
+        filters.append(Scan.timestamp < end)
+    if location is not None:
+        filters.append(Scan.location == location)
+    if baseline_id is not None:
+        filters.append(Scan.baseline_id == baseline_id)
+    if label is not None:
+        filters.append(Scan.label == label)
+    if min_score is not None:
+        filters.append(Scan.score >= min_score)
+    if max_score is not None:
+        filters.append(Scan.score <= max_score)
+    if uid is not None:
+        filters.append(Scan.uid == uid)
+    return filters
+
+def ordered_scans(filters: List[Any], descending: bool = True) -> Select:
+    if descending:
+        return select(Scan).where(*filters).order_by(Scan.timestamp.desc(), Scan.id.desc())
+    return select(Scan).where(*filters).order_by(Scan.timestamp.asc(), Scan.id.asc())
+
+async def list_scans(
+    db: AsyncSession,
+    filters: List[Any],
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    descending: bool = True
+) -> Dict[str, Any]:
+    query = ordered_scans(filters, descending)
+    if cursor:
+        timestamp, scan_id = decode_cursor(cursor)
+        # expanded form of (timestamp, id) < (:ts, :id), sqlite turns it into an index range
+        if descending:
+            query = query.where(or_(Scan.timestamp < timestamp, and_(Scan.timestamp == timestamp, Scan.id < scan_id)))
+        else:
+            query = query.where(or_(Scan.timestamp > timestamp, and_(Scan.timestamp == timestamp, Scan.id > scan_id)))
+
+    # one extra row tells whether there is a next page
+    rows = (await db.execute(query.limit(limit + 1))).scalars().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return {
+        "items": [scan.to_dict() for scan in rows],
+        "limit": limit,
+        "next_cursor": encode_cursor(rows[-1].timestamp, rows[-1].id) if has_more else None,
+    }
+
+def _encode_ndjson(rows) -> str:
+    return "".join(
+        json.dumps({key: value.isoformat() if isinstance(value, datetime) else value for key, value in row.items()}) + "\n"
+        for row in rows
+    )
+
+def _encode_csv(rows, header: bool) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    writer.writerows([row[column] for column in EXPORT_COLUMNS] for row in rows)
+    return buffer.getvalue()
+
+async def export_scans(filters: List[Any], format: str = "ndjson", compress: Optional[str] = None) -> AsyncIterator[bytes]:
+    query = (
+        select(*Scan.__table__.columns)
+        .where(*filters)
+        .order_by(Scan.timestamp.asc(), Scan.id.asc())
+        .execution_options(yield_per=EXPORT_CHUNK_ROWS)
+    )
+    # gzip container (wbits=31), flushed per chunk so bytes leave as soon as rows are read
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress == "gzip" else None
+
+    def encode(text: str) -> bytes:
+        data = text.encode()
+        return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH) if compressor else data
+
+    if format == "csv":
+        # header first so the client gets its first byte before the query runs
+        yield encode(_encode_csv([], header=True))
+
+    async with get_async_db() as db:
+        result = await db.stream(query)
+        async for partition in result.mappings().partitions():
+            yield encode(_encode_csv(partition, header=False) if format == "csv" else _encode_ndjson(partition))
+
+    if compressor:
+        yield compressor.flush()
@@ -1,67 +1,130 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import Integer, String, Float, DateTime, Boolean, Text, Index
+from sqlalchemy.orm import Mapped, declarative_base, mapped_column
 from datetime import datetime
+from typing import Optional
+import uuid
 Base = declarative_base()
 
 class Scan(Base):
     __tablename__="scans"
-    id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    # assigned before the insert, so it can be returned when the insert happens later (write-behind)
+    uid: Mapped[Optional[str]] = mapped_column(String(32), nullable=True, default=lambda: uuid.uuid4().hex)
+    timestamp: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
 
 
-    score = Column(Float, nullable=False)
-    baseline_id = Column(String(50), nullable=False)
-    baseline_score = Column(Float, nullable=False)
-    delta = Column (Float, nullable=False)
-    label = Column (String(20), nullable=False)
+    score: Mapped[float] = mapped_column(Float, nullable=False, index=True)
+    baseline_id: Mapped[str] = mapped_column(String(50), nullable=False)
+    baseline_score: Mapped[float] = mapped_column(Float, nullable=False)
+    delta: Mapped[float] = mapped_column(Float, nullable=False)
+    label: Mapped[str] = mapped_column(String(20), nullable=False)
+    score_version: Mapped[Optional[str]] = mapped_column(String(20), nullable=True) # scoring profile of score/delta/label, NULL = before versioning (v1)
+    scoring_mode: Mapped[Optional[str]] = mapped_column(String(20), nullable=True) # standard|tiled, NULL = before modes were stored; tiled scans are left out of /stats
 
 
-    spot_coverage = Column(Float, nullable=False)
-    edge_density= Column(Float, nullable=False)
-    texture_variance = Column(Float, nullable=False)
-    mean_intensity = Column(Float, nullable=False)
+    spot_coverage: Mapped[float] = mapped_column(Float, nullable=False)
+    edge_density: Mapped[float] = mapped_column(Float, nullable=False)
+    texture_variance: Mapped[float] = mapped_column(Float, nullable=False)
+    mean_intensity: Mapped[float] = mapped_column(Float, nullable=False)
+    phash: Mapped[Optional[str]] = mapped_column(String(16), nullable=True) # dhash hex, see analysis/similarity.py
+    image_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True) # sha256 of the archived original, see analysis/archive.py
 
-    sample_name = Column(String(500), nullable=True)
-    location = Column(String(500), nullable=True)
-    notes = Column(Text, nullable=True)
+    sample_name: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
+    location: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
+    notes: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+    # keyset pagination walks (timestamp, id); each equality filter of GET /scans gets
+    # its own (column, timestamp, id) index so filter + order + cursor is one range scan
+    __table_args__ = (
+        Index("ix_scans_timestamp_id", "timestamp", "id"),
+        Index("ix_scans_location_timestamp_id", "location", "timestamp", "id"),
+        Index("ix_scans_baseline_timestamp_id", "baseline_id", "timestamp", "id"),
+        Index("ix_scans_label_timestamp_id", "label", "timestamp", "id"),
+        Index("ix_scans_uid", "uid", unique=True),
+    )
 
     def to_dict(self):
         return {
 
             "id": self.id,
+            "uid": self.uid,
             "timestamp": self.timestamp.isoformat(),
             "score": self.score,
             "baseline_id": self.baseline_id,
             "baseline_score": self.baseline_score,
             "delta": self.delta,
             "label": self.label,
+            "score_version": self.score_version,
+            "scoring_mode": self.scoring_mode,
             "metrics": {
                 "spot_coverage": self.spot_coverage,
                 "edge_density": self.edge_density,
                 "texture_variance": self.texture_variance,
                 "mean_intensity": self.mean_intensity,
+                "phash": self.phash,
             },
+            "image_hash": self.image_hash,
             "sample_name": self.sample_name,
             "location": self.location,
             "notes": self.notes
 
         }
     
+class ScanStats(Base):
+    # single row (id=1) kept in sync with scans by triggers, see database/aggregates.py
+    __tablename__ = "scan_stats"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    total: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    score_sum: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    min_score: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    max_score: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+
+class ScanLabelCount(Base):
+    __tablename__ = "scan_label_counts"
+    label: Mapped[str] = mapped_column(String(20), primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+class RollupColumns:
+    # one row per (bucket, location, baseline_id), kept in sync by triggers,
+    # see database/rollups.py. location NULL is stored as '' to keep the key unique
+    bucket: Mapped[str] = mapped_column(String(19), primary_key=True) # 'YYYY-MM-DD HH:00:00' (utc)
+    location: Mapped[str] = mapped_column(String(500), primary_key=True, default="")
+    baseline_id: Mapped[str] = mapped_column(String(50), primary_key=True)
+
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    score_sum: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    score_min: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    score_max: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    low_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    moderate_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    high_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    spot_coverage_sum: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    edge_density_sum: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    texture_variance_sum: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    mean_intensity_sum: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+
+class HourlyRollup(RollupColumns, Base):
+    __tablename__ = "scan_rollups_hourly"
+
+class DailyRollup(RollupColumns, Base):
+    __tablename__ = "scan_rollups_daily"
+
 class CustomBaseline(Base):
     __tablename__ = "custom baselines"
-    id = Column(Integer, primary_key=True, index=True)
-    baseline_id = Column(String(50), unique = True, nullable=False, index=True)
-    name = Column(String(200), nullable=False)
-    description= Column(Text, nullable=True)
-    created_at=Column(DateTime, default=datetime.utcnow, nullable=False)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    baseline_id: Mapped[str] = mapped_column(String(50), unique = True, nullable=False, index=True)
+    name: Mapped[str] = mapped_column(String(200), nullable=False)
+    description: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
 
-    exptected_score = Column(Float, nullable=False)
-    spot_coverage = Column(Float, nullable=False)
-    edge_density = Column(Float, nullable=False)
-    texture_variance = Column(Float, nullable=False)
-    mean_intensity = Column(Float, nullable=False)
+    exptected_score: Mapped[float] = mapped_column(Float, nullable=False)
+    spot_coverage: Mapped[float] = mapped_column(Float, nullable=False)
+    edge_density: Mapped[float] = mapped_column(Float, nullable=False)
+    texture_variance: Mapped[float] = mapped_column(Float, nullable=False)
+    mean_intensity: Mapped[float] = mapped_column(Float, nullable=False)
 
-    sample_count = Column(Integer, default =1)
+    sample_count: Mapped[Optional[int]] = mapped_column(Integer, default =1)
 
     def to_dict(self):
         return {
@@ -71,4 +134,10 @@ class CustomBaseline(Base):
             "expected_score": self.exptected_score,
             "created_at": self.created_at,
             "sample_count": self.sample_count,
+            "metrics": {
+                "spot_coverage": self.spot_coverage,
+                "edge_density": self.edge_density,
+                "texture_variance": self.texture_variance,
+                "mean_intensity": self.mean_intensity,
+            },
         }
\ No newline at end of file
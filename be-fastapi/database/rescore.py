@@ -0,0 +1,200 @@
+import sqlite3
+import time
+from itertools import repeat
+from typing import Any, Dict, Tuple, cast
+import numpy as np
+from sqlalchemy.engine import Connection
+from analysis.profiles import LABELS, ScoringProfile
+from database.aggregates import aggregated, install_triggers
+from database.db import SQLITE_PRAGMAS, engine
+from database.rollups import GRANULARITIES, install_rollup_triggers
+
+"""
+re-scoring stored scans with a scoring profile, from their metrics alone
+scans are read in id order CHUNK_ROWS at a time with every column numeric (labels
+as codes), so a chunk becomes one float64 array. score, delta and label are
+recomputed as arrays and written back with one executemany per chunk, tagged with
+the profile version; rows whose values don't change only get the tag, which
+leaves the score and label indexes alone.
+the per-row stats and rollup update triggers would turn every write into
+aggregate upserts (about 5x slower), so each chunk's transaction drops them,
+updates, and puts them back. the chunk's changes (old and new score/label) go into
+a temp table and scan_stats, the label counts and the rollups are adjusted from it
+with a few set-based statements in the same transaction, so the write lock is held
+for one chunk at a time and /stats is exact after every commit. the transaction is
+opened with an explicit BEGIN IMMEDIATE: pysqlite doesn't start one for DDL, and the
+trigger drops would otherwise commit on their own (other connections then never
+see the triggers missing).
+metrics are stored rounded, so re-scoring under the same profile can move a score
+by up to ~0.005 before rounding it to 2 places
+"""
+
+CHUNK_ROWS = 50_000
+# the score and label indexes are updated row by row, a bigger page cache keeps them in memory
+RESCORE_CACHE_SIZE = "-262144" # 256MB, this connection only
+UPDATE_TRIGGERS = ("scans_stats_update", "scans_rollup_update")
+
+SELECT_CHUNK = """
+    SELECT id, spot_coverage, edge_density, texture_variance, baseline_score, score, delta,
+           CASE label WHEN 'low' THEN 0 WHEN 'moderate' THEN 1 ELSE 2 END,
+           score_version IS ?
+    FROM scans
+    WHERE id > ? {stale}
+    ORDER BY id
+    LIMIT ?
+"""
+UPDATE_ROW = "UPDATE scans SET score = ?, delta = ?, label = ?, score_version = ? WHERE id = ?"
+UPDATE_VERSION = "UPDATE scans SET score_version = ? WHERE id = ?"
+
+def rescore_chunk(profile: ScoringProfile, chunk: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # -> rows (id, score, delta, label code) whose values change, ids that only need the version tag
+    ids, spot, edge, texture, baseline, old_score, old_delta, old_label, tagged = chunk.T
+    raw = profile.score_array(spot, edge, texture)
+    # same rounding as the /analyze response, label from the unrounded score
+    score = np.round(raw, 2)
+    delta = np.round(raw - baseline, 2)
+    label = profile.label_codes(raw)
+    changed = (score != old_score) | (delta != old_delta) | (label != old_label)
+    retag = ~changed & (tagged == 0)
+    return np.column_stack([ids, score, delta, label])[changed], ids[retag]
+
+CREATE_CHANGES = """
+    CREATE TEMP TABLE IF NOT EXISTS rescore_changes (
+        id INTEGER PRIMARY KEY, old_score REAL, old_label TEXT, new_score REAL, new_label TEXT
+    )
+"""
+INSERT_CHANGE = "INSERT INTO rescore_changes (id, old_score, old_label, new_score, new_label) VALUES (?, ?, ?, ?, ?)"
+# changed rows that count towards the aggregates (tiled scans don't)
+CHANGED = f"rescore_changes c JOIN scans s ON s.id = c.id WHERE {aggregated('s')}"
+
+def _label_diffs() -> str:
+    return ", ".join(
+        f"SUM((c.new_label = '{label}') - (c.old_label = '{label}')) AS {label}_diff" for label in ("low", "moderate", "high")
+    )
+
+def _delta_sql() -> Tuple[str, ...]:
+    stats = f"""
+        UPDATE scan_stats SET
+            score_sum = score_sum + (SELECT COALESCE(SUM(c.new_score - c.old_score), 0.0) FROM {CHANGED}),
+            min_score = (SELECT MIN(score) FROM scans WHERE {aggregated()}),
+            max_score = (SELECT MAX(score) FROM scans WHERE {aggregated()})
+        WHERE id = 1
+    """
+    labels = f"""
+        INSERT INTO scan_label_counts (label, count)
+        SELECT label, SUM(diff) FROM (
+            SELECT c.new_label AS label, 1 AS diff FROM {CHANGED}
+            UNION ALL
+            SELECT c.old_label, -1 FROM {CHANGED}
+        )
+        GROUP BY label HAVING SUM(diff) != 0
+        ON CONFLICT(label) DO UPDATE SET count = count + excluded.count
+    """
+    rollups = []
+    for table, bucket, step in GRANULARITIES.values():
+        # only score and label change, so each row stays in its bucket; min/max are looked up
+        # again only in buckets whose extreme row changed, like the delete trigger does
+        group = (
+            f"timestamp >= {table}.bucket AND timestamp < datetime({table}.bucket, '{step}') "
+            f"AND COALESCE(location, '') = {table}.location AND baseline_id = {table}.baseline_id AND {aggregated()}"
+        )
+        rollups.append(f"""
+            WITH d AS (
+                SELECT {bucket.format(ts="s.timestamp")} AS bucket, COALESCE(s.location, '') AS location, s.baseline_id AS baseline_id,
+                       SUM(c.new_score - c.old_score) AS score_diff, {_label_diffs()},
+                       MIN(c.old_score) AS old_min, MAX(c.old_score) AS old_max,
+                       MIN(c.new_score) AS new_min, MAX(c.new_score) AS new_max
+                FROM {CHANGED}
+                GROUP BY 1, 2, 3
+            )
+            UPDATE {table} SET
+                score_sum = score_sum + d.score_diff,
+                low_count = low_count + d.low_diff,
+                moderate_count = moderate_count + d.moderate_diff,
+                high_count = high_count + d.high_diff,
+                score_min = CASE WHEN d.old_min <= score_min THEN (SELECT MIN(score) FROM scans WHERE {group})
+                            ELSE MIN(score_min, d.new_min) END,
+                score_max = CASE WHEN d.old_max >= score_max THEN (SELECT MAX(score) FROM scans WHERE {group})
+                            ELSE MAX(score_max, d.new_max) END
+            FROM d
+            WHERE {table}.bucket = d.bucket AND {table}.location = d.location AND {table}.baseline_id = d.baseline_id
+        """)
+    return (stats, labels, *rollups)
+
+APPLY_DELTAS = _delta_sql()
+
+def _update_chunk(conn: Connection, cursor: sqlite3.Cursor, profile: ScoringProfile, chunk: np.ndarray, changes: np.ndarray) -> None:
+    # runs inside the chunk's transaction, the triggers are back before it commits
+    for name in UPDATE_TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+    try:
+        ids = changes[:, 0].astype(np.int64).tolist()
+        new_scores = changes[:, 1].tolist()
+        new_labels = LABELS[changes[:, 3].astype(np.intp)].tolist()
+        cursor.executemany(UPDATE_ROW, zip(
+            new_scores,
+            changes[:, 2].tolist(),
+            new_labels,
+            repeat(profile.version),
+            ids,
+        ))
+
+        old = chunk[np.isin(chunk[:, 0], changes[:, 0])]
+        cursor.execute(CREATE_CHANGES)
+        cursor.execute("DELETE FROM rescore_changes")
+        cursor.executemany(INSERT_CHANGE, zip(
+            ids, old[:, 5].tolist(), LABELS[old[:, 7].astype(np.intp)].tolist(), new_scores, new_labels
+        ))
+        for statement in APPLY_DELTAS:
+            cursor.execute(statement)
+    finally:
+        install_triggers(conn)
+        install_rollup_triggers(conn)
+
+def rescore_scans(profile: ScoringProfile, chunk_rows: int = CHUNK_ROWS, force: bool = False) -> Dict[str, Any]:
+    # force=False skips scans already tagged with this profile's version
+    started = time.perf_counter()
+    query = SELECT_CHUNK.format(stale="" if force else "AND score_version IS NOT ?")
+    scanned = updated = retagged = 0
+    last_id = 0
+
+    with engine.connect() as conn:
+        conn.exec_driver_sql(f"PRAGMA cache_size={RESCORE_CACHE_SIZE}")
+        conn.commit()
+        # plain sqlite3 tuples, numpy converts those ~25x faster than sqlalchemy Rows
+        cursor = cast(sqlite3.Connection, conn.connection.driver_connection).cursor()
+        while True:
+            params = (profile.version, last_id) + (() if force else (profile.version,)) + (chunk_rows,)
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            try:
+                rows = cursor.execute(query, params).fetchall()
+                if rows:
+                    chunk = np.array(rows, dtype=np.float64)
+                    changes, retag = rescore_chunk(profile, chunk)
+                    if len(changes):
+                        _update_chunk(conn, cursor, profile, chunk, changes)
+                    # score_version isn't watched by any trigger
+                    cursor.executemany(UPDATE_VERSION, zip(repeat(profile.version), retag.astype(np.int64).tolist()))
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            if not rows:
+                break
+
+            scanned += len(rows)
+            updated += len(changes)
+            retagged += len(retag)
+            last_id = int(chunk[-1, 0])
+            if len(rows) < chunk_rows:
+                break
+        conn.exec_driver_sql(f"PRAGMA cache_size={SQLITE_PRAGMAS['cache_size']}")
+        conn.commit()
+
+    return {
+        "version": profile.version,
+        "scanned": scanned,
+        "updated": updated,
+        "retagged": retagged,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
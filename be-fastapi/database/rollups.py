@@ -0,0 +1,191 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.aggregates import aggregated
+
+"""
+hourly and daily rollups of scans per (location, baseline_id)
+like scan_stats (see database/aggregates.py) the rollup tables are kept in sync by
+sqlite triggers in the same transaction as the write to scans:
+- insert: upsert into the row's hourly and daily bucket
+- delete: subtract the row, min/max are recomputed from scans only when the deleted
+  row was the bucket's extreme (a range lookup on ix_scans_timestamp_id)
+- update: delete of the old row followed by insert of the new one
+tiled scans are left out, like in scan_stats
+weekly series are summed from the daily rollups at query time
+"""
+
+GRANULARITIES = {
+    # table, bucket expression for a timestamp, bucket width
+    "hour": ("scan_rollups_hourly", "strftime('%Y-%m-%d %H:00:00', {ts})", "+1 hour"),
+    "day": ("scan_rollups_daily", "strftime('%Y-%m-%d 00:00:00', {ts})", "+1 day"),
+}
+WEEK_BUCKET = "strftime('%Y-%m-%d 00:00:00', bucket, '-6 days', 'weekday 1')" # monday of the bucket's week
+DEFAULT_RANGE = {"hour": timedelta(days=2), "day": timedelta(days=30), "week": timedelta(weeks=26)}
+ROLLUP_UPDATE_COLUMNS = ("score", "label", "timestamp", "location", "baseline_id", "scoring_mode", "spot_coverage", "edge_density", "texture_variance", "mean_intensity")
+
+COLUMNS = (
+    "bucket, location, baseline_id, count, score_sum, score_min, score_max, low_count, moderate_count, high_count, "
+    "spot_coverage_sum, edge_density_sum, texture_variance_sum, mean_intensity_sum"
+)
+
+def _add_row_sql(table: str, bucket: str, row: str) -> str:
+    ts = bucket.format(ts=f"{row}.timestamp")
+    return f"""
+        INSERT INTO {table} ({COLUMNS})
+        SELECT {ts}, COALESCE({row}.location, ''), {row}.baseline_id, 1, {row}.score, {row}.score, {row}.score,
+               {row}.label = 'low', {row}.label = 'moderate', {row}.label = 'high',
+               {row}.spot_coverage, {row}.edge_density, {row}.texture_variance, {row}.mean_intensity
+        WHERE {aggregated(row)}
+        ON CONFLICT(bucket, location, baseline_id) DO UPDATE SET
+            count = count + 1,
+            score_sum = score_sum + excluded.score_sum,
+            score_min = MIN(score_min, excluded.score_min),
+            score_max = MAX(score_max, excluded.score_max),
+            low_count = low_count + excluded.low_count,
+            moderate_count = moderate_count + excluded.moderate_count,
+            high_count = high_count + excluded.high_count,
+            spot_coverage_sum = spot_coverage_sum + excluded.spot_coverage_sum,
+            edge_density_sum = edge_density_sum + excluded.edge_density_sum,
+            texture_variance_sum = texture_variance_sum + excluded.texture_variance_sum,
+            mean_intensity_sum = mean_intensity_sum + excluded.mean_intensity_sum;
+    """
+
+def _remove_row_sql(table: str, bucket: str, step: str, row: str) -> str:
+    ts = bucket.format(ts=f"{row}.timestamp")
+    key = f"bucket = {ts} AND location = COALESCE({row}.location, '') AND baseline_id = {row}.baseline_id"
+    group = (
+        f"timestamp >= {ts} AND timestamp < datetime({ts}, '{step}') "
+        f"AND COALESCE(location, '') = COALESCE({row}.location, '') AND baseline_id = {row}.baseline_id AND {aggregated()}"
+    )
+    return f"""
+        UPDATE {table} SET
+            count = count - 1,
+            score_sum = score_sum - {row}.score,
+            score_min = CASE WHEN {row}.score <= score_min THEN (SELECT MIN(score) FROM scans WHERE {group}) ELSE score_min END,
+            score_max = CASE WHEN {row}.score >= score_max THEN (SELECT MAX(score) FROM scans WHERE {group}) ELSE score_max END,
+            low_count = low_count - ({row}.label = 'low'),
+            moderate_count = moderate_count - ({row}.label = 'moderate'),
+            high_count = high_count - ({row}.label = 'high'),
+            spot_coverage_sum = spot_coverage_sum - {row}.spot_coverage,
+            edge_density_sum = edge_density_sum - {row}.edge_density,
+            texture_variance_sum = texture_variance_sum - {row}.texture_variance,
+            mean_intensity_sum = mean_intensity_sum - {row}.mean_intensity
+        WHERE {key} AND {aggregated(row)};
+        DELETE FROM {table} WHERE {key} AND count <= 0;
+    """
+
+def _triggers() -> List[str]:
+    add = "".join(_add_row_sql(table, bucket, "NEW") for table, bucket, _ in GRANULARITIES.values())
+    remove = "".join(_remove_row_sql(table, bucket, step, "OLD") for table, bucket, step in GRANULARITIES.values())
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS scans_rollup_insert AFTER INSERT ON scans BEGIN {add} END",
+        f"CREATE TRIGGER IF NOT EXISTS scans_rollup_delete AFTER DELETE ON scans BEGIN {remove} END",
+        f"CREATE TRIGGER IF NOT EXISTS scans_rollup_update AFTER UPDATE OF {', '.join(ROLLUP_UPDATE_COLUMNS)} ON scans "
+        f"BEGIN {remove} {add} END",
+    ]
+
+def install_rollup_triggers(conn: Connection) -> None:
+    for trigger in _triggers():
+        conn.execute(text(trigger))
+    # first start on a database that already has scans
+    table = GRANULARITIES["day"][0]
+    if conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar() == 0:
+        rebuild_rollups(conn)
+
+def rebuild_rollups(conn: Connection, start: Optional[datetime] = None, end: Optional[datetime] = None) -> None:
+    # re-aggregate from raw rows, the range is widened to whole days so the
+    # hourly and daily tables are rebuilt over exactly the same scans
+    start_key = start.strftime("%Y-%m-%d 00:00:00") if start else "0000-00-00 00:00:00"
+    end_key = (end + timedelta(days=1)).strftime("%Y-%m-%d 00:00:00") if end else "9999-12-31 23:59:59"
+    params = {"start": start_key, "end": end_key}
+
+    for table, bucket, _ in GRANULARITIES.values():
+        conn.execute(text(f"DELETE FROM {table} WHERE bucket >= :start AND bucket < :end"), params)
+        conn.execute(text(f"""
+            INSERT INTO {table} ({COLUMNS})
+            SELECT {bucket.format(ts="timestamp")}, COALESCE(location, ''), baseline_id,
+                   COUNT(*), SUM(score), MIN(score), MAX(score),
+                   SUM(label = 'low'), SUM(label = 'moderate'), SUM(label = 'high'),
+                   SUM(spot_coverage), SUM(edge_density), SUM(texture_variance), SUM(mean_intensity)
+            FROM scans
+            WHERE timestamp >= :start AND timestamp < :end AND {aggregated()}
+            GROUP BY 1, 2, 3
+        """), params)
+
+async def query_timeseries(
+    db: AsyncSession,
+    bucket: str = "day",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    location: Optional[str] = None,
+    baseline_id: Optional[str] = None,
+    group_by: Optional[str] = None
+) -> Dict[str, Any]:
+    end = end or datetime.utcnow()
+    start = start or end - DEFAULT_RANGE[bucket]
+
+    table = GRANULARITIES["hour" if bucket == "hour" else "day"][0]
+    bucket_expr = WEEK_BUCKET if bucket == "week" else "bucket"
+    if bucket == "hour":
+        start_key = start.strftime("%Y-%m-%d %H:00:00")
+    elif bucket == "day":
+        start_key = start.strftime("%Y-%m-%d 00:00:00")
+    else:
+        start_key = (start - timedelta(days=start.weekday())).strftime("%Y-%m-%d 00:00:00")
+
+    filters = ["bucket >= :start", "bucket <= :end"]
+    params: Dict[str, Any] = {"start": start_key, "end": end.strftime("%Y-%m-%d %H:%M:%S")}
+    if location is not None:
+        filters.append("location = :location")
+        params["location"] = location
+    if baseline_id is not None:
+        filters.append("baseline_id = :baseline_id")
+        params["baseline_id"] = baseline_id
+
+    group_columns = [group_by] if group_by else []
+    select_group = "".join(f", {column}" for column in group_columns)
+    rows = (await db.execute(text(f"""
+        SELECT {bucket_expr} AS period{select_group},
+               SUM(count) AS count, SUM(score_sum) AS score_sum, MIN(score_min) AS score_min, MAX(score_max) AS score_max,
+               SUM(low_count) AS low_count, SUM(moderate_count) AS moderate_count, SUM(high_count) AS high_count,
+               SUM(spot_coverage_sum) AS spot_coverage_sum, SUM(edge_density_sum) AS edge_density_sum,
+               SUM(texture_variance_sum) AS texture_variance_sum, SUM(mean_intensity_sum) AS mean_intensity_sum
+        FROM {table}
+        WHERE {' AND '.join(filters)}
+        GROUP BY period{select_group}
+        ORDER BY period{select_group}
+    """), params)).mappings().all()
+
+    series = []
+    for row in rows:
+        count = row["count"]
+        point = {
+            "bucket": row["period"],
+            "count": count,
+            "average_score": round(row["score_sum"] / count, 2),
+            "min_score": round(row["score_min"], 2),
+            "max_score": round(row["score_max"], 2),
+            "by_label": {"low": row["low_count"], "moderate": row["moderate_count"], "high": row["high_count"]},
+            "metrics": {
+                "spot_coverage": round(row["spot_coverage_sum"] / count, 4),
+                "edge_density": round(row["edge_density_sum"] / count, 4),
+                "texture_variance": round(row["texture_variance_sum"] / count, 2),
+                "mean_intensity": round(row["mean_intensity_sum"] / count, 2),
+            },
+        }
+        for column in group_columns:
+            point[column] = row[column] or None
+        series.append(point)
+
+    return {
+        "bucket": bucket,
+        "start": start_key,
+        "end": params["end"],
+        "location": location,
+        "baseline_id": baseline_id,
+        "group_by": group_by,
+        "series": series,
+    }
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import time
+from typing import List, Optional, Tuple
+from database.db import get_async_db
+from database.models import Scan
+
+"""
+write-behind group commit for scan inserts
+instead of one transaction (and one fsync) per request, scans go onto an in-process
+queue and a background task commits them in batches of up to batch_size, waiting at
+most max_latency for a batch to fill. callers either wait for their batch to commit
+and get the real scan id back (group commit), or return right away without an id.
+when the queue is full, or the writer isn't running, the scan is written synchronously.
+a batch whose commit fails is retried one scan per transaction, so one bad row or a
+lock timeout only fails the scans that fail again
+"""
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+class ScanWriter:
+    def __init__(self, enabled: bool = False, batch_size: int = 100, max_latency: float = 0.05, max_queue: int = 1000, wait: bool = True):
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.max_queue = max_queue
+        self.wait = wait
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue) # replaced by start(), on the running loop
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.written = 0
+        self.fallbacks = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "running": self.running,
+            "queue_depth": self.queue_depth,
+            "batches": self.batches,
+            "written": self.written,
+            "fallbacks": self.fallbacks,
+        }
+
+    def start(self) -> None:
+        if self.enabled and not self.running:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        # drain everything still queued before shutting down
+        task = self._task
+        if task is not None and not task.done():
+            await self._queue.put(_STOP)
+            await task
+        self._task = None
+
+    async def write(self, scan: Scan) -> Optional[int]:
+        if not self.running:
+            return await self._write_now(scan)
+
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((scan, future))
+        except asyncio.QueueFull:
+            self.fallbacks += 1
+            return await self._write_now(scan)
+
+        if not self.wait:
+            return None
+        return await future
+
+    async def _write_now(self, scan: Scan) -> int:
+        async with get_async_db() as db:
+            db.add(scan)
+            await db.flush()
+            return scan.id
+
+    async def _next_batch(self) -> Tuple[List[Tuple[Scan, asyncio.Future]], bool]:
+        batch = []
+        item = await self._queue.get()
+        if item is _STOP:
+            return batch, True
+        batch.append(item)
+
+        # poll instead of wait_for(queue.get()), a get cancelled by the timeout can drop an item
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.batch_size:
+            if self._queue.empty():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                await asyncio.sleep(min(remaining, 0.002))
+                continue
+            item = self._queue.get_nowait()
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _flush(self, batch: List[Tuple[Scan, asyncio.Future]]) -> None:
+        scans = [scan for scan, _ in batch]
+        try:
+            # one transaction, one commit for the whole batch
+            async with get_async_db() as db:
+                db.add_all(scans)
+                await db.flush()
+        except Exception:
+            logger.exception("write_behind_flush_failed", extra={"batch_size": len(batch)})
+            await self._write_each(batch)
+            return
+
+        self.batches += 1
+        self.written += len(batch)
+        for scan, future in batch:
+            if not future.done():
+                future.set_result(scan.id)
+
+    async def _write_each(self, batch: List[Tuple[Scan, asyncio.Future]]) -> None:
+        # after a failed batch commit (a lock timeout, one bad row) every scan gets its own
+        # transaction, so only the scans that fail again are lost or answered with an error
+        for scan, future in batch:
+            # the rollback leaves the flushed id on the object, another insert may have taken it since
+            setattr(scan, "id", None)
+            try:
+                scan_id = await self._write_now(scan)
+            except Exception as e:
+                logger.exception("write_behind_scan_failed", extra={"uid": scan.uid})
+                if self.wait and not future.done():
+                    future.set_exception(e)
+                continue
+            self.written += 1
+            if not future.done():
+                future.set_result(scan_id)
+
+    async def _run(self) -> None:
+        while True:
+            batch, stopping = await self._next_batch()
+            if batch:
+                await self._flush(batch)
+            if stopping:
+                # anything that raced in behind the stop marker still gets written
+                rest = [item for item in (self._queue.get_nowait() for _ in range(self._queue.qsize())) if item is not _STOP]
+                for i in range(0, len(rest), self.batch_size):
+                    await self._flush(rest[i:i + self.batch_size])
+                return
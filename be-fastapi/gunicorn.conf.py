@@ -0,0 +1,17 @@
+import os
+import shutil
+
+# picked up automatically by gunicorn from the working directory
+
+def on_starting(server):
+    # samples from a previous run would be merged into /metrics otherwise
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+def child_exit(server, worker):
+    # drop the dead worker's live gauges (in-flight, queue depth)
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
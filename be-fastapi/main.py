@@ -1,37 +1,69 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import uvicorn
-import io
-from PIL import Image, UnidentifiedImageError
-from typing import Optional
+from typing import Awaitable, Iterator, List, Optional, Tuple, TypeVar
+from datetime import datetime
 import asyncio
+import json
 import logging
+import math
+import os
+import time
+import uuid
+from pathlib import Path
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 
 
-from database.db import engine
-from sqlalchemy import text, func
+from database.db import async_engine
+from sqlalchemy import func, select, text
 
 from middleware.request_id import RequestIDMiddleware
-from middleware.auth import APIKeyMiddleware
+from middleware.auth import APIKeyMiddleware, api_keys
+from middleware.rate_limit import RateLimitTiers, api_key_digest
+from middleware.upload_limit import UploadLimitMiddleware
 
-from models.schemas import AnalysisMetrics, AnalysisResponse, ErrorResponse
+from models.schemas import AnalysisMetrics, AnalysisResponse, Baseline, BatchAnalysisResponse, BatchItemResult, ErrorResponse
 from analysis.baselines import BaselineManager
 from analysis.scorer import ContaminationScorer
+from analysis.profiles import DEFAULT_PROFILE
+from analysis.executor import ExecutorBusyError, ScoringExecutor
+from analysis.ingest import SIGNATURE_BYTES, InvalidImageError, probe_image, sniff_format
+from analysis.cache import CachedResult, ResultCache, content_digest, result_key
+from analysis.similarity import SimilarityIndex, parse_hash
+from analysis.live import CapturesFullError, LiveSession
+from analysis.archive import ImageArchive, MappedResponse, RangeNotSatisfiable, byte_range, media_type
+from analysis.warmup import WarmUp, synthetic_surface
+from monitoring.metrics import (
+    ANALYZE_STAGE_SECONDS, CONTENT_TYPE_LATEST, IN_FLIGHT, RATE_LIMIT_HITS, REJECTS, SCANS, render_metrics
+)
 
-from database.db import init_db, get_db
-from database.models import Scan
+from database.db import AsyncSessionLocal, init_db, get_db, get_async_db
+from database.aggregates import read_scan_stats
+from database.rollups import query_timeseries
+from database.writer import ScanWriter
+from database.history import MAX_PAGE_SIZE, InvalidCursorError, export_scans, list_scans, scan_filters
+from database.models import CustomBaseline, Scan
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
 
 def get_rate_limit_key(request: Request) -> str:
     api_key = request.headers.get("X-API-Key")
     if api_key:
-        return f"api_key:{api_key}"
+        return f"api_key:{api_key_digest(api_key)}"
     return f"ip:{get_remote_address(request)}"
-limiter = Limiter(key_func=get_rate_limit_key)
+
+# counters live in a sqlite file shared by all gunicorn workers (middleware/rate_limit.py),
+# memory:// gives the old per-process behaviour
+RATE_LIMIT_STORAGE = os.getenv(
+    "RATE_LIMIT_STORAGE", f"sqlite:///{os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'ratelimit.db')}"
+)
+rate_limit_tiers = RateLimitTiers.from_env()
+limiter = Limiter(key_func=get_rate_limit_key, storage_uri=RATE_LIMIT_STORAGE)
 
 app = FastAPI(
     title="contamination gauge API",
@@ -39,12 +71,6 @@ app = FastAPI(
     version="0.1.0"
 )
 
-<<<<<<< HEAD
-app.state.limiter = limiter
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-=======
 origins = [
     "http://localhost",
     "http://localhost:8000"
@@ -54,24 +80,167 @@ app.state.limiter = limiter
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
->>>>>>> master
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"]
 )
 
+MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+MAX_FORM_OVERHEAD = 64 * 1024  # multipart headers + text fields
+ALLOWED_CONTENT_TYPES = ["image/jpeg", "image/jpg", "image/png"]
+ANALYZE_TIMEOUT_SECONDS = 30
+MAX_BATCH_SIZE = 50
+
+# bodies over the limit are cut off while streaming, before the form is parsed
+app.add_middleware(
+    UploadLimitMiddleware,
+    default_limit=MAX_BATCH_SIZE * MAX_FILE_SIZE + MAX_FORM_OVERHEAD,
+    limits={"/analyze": MAX_FILE_SIZE + MAX_FORM_OVERHEAD}
+)
 app.add_middleware(RequestIDMiddleware)
 app.add_middleware(APIKeyMiddleware)
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+def _load_custom_baselines() -> List[Baseline]:
+    with get_db() as db:
+        return [
+            Baseline(**{**row.to_dict(), "description": row.description or ""}, custom=True)
+            for row in db.query(CustomBaseline).all()
+        ]
+
 #initialize components
-baseline_manager = BaselineManager()
-scorer = ContaminationScorer()
+baseline_manager = BaselineManager(load_custom=_load_custom_baselines)
+# other workers' baseline writes show up after at most this long, 0 disables
+BASELINE_REFRESH_SECONDS = float(os.getenv("BASELINE_REFRESH_SECONDS", "30"))
+scorer = ContaminationScorer(
+    fused=os.getenv("SCORER_PIPELINE", "fused") != "legacy",
+    tile_size=int(os.getenv("TILE_SIZE", "512")),
+    tile_workers=int(os.getenv("TILE_WORKERS", "0")) or None,
+    # formula + label cutoffs for new scans, see analysis/profiles.py and rescore.py
+    profile=os.getenv("SCORING_PROFILE", DEFAULT_PROFILE)
+)
+
+# /analyze goes through a bounded executor, batches get their own process pool
+scoring_executor = ScoringExecutor(
+    scorer,
+    backend=os.getenv("SCORING_BACKEND", "thread"),
+    name="analyze",
+    max_workers=int(os.getenv("SCORING_WORKERS", os.cpu_count() or 1)),
+    max_queue=int(os.getenv("SCORING_MAX_QUEUE", "32"))
+)
+batch_executor = ScoringExecutor(
+    scorer,
+    backend="process",
+    name="batch",
+    max_workers=int(os.getenv("BATCH_WORKERS", os.cpu_count() or 1)),
+    max_queue=int(os.getenv("BATCH_MAX_QUEUE", "100"))
+)
+# uploads of one batch read into memory at a time, more than the pool can score just sit in ram
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "0")) or batch_executor.max_workers
+
+similarity_index = SimilarityIndex()
+
+# live camera preview gets its own small pool, so preview sessions can't eat /analyze capacity
+LIVE_MAX_SESSIONS = int(os.getenv("LIVE_MAX_SESSIONS", "4"))
+LIVE_MAX_FPS = float(os.getenv("LIVE_MAX_FPS", "5"))
+LIVE_CPU_BUDGET = float(os.getenv("LIVE_CPU_BUDGET", "0.5")) # fraction of one core per session
+LIVE_SMOOTHING = float(os.getenv("LIVE_SMOOTHING", "0.3"))
+LIVE_MAX_CAPTURES = int(os.getenv("LIVE_MAX_CAPTURES", "8")) # captured frames waiting per session
+live_executor = ScoringExecutor(
+    scorer,
+    backend="thread",
+    name="live",
+    max_workers=int(os.getenv("LIVE_WORKERS", "1")),
+    max_queue=LIVE_MAX_SESSIONS
+)
+live_sessions = 0
+
+# optional group commit for /analyze inserts
+scan_writer = ScanWriter(
+    enabled=os.getenv("WRITE_BEHIND", "0") == "1",
+    batch_size=int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "100")),
+    max_latency=float(os.getenv("WRITE_BEHIND_MAX_LATENCY_MS", "50")) / 1000,
+    max_queue=int(os.getenv("WRITE_BEHIND_QUEUE_SIZE", "1000")),
+    wait=os.getenv("WRITE_BEHIND_WAIT", "1") == "1"
+)
+
+result_cache = ResultCache(
+    max_entries=int(os.getenv("RESULT_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.getenv("RESULT_CACHE_TTL_SECONDS", "3600")),
+    sqlite_path=Path(os.environ["RESULT_CACHE_DB"]) if os.getenv("RESULT_CACHE_DB") else None,
+    sqlite_max_rows=int(os.getenv("RESULT_CACHE_DB_MAX_ROWS", "100000"))
+)
+
+# originals of scored uploads, content-addressed and deduplicated; unset = not archived
+IMAGE_ARCHIVE_DIR = os.getenv("IMAGE_ARCHIVE_DIR")
+image_archive = ImageArchive(
+    IMAGE_ARCHIVE_DIR,
+    max_pending=int(os.getenv("IMAGE_ARCHIVE_MAX_PENDING", "64"))
+) if IMAGE_ARCHIVE_DIR else None
+
+# scorer/opencv/db warm-up on every worker after start, /ready is 503 until it's done
+warm_up = WarmUp(enabled=os.getenv("WARM_UP", "1") == "1")
+
+def _warm_up_steps():
+    contents = synthetic_surface()
+    result = {}
+
+    async def score():
+        # through the executor: its thread (or spawned process) does its own first-call setup
+        result["score"], result["metrics"] = await scoring_executor.score(contents, timeout=ANALYZE_TIMEOUT_SECONDS)
+
+    async def database():
+        # the async pool's first connection, the stats read and one scan insert (statement
+        # compile, triggers) the way /analyze does them, then rolled back: nothing is stored
+        response = _build_analysis_response(result["score"], result["metrics"], "clean_surface", None, None, None, False)
+        async with AsyncSessionLocal() as db:
+            await read_scan_stats(db)
+            db.add(_scan_row(response))
+            await db.flush()
+            await db.rollback()
+
+    return [("scorer", score), ("database", database)]
+
+async def _refresh_baselines_periodically():
+    while True:
+        await asyncio.sleep(BASELINE_REFRESH_SECONDS)
+        try:
+            await asyncio.to_thread(baseline_manager.reload)
+        except Exception:
+            logger.exception("baseline_refresh_failed")
 
 @app.on_event("startup")
 async def startup_event():
-    init_db()
+    # migrations and the baseline rebuild can take a while on a big table, off the loop
+    await asyncio.to_thread(init_db)
+    # the async pool's first connection runs the dialect setup under a thread lock while it
+    # awaits aiosqlite; a second session needing a connection meanwhile (warm-up racing the
+    # first request) would block the event loop on that lock for good, so it's made here
+    async with async_engine.connect():
+        pass
+    api_keys.install_signal_handler(asyncio.get_running_loop())
+    await asyncio.to_thread(baseline_manager.reload)
+    scan_writer.start()
+    if BASELINE_REFRESH_SECONDS > 0:
+        app.state.baseline_refresh = asyncio.create_task(_refresh_baselines_periodically())
+    app.state.warm_up = asyncio.create_task(warm_up.run(_warm_up_steps()))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for task_name in ("baseline_refresh", "warm_up"):
+        task = getattr(app.state, task_name, None)
+        if task is not None:
+            task.cancel()
+    scoring_executor.shutdown()
+    batch_executor.shutdown()
+    live_executor.shutdown()
+    if image_archive is not None:
+        image_archive.shutdown()
+    await scan_writer.stop()
+    await async_engine.dispose()
 
 @app.get("/")
 async def root():
@@ -80,17 +249,42 @@ async def root():
         "version": "0.1.0",
         "endpoints": {
             "analyze": "POST /analyze",
-            "health": "GET /health"
+            "analyze_batch": "POST /analyze/batch",
+            "scans": "GET /scans",
+            "export": "GET /scans/export",
+            "similar_scans": "GET /scans/similar",
+            "scan_image": "GET /scans/{scan_id}/image",
+            "live": "WS /ws/live",
+            "baselines": "GET /baselines",
+            "create_baseline": "POST /baselines",
+            "refine_baseline": "POST /baselines/{baseline_id}/samples",
+            "stats": "GET /stats",
+            "timeseries": "GET /stats/timeseries",
+            "health": "GET /health",
+            "metrics": "GET /metrics"
         }
     }
 
 
 @app.get("/ready")
 async def readiness_check():
+    if not warm_up.ready:
+        raise HTTPException(
+            status_code=503,
+            detail={"status": "warming_up", "warm_up": warm_up.stats()}
+        )
     try:
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
-        return {"status": "ready", "database": "connected"}
+        async with async_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        return {
+            "status": "ready",
+            "database": "connected",
+            "scoring": scoring_executor.stats(),
+            "live": {**live_executor.stats(), "sessions": live_sessions},
+            "cache": result_cache.stats(),
+            "writer": scan_writer.stats(),
+            "warm_up": warm_up.stats()
+        }
     except Exception as e:
         raise HTTPException(
             status_code=503,
@@ -101,20 +295,23 @@ async def readiness_check():
 async def health_check():
     return {"status": "healthy"}
 
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
-ALLOWED_CONTENT_TYPES = ["image/jpeg", "image/jpg", "image/png"]
-ALLOWED_FORMATS = {"JPEG", "PNG"}
-MIN_IMAGE_DIM = 100
-MAX_IMAGE_DIM = 4096
-ANALYZE_TIMEOUT_SECONDS = 30
+@app.get("/metrics")
+async def metrics():
+    # prometheus text format, merged across all workers in multiprocess mode
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
 
 def _build_error_response(request: Request, status_code: int, message: str, errors: Optional[list] = None) -> JSONResponse:
     request_id = getattr(request.state, "request_id", None)
     error = {
         400: "bad_request",
+        404: "not_found",
+        409: "conflict",
+        413: "payload_too_large",
+        416: "range_not_satisfiable",
         422: "validation_error",
         429: "rate_limit_exceeded",
         500: "server_error",
+        503: "service_unavailable",
         504: "timeout"
     }.get(status_code, "error")
     payload = ErrorResponse(
@@ -129,12 +326,15 @@ def _build_error_response(request: Request, status_code: int, message: str, erro
 async def http_exception_handler(request: Request, exc: HTTPException):
     logger.warning("http_exception", extra={"request_id": getattr(request.state, "request_id", None), "status_code": exc.status_code})
     message = exc.detail if isinstance(exc.detail, str) else "Request failed"
-    return _build_error_response(request, exc.status_code, message)
+    response = _build_error_response(request, exc.status_code, message)
+    if exc.headers:
+        response.headers.update(exc.headers)
+    return response
 
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     logger.warning("validation_error", extra={"request_id": getattr(request.state, "request_id", None), "errors": exc.errors()})
-    return _build_error_response(request, 422, "Validation error", errors=exc.errors())
+    return _build_error_response(request, 422, "Validation error", errors=list(exc.errors()))
 
 @app.exception_handler(Exception)
 async def unhandled_exception_handler(request: Request, exc: Exception):
@@ -144,7 +344,15 @@ async def unhandled_exception_handler(request: Request, exc: Exception):
 @app.exception_handler(RateLimitExceeded)
 async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
     request_id = getattr(request.state, "request_id", None)
-    retry_after = int(exc.retry_after) if exc.retry_after else 60
+    # RateLimitExceeded carries no retry time, the window's reset comes from the shared storage
+    retry_after = 60
+    view_rate_limit = getattr(request.state, "view_rate_limit", None)
+    if view_rate_limit is not None:
+        # slowapi stores (limit, [key, scope]), get_window_stats wants them as separate identifiers
+        limit, identifiers = view_rate_limit
+        reset_at, _ = limiter.limiter.get_window_stats(limit, *identifiers)
+        retry_after = max(1, math.ceil(reset_at - time.time()))
+    RATE_LIMIT_HITS.labels(endpoint=request.url.path).inc()
     response = _build_error_response(
         request,
         429,
@@ -161,95 +369,199 @@ async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
     )
     return response
 
+async def _read_upload(image: UploadFile) -> bytes:
+    # the multipart parser has spooled the part (to disk past 1MB), size, declared type and
+    # magic bytes are all checked before the file is read into memory
+    if image.size is not None and image.size > MAX_FILE_SIZE:
+        REJECTS.labels(reason="too_large").inc()
+        raise HTTPException(
+            status_code=413,
+            detail=f"File too large. Maximum size: {MAX_FILE_SIZE / (1024*1024)}MB"
+        )
+    if image.content_type not in ALLOWED_CONTENT_TYPES:
+        REJECTS.labels(reason="content_type").inc()
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid file type. Allowed: {ALLOWED_CONTENT_TYPES}"
+        )
+    if sniff_format(await image.read(SIGNATURE_BYTES)) is None:
+        REJECTS.labels(reason="invalid_image").inc()
+        raise HTTPException(status_code=400, detail="File content is not a JPEG or PNG image")
+
+    await image.seek(0)
+    return await image.read()
+
+def _validate_upload(contents: bytes) -> None:
+    # format and dimensions come from the header, pixels are decoded later in one pass
+    try:
+        probe_image(contents)
+    except InvalidImageError as e:
+        REJECTS.labels(reason="invalid_image").inc()
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _busy_exception(exc: ExecutorBusyError) -> HTTPException:
+    logger.warning("scoring_queue_full", extra={"retry_after": exc.retry_after})
+    REJECTS.labels(reason="busy").inc()
+    return HTTPException(
+        status_code=503,
+        detail="Server is busy, try again later",
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+async def _run_scoring(job: Awaitable[T]) -> T:
+    # job is one of the executor's score calls: decode and scoring both run off the event loop
+    try:
+        return await job
+    except ExecutorBusyError as e:
+        raise _busy_exception(e)
+    except asyncio.TimeoutError:
+        REJECTS.labels(reason="timeout").inc()
+        raise HTTPException(status_code=504, detail="Image processing timed out")
+    except InvalidImageError as e:
+        REJECTS.labels(reason="invalid_image").inc()
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _gather_bounded(images: List[UploadFile], score_one) -> list:
+    # like gather(return_exceptions=True), but an image is only read once one of
+    # BATCH_CONCURRENCY slots is free, so a 50 x 10MB batch doesn't sit in memory at once
+    slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def bounded(image: UploadFile):
+        async with slots:
+            return await score_one(image)
+
+    return await asyncio.gather(*(bounded(image) for image in images), return_exceptions=True)
+
+async def _digest(contents: bytes) -> str:
+    # sha256 of a 10MB upload takes ~10ms, too long for the event loop
+    return await asyncio.to_thread(content_digest, contents)
+
+async def _cache_get(key: str) -> Optional[CachedResult]:
+    if result_cache.blocking:
+        return await asyncio.to_thread(result_cache.get, key)
+    return result_cache.get(key)
+
+async def _cache_set(key: str, value: CachedResult) -> None:
+    if result_cache.blocking:
+        await asyncio.to_thread(result_cache.set, key, value)
+    else:
+        result_cache.set(key, value)
+
+async def _score_upload(executor: ScoringExecutor, contents: bytes, digest: str) -> Tuple[float, AnalysisMetrics, bool]:
+    # byte-identical uploads skip decode and scoring entirely
+    key = result_key(digest, scorer.config)
+    cached = await _cache_get(key)
+    if cached is not None:
+        score, metrics = cached
+        return score, metrics, True
+
+    score, metrics = await _run_scoring(executor.score(contents, ANALYZE_TIMEOUT_SECONDS))
+    await _cache_set(key, (score, metrics))
+    return score, metrics, False
+
+def _build_analysis_response(
+    score: float,
+    metrics: AnalysisMetrics,
+    baseline_id: str,
+    sample_name: Optional[str],
+    location: Optional[str],
+    notes: Optional[str],
+    cached: bool = False
+) -> AnalysisResponse:
+    baseline = baseline_manager.get_baseline(baseline_id)
+    delta = score - baseline.expected_score
+
+    return AnalysisResponse(
+        score=round(score,2),
+        baseline_id=baseline_id,
+        baseline_score=baseline.expected_score,
+        delta=round(delta,2),
+        label=_get_contamination_label(score),
+        score_version=scorer.profile.version,
+        metrics=metrics,
+        sample_name=sample_name,
+        location=location,
+        notes=notes,
+        cached=cached
+    )
+
+async def _archive_image(contents: bytes, digest: str) -> Optional[str]:
+    # digest from _digest, the write runs on the archive thread and the scan is only
+    # linked once the file is on disk
+    if image_archive is None:
+        return None
+    return await asyncio.wrap_future(image_archive.store(contents, digest))
+
+def _scan_from_response(response: AnalysisResponse) -> Scan:
+    SCANS.labels(label=response.label).inc()
+    # generated here instead of by the insert: without WRITE_BEHIND_WAIT the response goes
+    # out before there is a scan_id, the uid is how the client finds the scan afterwards
+    response.scan_uid = uuid.uuid4().hex
+    return _scan_row(response)
+
+def _scan_row(response: AnalysisResponse) -> Scan:
+    return Scan(
+        uid=response.scan_uid,
+        score=response.score,
+        baseline_id=response.baseline_id,
+        baseline_score=response.baseline_score,
+        delta=response.delta,
+        label=response.label,
+        score_version=response.score_version,
+        scoring_mode=response.mode,
+        spot_coverage=response.metrics.spot_coverage,
+        edge_density=response.metrics.edge_density,
+        texture_variance=response.metrics.texture_variance,
+        mean_intensity=response.metrics.mean_intensity,
+        phash=response.metrics.phash,
+        image_hash=response.image_hash,
+        sample_name=response.sample_name,
+        location=response.location,
+        notes=response.notes
+    )
+
+STAGE_SECONDS = {stage: ANALYZE_STAGE_SECONDS.labels(stage=stage) for stage in ("read", "validate", "score", "persist", "total")}
+IN_FLIGHT_ANALYZE = IN_FLIGHT.labels(endpoint="analyze")
+
 @app.post("/analyze", response_model=AnalysisResponse)
-@limiter.limit("60/minute")
+@limiter.limit(rate_limit_tiers.provider("analyze"))
 async def analyze_image(
     request: Request,
     image: UploadFile = File(...),
     baseline_id: str = Form(default="clean_surface"),
     sample_name: Optional[str] = Form(default=None),
     location: Optional[str] = Form(default=None),
-    notes: Optional[str] = Form(default=None)
+    notes: Optional[str] = Form(default=None),
+    mode: str = Form(default="standard", pattern="^(standard|tiled)$")
 ):
     try:
-
-        contents = await image.read()
-        
-        if len(contents) > MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=400,
-                detail=f"File too large. Maximum size: {MAX_FILE_SIZE / (1024*1024)}MB"
-            )
-        if image.content_type not in ALLOWED_CONTENT_TYPES:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Invalid file type. Allowed: {ALLOWED_CONTENT_TYPES}"
-            )
-
-        # validate image  
-        try:
-            with Image.open(io.BytesIO(contents)) as img:
-                img.verify()
-                if img.format not in ALLOWED_FORMATS:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Invalid image format. Allowed: {sorted(ALLOWED_FORMATS)}"
-                    )
-            pil_image = Image.open(io.BytesIO(contents))
-        except UnidentifiedImageError:
-            raise HTTPException(status_code=400, detail="Invalid or corrupted image")
-
-        if pil_image.mode != "RGB":
-            pil_image = pil_image.convert("RGB")
-
-        width, height = pil_image.size
-        if width < MIN_IMAGE_DIM or height < MIN_IMAGE_DIM or width > MAX_IMAGE_DIM or height > MAX_IMAGE_DIM:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Image dimensions must be between {MIN_IMAGE_DIM}x{MIN_IMAGE_DIM} and {MAX_IMAGE_DIM}x{MAX_IMAGE_DIM}"
-            )
-
-        try:
-            score, metrics = await asyncio.wait_for(
-                asyncio.to_thread(scorer.analyze, pil_image),
-                timeout=ANALYZE_TIMEOUT_SECONDS
-            )
-        except asyncio.TimeoutError:
-            raise HTTPException(status_code=504, detail="Image processing timed out")
-
-        baseline = baseline_manager.get_baseline(baseline_id)
-        delta = score - baseline.expected_score
-        
-        label = _get_contamination_label(score)
-
-        with get_db() as db:
-            scan = Scan(
-                score=round(score,2),
-                baseline_id = baseline_id,
-                baseline_score=baseline.expected_score,
-                delta=round(delta,2),
-                label=label,
-                spot_coverage=metrics.spot_coverage,
-                edge_density=metrics.edge_density,
-                texture_variance=metrics.texture_variance,
-                mean_intensity=metrics.mean_intensity,
-                sample_name=sample_name,
-                location=location,
-                notes=notes
-            )
-            db.add(scan)
-
-        return AnalysisResponse(
-            score=round(score,2),
-            baseline_id=baseline_id,
-            baseline_score=baseline.expected_score,
-            delta=round(delta,2),
-            label=label,
-            metrics=metrics,
-            sample_name=sample_name,
-            location=location,
-            notes=notes
-        )
+        with IN_FLIGHT_ANALYZE.track_inprogress(), STAGE_SECONDS["total"].time():
+            with STAGE_SECONDS["read"].time():
+                contents = await _read_upload(image)
+            with STAGE_SECONDS["validate"].time():
+                _validate_upload(contents)
+            digest = await _digest(contents)
+            # queue wait and run time are split out by the executor metrics
+            with STAGE_SECONDS["score"].time():
+                if mode == "tiled":
+                    # full resolution + heatmap, not cached since the cache only holds score and metrics
+                    score, metrics, heatmap = await _run_scoring(scoring_executor.score_tiled(contents, ANALYZE_TIMEOUT_SECONDS))
+                    cached = False
+                else:
+                    score, metrics, cached = await _score_upload(scoring_executor, contents, digest)
+                    heatmap = None
+
+            response = _build_analysis_response(score, metrics, baseline_id, sample_name, location, notes, cached)
+            response.mode = mode
+            response.heatmap = heatmap
+            # only uploads that scored are archived, shed, timed-out and undecodable ones never reach the disk
+            response.image_hash = await _archive_image(contents, digest)
+
+            # None when write-behind runs without waiting for the commit, scan_uid is always set
+            with STAGE_SECONDS["persist"].time():
+                response.scan_id = await scan_writer.write(_scan_from_response(response))
+
+            return response
     except HTTPException: 
         raise 
     except Exception as e:
@@ -269,13 +581,377 @@ async def analyze_image(
             detail=f"Analysis failed: {error_type}: {error_msg}"
         )
 
+@app.post("/analyze/batch", response_model=BatchAnalysisResponse)
+@limiter.limit(rate_limit_tiers.provider("batch"))
+async def analyze_batch(
+    request: Request,
+    images: List[UploadFile] = File(...),
+    baseline_id: str = Form(default="clean_surface"),
+    sample_name: Optional[str] = Form(default=None),
+    location: Optional[str] = Form(default=None),
+    notes: Optional[str] = Form(default=None)
+):
+    if len(images) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many images. Maximum per batch: {MAX_BATCH_SIZE}"
+        )
+
+    async def score_one(image: UploadFile) -> Tuple[float, AnalysisMetrics, bool, Optional[str]]:
+        contents = await _read_upload(image)
+        _validate_upload(contents)
+        digest = await _digest(contents)
+        score, metrics, cached = await _score_upload(batch_executor, contents, digest)
+        return score, metrics, cached, await _archive_image(contents, digest)
+
+    # one failing image must not take the rest of the batch down
+    outcomes = await _gather_bounded(images, score_one)
+
+    results: List[BatchItemResult] = []
+    saved: List[Tuple[AnalysisResponse, Scan]] = []
+    for index, (image, outcome) in enumerate(zip(images, outcomes)):
+        if isinstance(outcome, HTTPException):
+            results.append(BatchItemResult(index=index, filename=image.filename, status_code=outcome.status_code, error=str(outcome.detail)))
+            continue
+        if isinstance(outcome, BaseException):
+            logger.error(
+                "batch_item_failed",
+                exc_info=outcome,
+                extra={
+                    "request_id": getattr(request.state, "request_id", None),
+                    "index": index,
+                    "error_type": type(outcome).__name__,
+                }
+            )
+            results.append(BatchItemResult(index=index, filename=image.filename, status_code=500, error=f"Analysis failed: {type(outcome).__name__}: {outcome}"))
+            continue
+
+        score, metrics, cached, image_hash = outcome
+        response = _build_analysis_response(score, metrics, baseline_id, sample_name or image.filename, location, notes, cached)
+        response.image_hash = image_hash
+        saved.append((response, _scan_from_response(response)))
+        results.append(BatchItemResult(index=index, filename=image.filename, status_code=200, result=response))
+
+    # every scan of the batch goes in with a single commit
+    if saved:
+        async with get_async_db() as db:
+            db.add_all([scan for _, scan in saved])
+            await db.flush()
+            for response, scan in saved:
+                response.scan_id = scan.id
+
+    return BatchAnalysisResponse(
+        total=len(results),
+        succeeded=len(saved),
+        failed=len(results) - len(saved),
+        results=results
+    )
+
+@app.get("/scans")
+async def get_scans(
+    start: Optional[datetime] = Query(default=None),
+    end: Optional[datetime] = Query(default=None),
+    location: Optional[str] = Query(default=None),
+    baseline_id: Optional[str] = Query(default=None),
+    label: Optional[str] = Query(default=None, pattern="^(low|moderate|high)$"),
+    min_score: Optional[float] = Query(default=None, ge=0, le=100),
+    max_score: Optional[float] = Query(default=None, ge=0, le=100),
+    uid: Optional[str] = Query(default=None, max_length=32),
+    order: str = Query(default="desc", pattern="^(asc|desc)$"),
+    limit: int = Query(default=50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(default=None)
+):
+    filters = scan_filters(start, end, location, baseline_id, label, min_score, max_score, uid)
+    async with get_async_db() as db:
+        try:
+            return await list_scans(db, filters, limit, cursor, descending=order == "desc")
+        except InvalidCursorError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+@app.get("/scans/export")
+async def export_scan_history(
+    format: str = Query(default="ndjson", pattern="^(ndjson|csv)$"),
+    compress: Optional[str] = Query(default=None, pattern="^gzip$"),
+    start: Optional[datetime] = Query(default=None),
+    end: Optional[datetime] = Query(default=None),
+    location: Optional[str] = Query(default=None),
+    baseline_id: Optional[str] = Query(default=None),
+    label: Optional[str] = Query(default=None, pattern="^(low|moderate|high)$"),
+    min_score: Optional[float] = Query(default=None, ge=0, le=100),
+    max_score: Optional[float] = Query(default=None, ge=0, le=100),
+    uid: Optional[str] = Query(default=None, max_length=32)
+):
+    filters = scan_filters(start, end, location, baseline_id, label, min_score, max_score, uid)
+    filename = f"scans.{format}" + (".gz" if compress else "")
+    return StreamingResponse(
+        export_scans(filters, format, compress),
+        media_type="application/gzip" if compress else EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+def _load_hashes_since(last_id: int) -> Iterator[Tuple[int, str]]:
+    # primary key range scan, streamed so the first full load stays small
+    with get_db() as db:
+        for scan_id, phash in db.query(Scan.id, Scan.phash).filter(
+            Scan.id > last_id,
+            Scan.phash.isnot(None)
+        ).order_by(Scan.id).yield_per(10000):
+            yield scan_id, phash or ""
+
+@app.get("/scans/similar")
+async def find_similar_scans(
+    scan_id: int = Query(...),
+    max_distance: int = Query(default=10, ge=0, le=24),
+    limit: int = Query(default=20, ge=1, le=200)
+):
+    async with get_async_db() as db:
+        target = await db.get(Scan, scan_id)
+        if target is None:
+            raise HTTPException(status_code=404, detail=f"Scan {scan_id} not found")
+        if not target.phash:
+            raise HTTPException(status_code=400, detail=f"Scan {scan_id} has no perceptual hash")
+        target_hash = target.phash
+
+    # built lazily on first lookup, then catches up with rows written by any worker
+    await asyncio.to_thread(similarity_index.refresh, _load_hashes_since)
+    matches = [(match_id, distance) for match_id, distance in similarity_index.search(parse_hash(target_hash), max_distance) if match_id != scan_id][:limit]
+
+    async with get_async_db() as db:
+        result = await db.execute(select(Scan).where(Scan.id.in_([match_id for match_id, _ in matches])))
+        rows = {scan.id: scan.to_dict() for scan in result.scalars()}
+        similar = [{**rows[match_id], "distance": distance} for match_id, distance in matches if match_id in rows]
+
+    return {"scan_id": scan_id, "phash": target_hash, "max_distance": max_distance, "similar": similar}
+
+@app.get("/scans/{scan_id}/image")
+async def get_scan_image(request: Request, scan_id: int, thumbnail: bool = Query(default=False)):
+    if image_archive is None:
+        raise HTTPException(status_code=404, detail="Image archive is not enabled")
+    async with get_async_db() as db:
+        row = (await db.execute(select(Scan.image_hash).where(Scan.id == scan_id))).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"Scan {scan_id} not found")
+    data = image_archive.read(row.image_hash, thumbnail) if row.image_hash else None
+    if data is None:
+        raise HTTPException(status_code=404, detail=f"Scan {scan_id} has no archived image")
+
+    # content-addressed: the hash is a strong validator and the bytes never change
+    etag = f'"{row.image_hash}{".thumb" if thumbnail else ""}"'
+    headers = {"ETag": etag, "Accept-Ranges": "bytes", "Cache-Control": "private, max-age=31536000, immutable"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range.strip() != etag:
+        range_header = None
+    try:
+        requested = byte_range(range_header, len(data))
+    except RangeNotSatisfiable as e:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable", headers={"Content-Range": str(e)})
+    if requested is None:
+        return MappedResponse(data, headers=headers, media_type=media_type(data))
+    first, last = requested
+    headers["Content-Range"] = f"bytes {first}-{last}/{len(data)}"
+    return MappedResponse(data[first:last + 1], status_code=206, headers=headers, media_type=media_type(data))
+
 def _get_contamination_label(score:float) ->str:
-    if score < 33:
-        return "low"
-    elif score < 67:
-        return "moderate"
-    else:
-        return "high"
+    return scorer.profile.label(score)
+
+async def _receive_frames(websocket: WebSocket, session: LiveSession, options: dict) -> None:
+    # text messages are json control messages, binary messages are frames
+    capture = None
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("text") is not None:
+                try:
+                    control = json.loads(message["text"])
+                except ValueError:
+                    control = None
+                if not isinstance(control, dict):
+                    await websocket.send_json({"type": "error", "status_code": 400, "message": "control messages must be json objects"})
+                    continue
+                if control.get("type") == "config":
+                    options.update({key: control[key] for key in ("baseline_id", "location") if key in control})
+                elif control.get("type") == "capture":
+                    # applies to the next binary frame
+                    capture = {key: control.get(key) for key in ("sample_name", "notes")}
+            elif message.get("bytes") is not None:
+                try:
+                    session.push(message["bytes"], capture)
+                except CapturesFullError as e:
+                    # the client sends the capture again later, nothing was stored
+                    await websocket.send_json({"type": "error", "frame": session.received - 1, "status_code": 429, "message": str(e)})
+                capture = None
+    finally:
+        session.close()
+
+async def _score_live_frame(websocket: WebSocket, session: LiveSession, frame, options: dict) -> None:
+    try:
+        if len(frame.contents) > MAX_FILE_SIZE:
+            raise HTTPException(status_code=400, detail=f"File too large. Maximum size: {MAX_FILE_SIZE / (1024*1024)}MB")
+
+        if frame.capture is None:
+            # previews are never cached or stored
+            score, _ = await _run_scoring(live_executor.score(frame.contents, ANALYZE_TIMEOUT_SECONDS))
+            smoothed = session.smoother.update(score)
+            await websocket.send_json({
+                "type": "score",
+                "frame": frame.index,
+                "score": round(score, 2),
+                "smoothed": round(smoothed, 2),
+                "label": _get_contamination_label(smoothed),
+                "dropped": session.dropped,
+            })
+            return
+
+        digest = await _digest(frame.contents)
+        score, metrics, cached = await _score_upload(live_executor, frame.contents, digest)
+        session.smoother.update(score)
+        response = _build_analysis_response(
+            score, metrics, options["baseline_id"], frame.capture.get("sample_name"), options.get("location"), frame.capture.get("notes"), cached
+        )
+        response.image_hash = await _archive_image(frame.contents, digest)
+        response.scan_id = await scan_writer.write(_scan_from_response(response))
+        await websocket.send_json({"type": "captured", "frame": frame.index, "result": jsonable_encoder(response)})
+    except HTTPException as e:
+        await websocket.send_json({"type": "error", "frame": frame.index, "status_code": e.status_code, "message": str(e.detail)})
+    except Exception:
+        # a frame that fails unexpectedly is reported, the session keeps going
+        logger.exception("live_frame_failed", extra={"frame": frame.index, "captured": frame.capture is not None})
+        await websocket.send_json({"type": "error", "frame": frame.index, "status_code": 500, "message": "Internal server error"})
+
+@app.websocket("/ws/live")
+async def live_scoring(websocket: WebSocket):
+    global live_sessions
+    # api key (header or ?api_key=) is checked by APIKeyMiddleware before we get here
+    if live_sessions >= LIVE_MAX_SESSIONS:
+        await websocket.close(code=1013) # try again later
+        return
+
+    live_sessions += 1
+    try:
+        await websocket.accept()
+        session = LiveSession(
+            max_fps=LIVE_MAX_FPS, cpu_budget=LIVE_CPU_BUDGET, smoothing=LIVE_SMOOTHING, max_captures=LIVE_MAX_CAPTURES
+        )
+        options = {"baseline_id": websocket.query_params.get("baseline_id", "clean_surface"), "location": websocket.query_params.get("location")}
+        receiver = asyncio.create_task(_receive_frames(websocket, session, options))
+        try:
+            async for frame in session.frames():
+                await _score_live_frame(websocket, session, frame, options)
+        finally:
+            receiver.cancel()
+            logger.info("live_session_closed", extra=session.stats())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        live_sessions -= 1
+
+async def _score_reference_images(images: List[UploadFile]) -> List[Tuple[float, AnalysisMetrics]]:
+    if not images or len(images) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Provide between 1 and {MAX_BATCH_SIZE} reference images"
+        )
+
+    async def score_one(image: UploadFile) -> Tuple[float, AnalysisMetrics]:
+        contents = await _read_upload(image)
+        _validate_upload(contents)
+        score, metrics, _ = await _score_upload(batch_executor, contents, await _digest(contents))
+        return score, metrics
+
+    # scored in parallel within the batch read bound, one bad image rejects the whole set
+    outcomes = await _gather_bounded(images, score_one)
+    samples = []
+    for image, outcome in zip(images, outcomes):
+        if isinstance(outcome, HTTPException):
+            raise HTTPException(status_code=outcome.status_code, detail=f"{image.filename}: {outcome.detail}", headers=outcome.headers)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        samples.append(outcome)
+    return samples
+
+def _sample_sums(samples: List[Tuple[float, AnalysisMetrics]]) -> dict:
+    return {
+        "exptected_score": sum(score for score, _ in samples),
+        "spot_coverage": sum(metrics.spot_coverage for _, metrics in samples),
+        "edge_density": sum(metrics.edge_density for _, metrics in samples),
+        "texture_variance": sum(metrics.texture_variance for _, metrics in samples),
+        "mean_intensity": sum(metrics.mean_intensity for _, metrics in samples),
+    }
+
+@app.post("/baselines", response_model=Baseline, status_code=201)
+@limiter.limit(rate_limit_tiers.provider("baselines"))
+async def create_baseline(
+    request: Request,
+    images: List[UploadFile] = File(...),
+    baseline_id: str = Form(..., pattern="^[a-z0-9_-]{1,50}$"),
+    name: str = Form(..., max_length=200),
+    description: Optional[str] = Form(default=None)
+):
+    if baseline_manager.is_builtin(baseline_id) or baseline_manager.get_custom(baseline_id) is not None:
+        raise HTTPException(status_code=409, detail=f"Baseline {baseline_id} already exists")
+
+    samples = await _score_reference_images(images)
+    means = {column: round(total / len(samples), 4) for column, total in _sample_sums(samples).items()}
+
+    try:
+        async with get_async_db() as db:
+            db.add(CustomBaseline(baseline_id=baseline_id, name=name, description=description, sample_count=len(samples), **means))
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail=f"Baseline {baseline_id} already exists")
+
+    # invalidate on write: the registry is rebuilt before the response goes out
+    await asyncio.to_thread(baseline_manager.reload)
+    return baseline_manager.get_custom(baseline_id)
+
+@app.post("/baselines/{baseline_id}/samples", response_model=Baseline)
+@limiter.limit(rate_limit_tiers.provider("baselines"))
+async def refine_baseline(
+    request: Request,
+    baseline_id: str,
+    images: List[UploadFile] = File(...)
+):
+    if baseline_manager.is_builtin(baseline_id):
+        raise HTTPException(status_code=400, detail="Built-in baselines can't be refined")
+    # checked in the db rather than the registry, which may not have another worker's baseline yet
+    async with get_async_db() as db:
+        exists = await db.scalar(
+            select(CustomBaseline.id).where(CustomBaseline.baseline_id == baseline_id)
+        )
+    if exists is None:
+        raise HTTPException(status_code=404, detail=f"Baseline {baseline_id} not found")
+
+    samples = await _score_reference_images(images)
+    sums = _sample_sums(samples)
+
+    # running mean done in sql, (mean * n + sum) / (n + k), so concurrent refinements
+    # from other workers can't overwrite each other and old samples are never rescored
+    count = func.coalesce(CustomBaseline.sample_count, 1)
+    async with get_async_db() as db:
+        result = await db.execute(
+            update(CustomBaseline)
+            .where(CustomBaseline.baseline_id == baseline_id)
+            .values(
+                sample_count=count + len(samples),
+                **{
+                    column: (getattr(CustomBaseline, column) * count + total) / (count + len(samples))
+                    for column, total in sums.items()
+                }
+            )
+        )
+    if result.rowcount == 0:
+        raise HTTPException(status_code=404, detail=f"Baseline {baseline_id} not found")
+
+    await asyncio.to_thread(baseline_manager.reload)
+    return baseline_manager.get_custom(baseline_id)
 
 @app.get("/baselines")
 async def list_baselines():
@@ -285,41 +961,22 @@ async def list_baselines():
 
 @app.get("/stats")
 async def get_stats():
-    with get_db() as db:
-        total_scans = db.query(func.count(Scan.id)).scalar() or 0
-        if total_scans==0:
-            return {
-                "total_scans": 0,
-                "average_score": 0.0,
-                "min_score": 0.0,
-                "max_score": 0.0,
-                "by_label": {
-                    "low": 0,
-                    "moderate": 0,
-                    "high": 0
-                }
-            }
-        stats = db.query(
-            func.avg(Scan.score).label('avg_score'),
-            func.min(Scan.score).label('min_score'),
-            func.max(Scan.score).label('max_score')
-        ).first()
-
-        label_counts=db.query(
-            Scan.label,
-            func.count(Scan.id).label('count')
-        ).group_by(Scan.label).all()
-
-        by_label={"low":0, "moderate":0, "high":0}
-        for label, count in label_counts:
-            by_label[label] = count
-        return {
-            "total_scans": total_scans,
-            "average_score": round(stats.avg_score or 0.0,2),
-            "min_score": round(stats.min_score or 0.0,2),
-            "max_score": round(stats.max_score or 0.0,2),
-            "by_label": by_label
-        } 
+    # O(1): reads the trigger-maintained aggregates instead of scanning scans
+    async with get_async_db() as db:
+        return await read_scan_stats(db)
+
+@app.get("/stats/timeseries")
+async def get_stats_timeseries(
+    bucket: str = Query(default="day", pattern="^(hour|day|week)$"),
+    start: Optional[datetime] = Query(default=None),
+    end: Optional[datetime] = Query(default=None),
+    location: Optional[str] = Query(default=None),
+    baseline_id: Optional[str] = Query(default=None),
+    group_by: Optional[str] = Query(default=None, pattern="^(location|baseline_id)$")
+):
+    # served from the hourly/daily rollup tables, never from raw scans
+    async with get_async_db() as db:
+        return await query_timeseries(db, bucket, start, end, location, baseline_id, group_by)
 
 if __name__=="__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
@@ -1,41 +1,148 @@
-from fastapi import HTTPException, Request
-from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+import hmac
+import logging
 import os
+import signal
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+from starlette.datastructures import Headers, QueryParams
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
 
-class APIKeyMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        # Skip auth for public endpoints and FastAPI docs
-        public_paths = [
-            '/', 
-            '/health', 
-            '/ready',
-            '/baselines',  # Public: just lists available baselines (metadata)
-            '/docs',
-            '/openapi.json',
-            '/redoc',
-            '/favicon.ico'
-        ]
-        
-        if request.url.path in public_paths:
-            return await call_next(request)
-        
-        # Get API key from header
-        api_key = request.headers.get("X-API-Key")
-        valid_keys_str = os.getenv("API_KEYS", "")
-        
-        # Handle empty API_KEYS (development mode)
-        if not valid_keys_str:
-            # Allow requests if no API keys configured (development)
-            return await call_next(request)
-        
-        valid_keys = [key.strip() for key in valid_keys_str.split(",") if key.strip()]
-
-        if not api_key or api_key not in valid_keys:
-            return JSONResponse(
-                status_code=401,
-                content={"error": "Invalid or missing API key", "detail": "Invalid or missing API key"}
-            )
-        
-        return await call_next(request)
-    
\ No newline at end of file
+"""
+api key auth as plain asgi middleware
+keys come from API_KEYS (comma separated) and/or API_KEYS_FILE (one per line, #
+comments) and are parsed once into an APIKeyStore. the store reloads on SIGHUP
+and, when a file is configured, whenever its mtime changes (checked at most every
+API_KEYS_RELOAD_SECONDS). every configured key is compared with hmac.compare_digest,
+so response timing doesn't depend on which key, or how much of one, matched.
+the check runs on the request headers alone: a rejected upload is never read.
+no keys configured = development mode, everything is allowed
+"""
+
+logger = logging.getLogger(__name__)
+
+# Skip auth for public endpoints and FastAPI docs (GET/HEAD only)
+PUBLIC_PATHS = frozenset([
+    '/',
+    '/health',
+    '/ready',
+    '/metrics',  # Public: prometheus scrapes without a key
+    '/baselines',  # Public: just lists available baselines (metadata)
+    '/docs',
+    '/openapi.json',
+    '/redoc',
+    '/favicon.ico',
+])
+PUBLIC_METHODS = frozenset(["GET", "HEAD"])
+
+def _parse_keys(values: Iterable[str]) -> Tuple[bytes, ...]:
+    keys = []
+    for value in values:
+        value = value.split("#", 1)[0].strip()
+        if value:
+            keys.append(value.encode())
+    return tuple(dict.fromkeys(keys))
+
+class APIKeyStore:
+    def __init__(self, env_keys: str = "", path: Optional[str] = None, reload_seconds: float = 5.0):
+        self.env_keys = env_keys
+        self.path = Path(path) if path else None
+        self.reload_seconds = reload_seconds
+        self.keys: Tuple[bytes, ...] = ()
+        self._mtime: Optional[float] = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    @classmethod
+    def from_env(cls) -> "APIKeyStore":
+        return cls(
+            os.getenv("API_KEYS", ""),
+            os.getenv("API_KEYS_FILE") or None,
+            float(os.getenv("API_KEYS_RELOAD_SECONDS", "5")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.keys)
+
+    def reload(self) -> int:
+        values = self.env_keys.split(",")
+        mtime = None
+        if self.path is not None:
+            try:
+                mtime = self.path.stat().st_mtime
+                values += self.path.read_text().splitlines()
+            except OSError:
+                logger.warning("api_keys_file_unreadable", extra={"path": str(self.path)})
+                return len(self.keys) # keep serving the last good set
+        keys = _parse_keys(values)
+        with self._lock:
+            self.keys, self._mtime = keys, mtime
+            self._next_check = time.monotonic() + self.reload_seconds
+        return len(keys)
+
+    def _maybe_reload(self) -> None:
+        # at most one stat() per reload_seconds
+        now = time.monotonic()
+        if self.path is None or now < self._next_check:
+            return
+        self._next_check = now + self.reload_seconds
+        try:
+            changed = self.path.stat().st_mtime != self._mtime
+        except OSError:
+            return
+        if changed:
+            logger.info("api_keys_reloaded", extra={"keys": self.reload()})
+
+    def is_valid(self, api_key: Optional[str]) -> bool:
+        self._maybe_reload()
+        keys = self.keys
+        if not keys:
+            return True
+        if not api_key:
+            return False
+        candidate = api_key.encode()
+        # no early exit, every key is compared
+        matched = False
+        for key in keys:
+            matched |= hmac.compare_digest(key, candidate)
+        return matched
+
+    def install_signal_handler(self, loop) -> None:
+        # SIGHUP reloads the keys in this worker (gunicorn's master restarts workers on HUP anyway)
+        try:
+            loop.add_signal_handler(signal.SIGHUP, self.reload)
+        except (NotImplementedError, RuntimeError, ValueError, AttributeError):
+            pass
+
+api_keys = APIKeyStore.from_env()
+
+def is_valid_api_key(api_key: Optional[str]) -> bool:
+    return api_keys.is_valid(api_key)
+
+class APIKeyMiddleware:
+    def __init__(self, app: ASGIApp, store: Optional[APIKeyStore] = None):
+        self.app = app
+        self.store = store or api_keys
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            if scope["path"] in PUBLIC_PATHS and scope["method"] in PUBLIC_METHODS:
+                return await self.app(scope, receive, send)
+            # headers only, the body is still unread if we reject here
+            if not self.store.is_valid(Headers(scope=scope).get("x-api-key")):
+                response = JSONResponse(
+                    status_code=401,
+                    content={"error": "Invalid or missing API key", "detail": "Invalid or missing API key"}
+                )
+                return await response(scope, receive, send)
+        elif scope["type"] == "websocket":
+            # browsers can't set headers on a websocket, so ?api_key= works too
+            api_key = Headers(scope=scope).get("x-api-key") or QueryParams(scope["query_string"]).get("api_key")
+            if not self.store.is_valid(api_key):
+                return await send({"type": "websocket.close", "code": 1008})
+
+        await self.app(scope, receive, send)
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional
+from limits.storage import Storage
+
+"""
+rate limiting shared by every gunicorn worker on the host
+slowapi's default storage is a per-process dict, so with 4 workers a client gets
+roughly 4x its limit. SQLiteStorage is a `limits` storage backend registered under
+sqlite://, every worker opens the same WAL-mode file and each hit is a single
+atomic upsert ... returning, so counting stays exact across processes with no
+extra service. synchronous=OFF because losing the last few counts on a power cut
+is fine for a rate limiter; a check costs tens of microseconds.
+
+quotas are per tier: API_KEY_TIERS maps api keys to tiers, RATE_LIMIT_TIERS gives
+each tier a limit per scope (analyze, batch, baselines). ip-keyed clients and keys
+without a tier get the default tier. api keys are only ever stored as their sha256
+(api_key:<hex>), so the counter file never holds a usable key
+"""
+
+DEFAULT_TIERS = {
+    "default": {"analyze": "60/minute", "batch": "10/minute", "baselines": "10/minute"},
+}
+PURGE_EVERY = 1000 # hits per connection between sweeps of expired windows
+
+def api_key_digest(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+class SQLiteStorage(Storage):
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, **options):
+        # sqlite:///relative/path or sqlite:////absolute/path, like sqlalchemy
+        path = uri.split("://", 1)[1]
+        self.path = Path(path[1:] if path.startswith("/") else path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, count INTEGER NOT NULL, expires_at REAL NOT NULL)"
+        )
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connect(self) -> sqlite3.Connection:
+        # one autocommit connection per thread, per process
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+            self._local.hits = 0
+        return conn
+
+    def incr(self, key: str, expiry: float, amount: int = 1) -> int:
+        conn = self._connect()
+        now = time.time()
+        # a window that has run out starts over at `amount`
+        count = conn.execute(
+            """
+            INSERT INTO rate_limits (key, count, expires_at) VALUES (:key, :amount, :now + :expiry)
+            ON CONFLICT(key) DO UPDATE SET
+                count = CASE WHEN expires_at <= :now THEN :amount ELSE count + :amount END,
+                expires_at = CASE WHEN expires_at <= :now THEN :now + :expiry ELSE expires_at END
+            RETURNING count
+            """,
+            {"key": key, "amount": amount, "now": now, "expiry": expiry},
+        ).fetchone()[0]
+
+        self._local.hits += 1
+        if self._local.hits % PURGE_EVERY == 0:
+            conn.execute("DELETE FROM rate_limits WHERE expires_at <= ?", (now,))
+        return count
+
+    def get(self, key: str) -> int:
+        row = self._connect().execute(
+            "SELECT count FROM rate_limits WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key: str) -> float:
+        row = self._connect().execute(
+            "SELECT expires_at FROM rate_limits WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else time.time()
+
+    def check(self) -> bool:
+        try:
+            self._connect().execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> Optional[int]:
+        return self._connect().execute("DELETE FROM rate_limits").rowcount
+
+    def clear(self, key: str) -> None:
+        self._connect().execute("DELETE FROM rate_limits WHERE key = ?", (key,))
+
+class RateLimitTiers:
+    def __init__(self, tiers: Optional[Dict[str, Dict[str, str]]] = None, key_tiers: Optional[Dict[str, str]] = None):
+        self.tiers = {**DEFAULT_TIERS, **(tiers or {})}
+        # looked up by digest, the rate limit key never carries the raw api key
+        self.key_tiers = {api_key_digest(api_key): tier for api_key, tier in (key_tiers or {}).items()}
+
+    @classmethod
+    def from_env(cls) -> "RateLimitTiers":
+        # RATE_LIMIT_TIERS='{"partner": {"analyze": "600/minute"}}', API_KEY_TIERS="key1:partner,key2:partner"
+        tiers = json.loads(os.getenv("RATE_LIMIT_TIERS", "{}"))
+        key_tiers = {}
+        for entry in os.getenv("API_KEY_TIERS", "").split(","):
+            if ":" in entry:
+                api_key, tier = entry.rsplit(":", 1)
+                key_tiers[api_key.strip()] = tier.strip()
+        return cls(tiers, key_tiers)
+
+    def tier_for(self, key: str) -> str:
+        # key comes from get_rate_limit_key: "api_key:<sha256 of key>" or "ip:<address>"
+        if key.startswith("api_key:"):
+            return self.key_tiers.get(key[len("api_key:"):], "default")
+        return "default"
+
+    def limit_for(self, key: str, scope: str) -> str:
+        tier = self.tiers.get(self.tier_for(key), {})
+        return tier.get(scope) or self.tiers["default"][scope]
+
+    def provider(self, scope: str) -> Callable[[str], str]:
+        # slowapi passes the rate limit key to providers that take a `key` argument
+        def limit(key: str) -> str:
+            return self.limit_for(key, scope)
+        return limit
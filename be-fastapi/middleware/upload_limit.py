@@ -0,0 +1,62 @@
+from typing import Dict, Optional
+from starlette.datastructures import Headers
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from monitoring.metrics import REJECTS
+
+"""
+request body limits, enforced before and while the body is read
+a declared Content-Length over the path's limit is answered with 413 from the
+headers alone. otherwise receive() is wrapped to count body bytes and raises a
+413 as soon as the running total passes the limit, so a chunked (or lying)
+client never gets more than the limit into the multipart parser, which spools
+file parts to disk past 1MB anyway. per-file size and type checks happen in the
+endpoints, before the part is read into memory
+"""
+
+BODY_METHODS = frozenset(["POST", "PUT", "PATCH"])
+
+def _too_large(limit: int) -> str:
+    return f"Request body too large. Maximum size: {limit} bytes"
+
+class UploadLimitMiddleware:
+    def __init__(self, app: ASGIApp, default_limit: int, limits: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.default_limit = default_limit
+        self.limits = limits or {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] not in BODY_METHODS:
+            return await self.app(scope, receive, send)
+
+        limit = self.limits.get(scope["path"], self.default_limit)
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            REJECTS.labels(reason="too_large").inc()
+            # same shape as the app's ErrorResponse, the exception handlers are further in
+            response = JSONResponse(
+                status_code=413,
+                content={
+                    "error": "payload_too_large",
+                    "message": _too_large(limit),
+                    "request_id": scope.get("state", {}).get("request_id"),
+                    "errors": None
+                }
+            )
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def receive_limited() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    REJECTS.labels(reason="too_large").inc()
+                    # fastapi re-raises HTTPExceptions from body parsing, so this reaches the app's handler
+                    raise HTTPException(status_code=413, detail=_too_large(limit))
+            return message
+
+        await self.app(scope, receive_limited, send)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class ErrorResponse(BaseModel):
@@ -13,24 +13,51 @@ class AnalysisMetrics(BaseModel):
     edge_density: float = Field(..., ge=0, le=1, description="normialized edge density")
     texture_variance: float = Field(...,ge=0, description="standard deviation of pixel intensities")
     mean_intensity: float = Field(..., ge=0, le=255, description="average pixel brightness")
+    phash: Optional[str] = Field(default=None, description="64-bit difference hash of the gray image, hex")
+
+class TileHeatmap(BaseModel):
+    tile_size: int = Field(..., description="tile edge in pixels at full resolution")
+    rows: int
+    cols: int
+    scores: List[List[float]] = Field(..., description="contamination score per tile, row-major")
 
 class AnalysisResponse(BaseModel):
+    scan_id: Optional[int] = Field(default=None, description="id of the stored scan, null when write-behind doesn't wait for the commit")
+    scan_uid: Optional[str] = Field(default=None, description="uid of the stored scan, always set: GET /scans?uid= finds it once committed")
     score: float = Field(..., ge=0, le=100, description="contamination score 0-100")
-<<<<<<< HEAD
-=======
     label: str = Field(..., description="contamination level")
->>>>>>> master
     baseline_id: str = Field(..., description="id of baseline")
     baseline_score: float = Field(..., description="expected score for baseline")
     delta: float = Field(...)
+    score_version: Optional[str] = Field(default=None, description="scoring profile that produced score and label")
     metrics: AnalysisMetrics = Field(..., description="detailed analysis metrics")
     sample_name: Optional[str] = None
     location: Optional[str] = None
     notes: Optional[str] = None
+    mode: str = Field(default="standard", description="scoring mode: standard or tiled")
+    cached: bool = Field(default=False, description="true when the result came from the content-addressed cache")
+    heatmap: Optional[TileHeatmap] = Field(default=None, description="per-tile scores, tiled mode only")
+    image_hash: Optional[str] = Field(default=None, description="sha256 of the archived original, GET /scans/{scan_id}/image")
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
+class BatchItemResult(BaseModel):
+    index: int = Field(..., description="position of the image in the upload")
+    filename: Optional[str] = None
+    status_code: int = Field(..., description="per-image status, 200 on success")
+    result: Optional[AnalysisResponse] = None
+    error: Optional[str] = None
+
+class BatchAnalysisResponse(BaseModel):
+    total: int
+    succeeded: int
+    failed: int
+    results: List[BatchItemResult]
+
 class Baseline(BaseModel):
     id: str
     name: str
     description: str
     expected_score: float = Field(..., ge=0, le=100)
+    custom: bool = Field(default=False, description="true for baselines calibrated from reference images")
+    sample_count: Optional[int] = Field(default=None, description="reference images behind a custom baseline")
+    metrics: Optional[AnalysisMetrics] = Field(default=None, description="mean metrics of the reference images")
@@ -0,0 +1,64 @@
+import os
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+"""
+prometheus metrics for the api
+with PROMETHEUS_MULTIPROC_DIR set (see Dockerfile / gunicorn.conf.py) every
+process, gunicorn workers and scoring pool children alike, writes its samples to
+mmap'd files in that directory and /metrics merges them, so a scrape sees the
+whole server instead of whichever worker answered. the directory has to be set
+before prometheus_client is imported and wiped when the server starts.
+observing a histogram is a few microseconds, cheap enough for every request
+"""
+
+# 5ms .. 30s, scoring is tens of ms and the request timeout is 30s
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+ANALYZE_STAGE_SECONDS = Histogram(
+    "analyze_stage_seconds",
+    "time spent per stage of an /analyze request",
+    ["stage"], # read, validate, score, persist, total
+    buckets=LATENCY_BUCKETS,
+)
+SCORER_STAGE_SECONDS = Histogram(
+    "scorer_stage_seconds",
+    "time spent per stage of ContaminationScorer",
+    ["stage"], # decode, to_gray, measure
+    buckets=LATENCY_BUCKETS,
+)
+SCORING_QUEUE_SECONDS = Histogram(
+    "scoring_queue_wait_seconds",
+    "time a scoring job waited in the executor queue before a worker picked it up",
+    ["executor"],
+    buckets=LATENCY_BUCKETS,
+)
+SCORING_RUN_SECONDS = Histogram(
+    "scoring_run_seconds",
+    "time a scoring job ran on a worker",
+    ["executor"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_SESSION_SECONDS = Histogram(
+    "db_session_seconds",
+    "database session time: phase=session is the whole session including its commit, phase=commit is the commit alone",
+    ["engine", "phase"], # engine: sync|async, phase: session|commit
+    buckets=LATENCY_BUCKETS,
+)
+
+REJECTS = Counter("analyze_rejects_total", "uploads or jobs rejected before a result, by reason", ["reason"])
+TIMEOUTS = Counter("scoring_timeouts_total", "scoring jobs that hit the request timeout", ["executor"])
+RATE_LIMIT_HITS = Counter("rate_limit_hits_total", "requests refused by the rate limiter", ["endpoint"])
+SCANS = Counter("scans_total", "scans stored, by contamination label", ["label"])
+ARCHIVE_WRITES = Counter("archive_writes_total", "uploads handed to the image archive, by outcome", ["result"]) # stored, duplicate, dropped, failed
+
+IN_FLIGHT = Gauge("analyze_in_flight", "analyze requests currently being handled", ["endpoint"], multiprocess_mode="livesum")
+QUEUE_DEPTH = Gauge("scoring_queue_depth", "scoring jobs waiting for a worker", ["executor"], multiprocess_mode="livesum")
+SCORING_IN_FLIGHT = Gauge("scoring_in_flight", "scoring jobs queued or running", ["executor"], multiprocess_mode="livesum")
+
+def render_metrics() -> bytes:
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
@@ -0,0 +1,13 @@
+import argparse
+from datetime import datetime
+from database.db import init_db, rebuild_stats
+
+# recomputes the /stats aggregates and the /stats/timeseries rollups from the raw scans table
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="rebuild scan aggregates from raw rows")
+    parser.add_argument("--start", type=datetime.fromisoformat, default=None, help="first day of rollups to rebuild (YYYY-MM-DD)")
+    parser.add_argument("--end", type=datetime.fromisoformat, default=None, help="last day of rollups to rebuild (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    init_db()
+    rebuild_stats(args.start, args.end)
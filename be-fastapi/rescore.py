@@ -0,0 +1,18 @@
+import argparse
+import json
+import os
+from analysis.profiles import DEFAULT_PROFILE, PROFILES, get_profile
+from database.db import init_db
+from database.rescore import CHUNK_ROWS, rescore_scans
+
+# recomputes score, delta and label of stored scans from their metrics with a scoring profile,
+# no images needed; the /stats aggregates and rollups are adjusted chunk by chunk as it goes
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="re-score stored scans with a scoring profile")
+    parser.add_argument("--profile", default=os.getenv("SCORING_PROFILE", DEFAULT_PROFILE), choices=sorted(PROFILES))
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="scans read and written per transaction")
+    parser.add_argument("--all", action="store_true", help="also recompute scans already tagged with the profile")
+    args = parser.parse_args()
+
+    init_db()
+    print(json.dumps(rescore_scans(get_profile(args.profile), args.chunk_rows, force=args.all)))
@@ -0,0 +1,143 @@
+import asyncio
+import importlib
+import json
+import logging
+import os
+import signal
+import time
+from typing import Any, Dict, Optional
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+"""
+asgi entrypoint that is up before the app is imported
+gunicorn/uvicorn load server:app instead of main:app. its lifespan startup
+returns right away and main (fastapi, sqlalchemy, numpy, opencv, pillow, over a
+second on a cold container) is imported on a background thread, then main's own
+startup (init_db, baselines, warm-up) runs. until then GET /health is answered
+here, /ready says starting, and every other request waits for the app (at most
+STARTUP_WAIT_SECONDS, then 503). once loaded everything goes straight to main.app.
+an import or startup failure makes /health fail and stops the worker, like a
+failed startup would: gunicorn starts a new one, a lone uvicorn exits
+"""
+
+logger = logging.getLogger(__name__)
+
+STARTUP_WAIT_SECONDS = float(os.getenv("STARTUP_WAIT_SECONDS", "30"))
+
+async def _send_json(send: Send, status: int, content: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+    body = json.dumps(content).encode()
+    raw_headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    raw_headers += [(name.encode(), value.encode()) for name, value in (headers or {}).items()]
+    await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+    await send({"type": "http.response.body", "body": body})
+
+class LazyApp:
+    def __init__(self, target: str = "main:app", wait_seconds: float = STARTUP_WAIT_SECONDS, exit_on_error: bool = True):
+        self.module, _, self.attribute = target.partition(":")
+        self.wait_seconds = wait_seconds
+        self.exit_on_error = exit_on_error
+        self.app: Optional[ASGIApp] = None
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {} # import / startup seconds
+        self._loaded: Optional[asyncio.Event] = None
+        self._inbox: asyncio.Queue = asyncio.Queue() # the wrapped app's lifespan messages, both ways
+        self._outbox: asyncio.Queue = asyncio.Queue()
+        self._lifespan_task: Optional[asyncio.Task] = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            return await self._lifespan(scope, receive, send)
+        app = self.app or await self._wait_for_app(scope, send)
+        if app is not None:
+            await app(scope, receive, send)
+
+    async def _wait_for_app(self, scope: Scope, send: Send) -> Optional[ASGIApp]:
+        # -> the app once it can take the request, None when the request was answered here
+        http = scope["type"] == "http"
+        if http and scope["path"] == "/health":
+            if self.error is not None:
+                await _send_json(send, 503, {"status": "unhealthy", "error": self.error})
+            else:
+                await _send_json(send, 200, {"status": "healthy"})
+            return None
+        if http and scope["path"] == "/ready":
+            await _send_json(send, 503, {"detail": {"status": "starting", "error": self.error}})
+            return None
+
+        if self._loaded is None:
+            # server started without lifespan events: load on the first request instead
+            self._loaded = asyncio.Event()
+            asyncio.create_task(self._load({}, self._loaded))
+        if self.error is None:
+            try:
+                await asyncio.wait_for(self._loaded.wait(), self.wait_seconds)
+            except asyncio.TimeoutError:
+                pass
+        if self.app is not None:
+            return self.app
+        if http:
+            await _send_json(send, 503, {"error": "starting", "message": "Service is starting, retry shortly", "request_id": None, "errors": None}, {"Retry-After": "5"})
+        else:
+            await send({"type": "websocket.close", "code": 1013}) # try again later
+        return None
+
+    async def _lifespan(self, scope: Scope, receive: Receive, send: Send) -> None:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            self._loaded = asyncio.Event()
+            load = asyncio.create_task(self._load(scope, self._loaded))
+            await send({"type": "lifespan.startup.complete"})
+            message = await receive()
+            load.cancel()
+            try:
+                await load
+            except asyncio.CancelledError:
+                pass
+        # lifespan.shutdown
+        if self._lifespan_task is not None:
+            try:
+                await self._inner_lifespan(self._lifespan_task, {"type": "lifespan.shutdown"})
+            except Exception:
+                logger.exception("app_shutdown_failed")
+        await send({"type": "lifespan.shutdown.complete"})
+
+    async def _load(self, scope: Scope, loaded: asyncio.Event) -> None:
+        started = time.monotonic()
+        try:
+            # import on a thread so the loop keeps answering /health meanwhile
+            module = await asyncio.to_thread(importlib.import_module, self.module)
+            app = getattr(module, self.attribute)
+            imported = time.monotonic()
+            self._inbox, self._outbox = asyncio.Queue(), asyncio.Queue()
+            self._lifespan_task = asyncio.create_task(app(
+                {"type": "lifespan", "asgi": scope.get("asgi", {"version": "3.0"}), "state": scope.get("state", {})},
+                self._inbox.get,
+                self._outbox.put
+            ))
+            await self._inner_lifespan(self._lifespan_task, {"type": "lifespan.startup"})
+            self.timings = {"import": round(imported - started, 4), "startup": round(time.monotonic() - imported, 4)}
+            self.app = app
+            logger.info("app_loaded", extra={"target": f"{self.module}:{self.attribute}", **self.timings})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            logger.exception("app_load_failed")
+            if self.exit_on_error:
+                os.kill(os.getpid(), signal.SIGTERM) # graceful: answers what's in flight, then exits
+        finally:
+            loaded.set()
+
+    async def _inner_lifespan(self, task: asyncio.Task, message: Message) -> None:
+        # one lifespan step of the wrapped app (running as task), raises when it failed or didn't answer
+        await self._inbox.put(message)
+        reply = asyncio.ensure_future(self._outbox.get())
+        await asyncio.wait([reply, task], return_when=asyncio.FIRST_COMPLETED)
+        if not reply.done():
+            reply.cancel()
+            task.result() # re-raises what the app raised
+            raise RuntimeError(f"{message['type']} got no reply")
+        if reply.result()["type"].endswith(".failed"):
+            raise RuntimeError(reply.result().get("message") or f"{message['type']} failed")
+
+app = LazyApp("main:app")
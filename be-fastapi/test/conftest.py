@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# rate limit counters are shared through a sqlite file, give every test run a fresh one
+os.environ.setdefault("RATE_LIMIT_STORAGE", f"sqlite:///{tempfile.mkdtemp()}/ratelimit.db")
@@ -0,0 +1,110 @@
+"""Test the content-addressed image archive."""
+import asyncio
+import io
+import pytest
+from PIL import Image
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+import main
+from analysis.archive import ImageArchive, RangeNotSatisfiable, byte_range, content_hash
+from database.db import init_db
+
+def create_test_image(color='white', size=(640, 480), format='JPEG'):
+    """Create a plain test image."""
+    img_bytes = io.BytesIO()
+    Image.new('RGB', size, color=color).save(img_bytes, format=format)
+    return img_bytes.getvalue()
+
+def test_store_dedupes_shards_and_thumbnails(tmp_path):
+    """Test that identical uploads are stored once, sharded, with a thumbnail."""
+    archive = ImageArchive(str(tmp_path))
+    contents = create_test_image()
+    digest = content_hash(contents)
+    pending = archive.store(contents)
+    assert archive.store(contents, digest) is pending # same bytes while the write is queued
+    assert pending.result() == digest
+    assert archive.store(contents).result() == digest # already on disk
+
+    path = archive.path_for(digest)
+    assert path.relative_to(tmp_path).parts[:2] == (digest[:2], digest[2:4])
+    assert [p.name for p in tmp_path.rglob("*") if p.is_file()] == sorted([digest, f"{digest}.thumb.jpg"])
+    original, thumbnail_data = archive.read(digest), archive.read(digest, thumbnail=True)
+    assert original is not None and thumbnail_data is not None
+    assert bytes(original) == contents
+    thumbnail = Image.open(io.BytesIO(bytes(thumbnail_data)))
+    assert max(thumbnail.size) <= 256
+    assert archive.read("0" * 64) is None
+    archive.shutdown()
+
+def test_backlog_limit_skips_instead_of_buffering(tmp_path):
+    """Test that store() resolves to None once max_pending writes are queued."""
+    archive = ImageArchive(str(tmp_path), max_pending=0)
+    assert archive.store(create_test_image()).result() is None
+    archive.shutdown()
+
+def test_failed_write_is_not_linked(tmp_path, monkeypatch):
+    """Test that the digest is only handed out once the original is on disk."""
+    archive = ImageArchive(str(tmp_path))
+    monkeypatch.setattr(archive, "_thumbnail", lambda contents: 1 / 0)
+    contents = create_test_image()
+    assert archive.store(contents).result() is None
+    assert archive.read(content_hash(contents)) is None
+    archive.shutdown()
+
+def test_byte_range_parsing():
+    """Test single byte ranges, open ends, suffixes and unsatisfiable ranges."""
+    assert byte_range(None, 100) is None
+    assert byte_range("bytes=0-9", 100) == (0, 9)
+    assert byte_range("bytes=90-", 100) == (90, 99)
+    assert byte_range("bytes=-10", 100) == (90, 99)
+    assert byte_range("bytes=50-500", 100) == (50, 99)
+    assert byte_range("bytes=0-1,5-6", 100) is None
+    with pytest.raises(RangeNotSatisfiable):
+        byte_range("bytes=100-", 100)
+
+def test_failed_scoring_is_not_archived(tmp_path, monkeypatch):
+    """Test that an upload whose scoring fails is never written to the archive."""
+    async def timed_out(executor, contents, digest):
+        await asyncio.sleep(0.05)
+        raise HTTPException(status_code=504, detail="Analysis timed out")
+
+    archive = ImageArchive(str(tmp_path))
+    monkeypatch.setattr(main, "image_archive", archive)
+    monkeypatch.setattr(main, "_score_upload", timed_out)
+    contents = create_test_image(format='PNG')
+
+    response = TestClient(main.app).post("/analyze", files={"image": ("a.png", contents, "image/png")})
+    assert response.status_code == 504
+    archive.shutdown() # waits for any write that was queued
+    assert archive.read(content_hash(contents)) is None
+
+def test_scan_image_endpoint(tmp_path, monkeypatch):
+    """Test that /analyze links the archived image and GET /scans/{id}/image serves it with ETag and ranges."""
+    init_db()
+    archive = ImageArchive(str(tmp_path))
+    monkeypatch.setattr(main, "image_archive", archive)
+    client = TestClient(main.app)
+    contents = create_test_image(color='rgb(180, 170, 160)', format='PNG')
+
+    result = client.post("/analyze", files={"image": ("a.png", contents, "image/png")}).json()
+    assert result["image_hash"] == content_hash(contents)
+    url = f"/scans/{result['scan_id']}/image"
+
+    full = client.get(url)
+    assert full.status_code == 200
+    assert full.content == contents
+    assert full.headers["content-type"] == "image/png"
+    etag = full.headers["etag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    partial = client.get(url, headers={"Range": "bytes=0-7"})
+    assert partial.status_code == 206
+    assert partial.content == contents[:8]
+    assert partial.headers["content-range"] == f"bytes 0-7/{len(contents)}"
+    assert client.get(url, headers={"Range": "bytes=0-7", "If-Range": '"stale"'}).status_code == 200
+    assert client.get(url, headers={"Range": f"bytes={len(contents)}-"}).status_code == 416
+
+    thumbnail = client.get(url, params={"thumbnail": True})
+    assert thumbnail.headers["content-type"] == "image/jpeg"
+    assert client.get("/scans/999999999/image").status_code == 404
+    archive.shutdown()
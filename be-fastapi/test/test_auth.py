@@ -0,0 +1,71 @@
+"""Test api key middleware."""
+import asyncio
+import os
+import time
+from fastapi.testclient import TestClient
+from middleware.auth import APIKeyMiddleware, APIKeyStore, api_keys
+from database.db import init_db
+from main import app
+
+def test_keys_are_parsed_once_and_compared():
+    """Test env and file keys, comments and duplicates."""
+    store = APIKeyStore(" a , b,,a ")
+    assert store.keys == (b"a", b"b")
+    assert store.is_valid("a") and store.is_valid("b")
+    assert not store.is_valid("c") and not store.is_valid(None) and not store.is_valid("")
+    assert APIKeyStore("").is_valid(None) # development mode
+
+def test_key_file_hot_reload(tmp_path):
+    """Test that editing the key file and SIGHUP-style reloads take effect."""
+    path = tmp_path / "keys.txt"
+    path.write_text("first # laptop\n")
+    store = APIKeyStore("", str(path), reload_seconds=0)
+    assert store.is_valid("first")
+
+    path.write_text("second\n")
+    os.utime(path, (time.time() + 5, time.time() + 5))
+    assert store.is_valid("second") and not store.is_valid("first")
+
+    slow = APIKeyStore("", str(path), reload_seconds=3600)
+    path.write_text("third\n")
+    os.utime(path, (time.time() + 10, time.time() + 10))
+    assert not slow.is_valid("third")
+    slow.reload() # what SIGHUP does
+    assert slow.is_valid("third")
+
+def test_rejects_before_reading_body():
+    """Test that an unauthenticated upload is answered without pulling the body."""
+    async def run():
+        called = []
+
+        async def inner(scope, receive, send):
+            called.append(scope["path"])
+
+        async def receive():
+            raise AssertionError("body must not be read")
+
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        middleware = APIKeyMiddleware(inner, APIKeyStore("secret"))
+        scope = {"type": "http", "method": "POST", "path": "/analyze", "headers": [(b"content-length", b"10485760")], "query_string": b""}
+        await middleware(scope, receive, send)
+        return called, messages
+
+    called, messages = asyncio.run(run())
+    assert called == []
+    assert messages[0]["status"] == 401
+
+def test_app_auth_and_request_id(monkeypatch):
+    """Test public paths, protected paths and the request id header through the app."""
+    init_db()
+    monkeypatch.setattr(api_keys, "keys", (b"app-key",))
+    client = TestClient(app)
+
+    health = client.get("/health")
+    assert health.status_code == 200 and health.headers["X-Request-ID"]
+    assert client.get("/scans").status_code == 401
+    assert client.get("/scans", headers={"X-API-Key": "app-key"}).status_code == 200
+    assert client.post("/health").status_code in (401, 405)
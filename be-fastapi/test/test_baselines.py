@@ -0,0 +1,142 @@
+"""Test calibrated custom baselines."""
+import asyncio
+import io
+from datetime import datetime
+from PIL import Image, ImageDraw
+from fastapi.testclient import TestClient
+from analysis.scorer import ContaminationScorer
+from database.db import init_db
+from analysis.baselines import BaselineManager
+import main
+from main import app
+from middleware.auth import api_keys
+
+def create_test_image(spots=0):
+    """Create a white test image with some dark spots."""
+    img = Image.new('RGB', (500, 500), color='white')
+    draw = ImageDraw.Draw(img)
+    for i in range(spots):
+        x, y = 40 + (i * 37) % 420, 40 + (i * 53) % 420
+        draw.ellipse([x - 8, y - 8, x + 8, y + 8], fill='gray')
+    img_bytes = io.BytesIO()
+    img.save(img_bytes, format='PNG')
+    return img_bytes.getvalue()
+
+def test_create_refine_and_analyze_against_custom_baseline():
+    """Test that a baseline is the mean of its reference images and refines as a running mean."""
+    init_db()
+    baseline_id = f"bench_{int(datetime.utcnow().timestamp() * 1000)}"
+    images = [create_test_image(spots) for spots in (0, 10, 20, 30, 40)]
+    scorer = ContaminationScorer()
+    scores = [scorer.analyze_bytes(contents)[0] for contents in images]
+
+    with TestClient(app) as client:
+        response = client.post(
+            "/baselines",
+            files=[("images", (f"ref{i}.png", contents, "image/png")) for i, contents in enumerate(images[:3])],
+            data={"baseline_id": baseline_id, "name": "Steel Bench"}
+        )
+        assert response.status_code == 201
+        created = response.json()
+        assert created["custom"] and created["sample_count"] == 3
+        assert abs(created["expected_score"] - sum(scores[:3]) / 3) < 1e-3
+
+        listed = {baseline["id"] for baseline in client.get("/baselines").json()["baselines"]}
+        assert {"clean_surface", baseline_id} <= listed
+
+        response = client.post(
+            f"/baselines/{baseline_id}/samples",
+            files=[("images", (f"more{i}.png", contents, "image/png")) for i, contents in enumerate(images[3:])]
+        )
+        assert response.status_code == 200
+        refined = response.json()
+        assert refined["sample_count"] == 5
+        assert abs(refined["expected_score"] - sum(scores) / 5) < 1e-3
+
+        analysis = client.post(
+            "/analyze",
+            files={"image": ("test.png", images[0], "image/png")},
+            data={"baseline_id": baseline_id}
+        ).json()
+        assert analysis["baseline_score"] == refined["expected_score"]
+
+        duplicate = client.post(
+            "/baselines",
+            files=[("images", ("ref.png", images[0], "image/png"))],
+            data={"baseline_id": baseline_id, "name": "Again"}
+        )
+        assert duplicate.status_code == 409
+        builtin = client.post("/baselines/clean_surface/samples", files=[("images", ("ref.png", images[0], "image/png"))])
+        assert builtin.status_code == 400
+        missing = client.post("/baselines/no_such_baseline/samples", files=[("images", ("ref.png", images[0], "image/png"))])
+        assert missing.status_code == 404
+
+def test_registry_loads_once_and_reloads_on_demand():
+    """Test that lookups are served from memory until the registry is reloaded."""
+    calls = []
+
+    def load():
+        calls.append(1)
+        return []
+
+    manager = BaselineManager(load_custom=load)
+    for _ in range(100):
+        assert manager.get_baseline("unknown").id == "clean_surface"
+    assert len(calls) == 1
+    manager.reload()
+    assert len(calls) == 2
+
+def test_refining_an_unknown_baseline_scores_nothing(monkeypatch):
+    """Test that an unknown baseline gets a 404 before any reference image is scored."""
+    init_db()
+    scored = []
+
+    async def fake_score(images):
+        scored.append(images)
+        return []
+
+    monkeypatch.setattr(main, "_score_reference_images", fake_score)
+    with TestClient(app) as client:
+        response = client.post(
+            "/baselines/no_such_baseline/samples",
+            files=[("images", ("ref.png", create_test_image(), "image/png"))]
+        )
+    assert response.status_code == 404
+    assert scored == []
+
+def test_reference_images_are_read_within_the_concurrency_bound(monkeypatch):
+    """Test that calibrating a baseline holds no more than BATCH_CONCURRENCY reference images at once."""
+    read_upload = main._read_upload
+    active, peak = [0], [0]
+
+    async def tracked(image):
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        return await read_upload(image)
+
+    async def score(executor, contents, digest):
+        await asyncio.sleep(0.01)
+        active[0] -= 1
+        return 10.0, main.scorer.analyze_bytes(contents)[1], False
+
+    monkeypatch.setattr(main, "BATCH_CONCURRENCY", 2)
+    monkeypatch.setattr(main, "_read_upload", tracked)
+    monkeypatch.setattr(main, "_score_upload", score)
+    init_db()
+    with TestClient(app) as client:
+        response = client.post(
+            "/baselines",
+            files=[("images", (f"ref{i}.png", create_test_image(), "image/png")) for i in range(6)],
+            data={"baseline_id": f"bounded_{int(datetime.utcnow().timestamp() * 1000)}", "name": "Bounded"}
+        )
+    assert response.status_code == 201
+    assert peak[0] == 2
+
+def test_baseline_writes_require_api_key(monkeypatch):
+    """Test that listing baselines stays public while creating one needs an API key."""
+    monkeypatch.setattr(api_keys, "keys", (b"test-key",))
+    client = TestClient(app)
+
+    assert client.get("/baselines").status_code == 200
+    assert client.post("/baselines", data={"baseline_id": "x", "name": "x"}).status_code == 401
+    assert client.post("/baselines/x/samples").status_code == 401
@@ -0,0 +1,87 @@
+"""Test batch analysis endpoint."""
+import asyncio
+import io
+from PIL import Image, ImageDraw
+from fastapi.testclient import TestClient
+from database.db import get_db, init_db
+from database.models import Scan
+from sqlalchemy import func
+from main import app
+
+def create_test_image(spots=0):
+    """Create a white test image with some dark spots."""
+    img = Image.new('RGB', (500, 500), color='white')
+    draw = ImageDraw.Draw(img)
+    for i in range(spots):
+        x, y = 40 + (i * 37) % 420, 40 + (i * 53) % 420
+        draw.ellipse([x - 8, y - 8, x + 8, y + 8], fill='gray')
+    img_bytes = io.BytesIO()
+    img.save(img_bytes, format='PNG')
+    img_bytes.seek(0)
+    return img_bytes
+
+def test_batch_scores_images_in_order():
+    """Test that /analyze/batch returns per-image results and isolates failures."""
+    init_db()
+
+    with TestClient(app) as client:
+        with get_db() as db:
+            initial_count = db.query(func.count(Scan.id)).scalar()
+
+        response = client.post(
+            "/analyze/batch",
+            files=[
+                ("images", ("clean.png", create_test_image(), "image/png")),
+                ("images", ("broken.png", io.BytesIO(b"not an image"), "image/png")),
+                ("images", ("dirty.png", create_test_image(spots=40), "image/png")),
+            ],
+            data={"baseline_id": "clean_surface", "location": "Batch-Test"}
+        )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 3
+    assert data["succeeded"] == 2
+    assert data["failed"] == 1
+
+    results = data["results"]
+    assert [r["index"] for r in results] == [0, 1, 2]
+    assert [r["filename"] for r in results] == ["clean.png", "broken.png", "dirty.png"]
+    assert results[1]["status_code"] == 400
+    assert results[1]["result"] is None
+    assert results[0]["result"]["score"] < results[2]["result"]["score"]
+
+    with get_db() as db:
+        new_count = db.query(func.count(Scan.id)).scalar()
+        assert new_count == initial_count + 2
+
+def test_batch_reads_uploads_within_the_concurrency_bound(monkeypatch):
+    """Test that no more than BATCH_CONCURRENCY uploads of a batch are in memory at once."""
+    import main
+    read_upload = main._read_upload
+    active, peak = [0], [0]
+
+    async def tracked(image):
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        return await read_upload(image)
+
+    async def score(executor, contents, digest):
+        await asyncio.sleep(0.01) # on the pool
+        active[0] -= 1 # done with the bytes once scored
+        return 10.0, main.scorer.analyze_bytes(contents)[1], False
+
+    monkeypatch.setattr(main, "BATCH_CONCURRENCY", 2)
+    monkeypatch.setattr(main, "_read_upload", tracked)
+    monkeypatch.setattr(main, "_score_upload", score)
+    init_db()
+
+    with TestClient(app) as client:
+        response = client.post(
+            "/analyze/batch",
+            files=[("images", (f"{i}.png", create_test_image(), "image/png")) for i in range(6)]
+        )
+
+    assert response.status_code == 200
+    assert response.json()["succeeded"] == 6
+    assert peak[0] == 2
@@ -0,0 +1,52 @@
+"""Test benchmark suite helpers."""
+from benchmarks.images import create_test_image, iter_cases
+from benchmarks.load import build_schedule, load_schedule, max_rate_within_slo, save_schedule, summarize as summarize_load
+from benchmarks.pipeline import bench_db_insert, bench_image_stages, compare
+from analysis.scorer import ContaminationScorer
+
+def test_synthetic_images_are_deterministic():
+    """Test that the same parameters always produce the same bytes."""
+    assert create_test_image(320, 240, 50, "JPEG", seed=1) == create_test_image(320, 240, 50, "JPEG", seed=1)
+    assert create_test_image(320, 240, 50, "PNG", seed=1) != create_test_image(320, 240, 50, "PNG", seed=2)
+    names = [case.name for case in iter_cases([(320, 240)], ["PNG"])]
+    assert names == ["320x240-png-clean", "320x240-png-moderate", "320x240-png-dirty"]
+
+def test_stages_are_timed_separately():
+    """Test that every pipeline stage and the db insert get their own timing."""
+    stages = bench_image_stages(ContaminationScorer(), create_test_image(320, 240, 20), repeats=1)
+    assert {"verify", "decode", "color_convert", "resize", "spot_coverage", "edge_density", "texture_variance"} <= set(stages)
+    assert all(timing["median_ms"] >= 0 for timing in stages.values())
+    assert set(bench_db_insert(repeats=1)) == {"db_insert", "db_insert_batch100"}
+
+def test_compare_flags_only_real_regressions():
+    """Test that slowdowns need to pass both the relative and the absolute threshold."""
+    baseline = {"results": {"a": {"median_ms": 10.0}, "b": {"median_ms": 0.1}, "c": {"median_ms": 10.0}}}
+    current = {"results": {"a": {"median_ms": 15.0}, "b": {"median_ms": 0.3}, "c": {"median_ms": 10.5}, "new": {"median_ms": 1.0}}}
+    rows = {row["stage"]: row for row in compare(current, baseline, threshold=0.2, min_delta_ms=0.5)}
+    assert rows["a"]["regression"]
+    assert not rows["b"]["regression"] # 3x slower but only 0.2ms
+    assert not rows["c"]["regression"]
+    assert "new" not in rows
+
+def test_load_schedule_is_seeded_and_replayable(tmp_path):
+    """Test that a schedule follows the rate and mix, repeats per seed and survives a record/replay round trip."""
+    schedule = build_schedule(rate=50, duration=20, mix={"analyze": 0.5, "stats": 0.5}, seed=3)
+    assert schedule == build_schedule(rate=50, duration=20, mix={"analyze": 0.5, "stats": 0.5}, seed=3)
+    assert 800 < len(schedule) < 1200
+    assert {item["path"] for item in schedule} == {"/analyze", "/stats"}
+    assert all("image" in item for item in schedule if item["path"] == "/analyze")
+    assert all(a["offset_s"] <= b["offset_s"] < 20 for a, b in zip(schedule, schedule[1:]))
+
+    save_schedule(tmp_path / "schedule.jsonl", schedule)
+    assert load_schedule(tmp_path / "schedule.jsonl") == schedule
+
+def test_load_summary_rates_and_percentiles():
+    """Test latency percentiles and the error/429/503/504 rates of a run."""
+    results = [{"path": "/analyze", "status": 200, "latency_ms": float(ms)} for ms in range(1, 97)]
+    results += [{"path": "/analyze", "status": status, "latency_ms": 500.0} for status in (429, 503, 504, 0)]
+    summary = summarize_load(results, elapsed=10)
+    assert summary["requests"] == 100 and summary["throughput_rps"] == 10 and summary["ok_rps"] == 9.6
+    assert (summary["p50_ms"], summary["p95_ms"], summary["p99_ms"]) == (50, 95, 500)
+    assert summary["error_rate"] == 0.04
+    assert summary["rate_429"] == summary["rate_503"] == summary["rate_504"] == 0.01
+    assert max_rate_within_slo([{"rate": 4, "all": summary}, {"rate": 8, "all": {**summary, "p95_ms": 2000}}], 1000, 0.05) == 4
@@ -0,0 +1,109 @@
+"""Test content-addressed result cache."""
+import io
+from PIL import Image, ImageDraw
+from fastapi.testclient import TestClient
+from analysis.cache import LRUCache, ResultCache, SQLiteCache, cache_key
+from database.db import get_db, init_db
+from database.models import Scan
+from models.schemas import AnalysisMetrics
+from sqlalchemy import func
+from main import app
+
+METRICS = AnalysisMetrics(spot_coverage=0.1, edge_density=0.02, texture_variance=12.0, mean_intensity=200.0)
+
+def create_test_image():
+    """Create a small test image with one spot."""
+    img = Image.new('RGB', (400, 300), color='white')
+    ImageDraw.Draw(img).ellipse([50, 50, 90, 90], fill='gray')
+    img_bytes = io.BytesIO()
+    img.save(img_bytes, format='PNG')
+    return img_bytes.getvalue()
+
+def test_repeated_upload_is_served_from_cache():
+    """Test that a byte-identical upload is a cache hit and still records a scan."""
+    init_db()
+    client = TestClient(app)
+    contents = create_test_image()
+
+    with get_db() as db:
+        initial_count = db.query(func.count(Scan.id)).scalar()
+
+    first = client.post("/analyze", files={"image": ("a.png", io.BytesIO(contents), "image/png")}, data={"sample_name": "Cache-Test"})
+    second = client.post("/analyze", files={"image": ("a.png", io.BytesIO(contents), "image/png")}, data={"sample_name": "Cache-Test"})
+
+    assert first.status_code == 200 and second.status_code == 200
+    assert second.json()["cached"] is True
+    assert second.json()["score"] == first.json()["score"]
+    assert second.json()["metrics"] == first.json()["metrics"]
+
+    with get_db() as db:
+        assert db.query(func.count(Scan.id)).scalar() == initial_count + 2
+
+def test_key_depends_on_scorer_config():
+    """Test that changing the scorer config changes the key."""
+    assert cache_key(b"abc", {"fused": True}) != cache_key(b"abc", {"fused": False})
+    assert cache_key(b"abc", {"fused": True}) == cache_key(b"abc", {"fused": True})
+
+def test_lru_evicts_by_size_and_ttl():
+    """Test LRU eviction order and TTL expiry."""
+    cache = LRUCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", (1.0, METRICS))
+    cache.set("b", (2.0, METRICS))
+    cache.get("a")
+    cache.set("c", (3.0, METRICS))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+
+    cache.set("old", (4.0, METRICS), stored_at=1.0)
+    assert cache.get("old") is None
+
+def test_sqlite_tier_survives_restart(tmp_path):
+    """Test that a fresh cache instance reads results from the sqlite tier."""
+    ResultCache(sqlite_path=tmp_path / "cache.db").set("k", (42.0, METRICS))
+
+    restarted = ResultCache(sqlite_path=tmp_path / "cache.db")
+    assert restarted.get("k") == (42.0, METRICS)
+    assert restarted.stats()["sqlite_hits"] == 1
+    assert restarted.get("k") == (42.0, METRICS)
+    assert restarted.stats()["memory_hits"] == 1
+
+def test_sqlite_tier_purges_expired_and_caps_rows(tmp_path):
+    """Test that every purge_every sets drop expired rows and the oldest rows beyond max_rows."""
+    import time
+
+    cache = SQLiteCache(tmp_path / "cache.db", ttl_seconds=60, max_rows=3, purge_every=5)
+    now = time.time()
+    cache.set("expired", (1.0, METRICS), now - 120)
+    for i in range(4):
+        cache.set(f"k{i}", (float(i), METRICS), now + i)
+    # the fifth set purged: the expired row and k0, the oldest beyond 3 rows
+    keys = {key for (key,) in cache._connect().execute("SELECT key FROM results")}
+    assert keys == {"k1", "k2", "k3"}
+    assert cache.get("k3") == (now + 3, (3.0, METRICS))
+
+def test_sqlite_tier_is_used_off_the_event_loop(tmp_path, monkeypatch):
+    """Test that with the sqlite tier on, cache lookups and writes don't run on the loop thread."""
+    import threading
+    import main
+
+    threads = []
+
+    class RecordingCache(ResultCache):
+        def get(self, key):
+            threads.append(threading.current_thread())
+            return super().get(key)
+
+        def set(self, key, value):
+            threads.append(threading.current_thread())
+            super().set(key, value)
+
+    monkeypatch.setattr(main, "result_cache", RecordingCache(sqlite_path=tmp_path / "cache.db"))
+    init_db()
+    client = TestClient(app)
+    contents = create_test_image()
+
+    for _ in range(2):
+        client.post("/analyze", files={"image": ("t.png", io.BytesIO(contents), "image/png")})
+
+    assert len(threads) == 3 # miss, store, hit
+    assert all(thread.name.startswith("asyncio") for thread in threads)
@@ -0,0 +1,88 @@
+"""Test bounded scoring executor."""
+import asyncio
+import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+from analysis.executor import ExecutorBusyError, ScoringExecutor
+from analysis.scorer import ContaminationScorer
+from analysis.warmup import synthetic_surface
+
+class BlockingScorer(ContaminationScorer):
+    """Scorer whose jobs wait until the test releases them."""
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def analyze_bytes(self, contents):
+        self.calls += 1
+        self.release.wait(5)
+        return 0.0, None
+
+def test_full_queue_rejects_immediately():
+    """Test that jobs beyond workers + queue are shed instead of waiting."""
+    scorer = BlockingScorer()
+    executor = ScoringExecutor(scorer, backend="thread", max_workers=1, max_queue=1)
+
+    async def run():
+        first = asyncio.ensure_future(executor.score(b"a", timeout=5))
+        second = asyncio.ensure_future(executor.score(b"b", timeout=5))
+        await asyncio.sleep(0.05)
+        assert executor.in_flight == 2
+        assert executor.queue_depth == 1
+
+        with pytest.raises(ExecutorBusyError) as busy:
+            await executor.score(b"c", timeout=5)
+        assert busy.value.retry_after >= 1
+
+        scorer.release.set()
+        await asyncio.gather(first, second)
+
+    asyncio.run(run())
+    executor.shutdown()
+    assert executor.stats()["rejected"] == 1
+    assert executor.stats()["completed"] == 2
+    assert executor.in_flight == 0
+
+def test_timed_out_queued_job_never_runs():
+    """Test that a job still queued at its deadline is cancelled, not run later."""
+    scorer = BlockingScorer()
+    executor = ScoringExecutor(scorer, backend="thread", max_workers=1, max_queue=4)
+
+    async def run():
+        running = asyncio.ensure_future(executor.score(b"a", timeout=5))
+        await asyncio.sleep(0.05)
+        with pytest.raises(asyncio.TimeoutError):
+            await executor.score(b"b", timeout=0.05)
+        scorer.release.set()
+        await running
+
+    asyncio.run(run())
+    executor.shutdown()
+    assert scorer.calls == 1
+    assert executor.in_flight == 0
+    assert executor.stats()["timed_out"] == 1
+
+def test_dead_pool_worker_is_replaced():
+    """Test that a killed worker process breaks the pool once, not every request after it."""
+    executor = ScoringExecutor(ContaminationScorer(), backend="process", max_workers=1, max_queue=4)
+    contents = synthetic_surface()
+
+    async def run():
+        await executor.score(contents, timeout=60)
+        broken = executor._executor
+        assert isinstance(broken, ProcessPoolExecutor)
+        for pid in list(broken._processes):
+            os.kill(pid, signal.SIGKILL)
+        score, _ = await executor.score(contents, timeout=60)
+        return broken, executor._executor, score
+
+    try:
+        broken, replacement, score = asyncio.run(run())
+    finally:
+        executor.shutdown()
+    assert 0 <= score <= 100
+    assert replacement is not None and replacement is not broken
+    assert executor.in_flight == 0
@@ -0,0 +1,82 @@
+"""Test scan history with keyset pagination."""
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from database.db import get_db, init_db
+from database.models import Scan
+from main import app
+
+def test_pages_cover_every_scan_once():
+    """Test that walking the cursor returns every matching scan exactly once, in order."""
+    init_db()
+    client = TestClient(app)
+    location = f"History-Test-{datetime.utcnow().timestamp()}"
+    base = datetime(2024, 6, 1)
+
+    with get_db() as db:
+        # repeated timestamps make sure ties are broken by id
+        db.add_all([
+            Scan(score=float(i % 100), baseline_id="clean_surface", baseline_score=15.0, delta=0.0,
+                 label=["low", "moderate", "high"][i % 3], spot_coverage=0.1, edge_density=0.1,
+                 texture_variance=10.0, mean_intensity=200.0, location=location,
+                 timestamp=base + timedelta(minutes=i // 3))
+            for i in range(47)
+        ])
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"location": location, "limit": 10}
+        if cursor:
+            params["cursor"] = cursor
+        page = client.get("/scans", params=params).json()
+        seen.extend(page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert len(seen) == 47
+    assert len({item["id"] for item in seen}) == 47
+    keys = [(item["timestamp"], item["id"]) for item in seen]
+    assert keys == sorted(keys, reverse=True)
+
+    high = client.get("/scans", params={"location": location, "label": "high", "min_score": 20, "order": "asc", "limit": 100}).json()
+    assert high["items"] and all(item["label"] == "high" and item["score"] >= 20 for item in high["items"])
+    assert [item["id"] for item in high["items"]] == sorted(item["id"] for item in high["items"])
+
+    assert client.get("/scans", params={"cursor": "not-a-cursor"}).status_code == 400
+
+def test_export_streams_filtered_rows():
+    """Test NDJSON and gzipped CSV exports return every matching scan in (timestamp, id) order."""
+    init_db()
+    client = TestClient(app)
+    location = f"Export-Test-{datetime.utcnow().timestamp()}"
+    base = datetime(2024, 7, 1)
+
+    with get_db() as db:
+        db.add_all([
+            Scan(score=float(i), baseline_id="clean_surface", baseline_score=15.0, delta=0.0,
+                 label="high" if i % 2 else "low", spot_coverage=0.1, edge_density=0.1,
+                 texture_variance=10.0, mean_intensity=200.0, location=location, notes='dust, "spots"',
+                 timestamp=base + timedelta(minutes=i))
+            for i in range(25)
+        ])
+
+    response = client.get("/scans/export", params={"location": location})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["score"] for row in rows] == [float(i) for i in range(25)]
+    assert rows[0]["notes"] == 'dust, "spots"'
+
+    response = client.get("/scans/export", params={"location": location, "label": "high", "format": "csv", "compress": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-disposition"].endswith('scans.csv.gz"')
+    table = list(csv.DictReader(io.StringIO(gzip.decompress(response.content).decode())))
+    assert len(table) == 12
+    assert all(row["label"] == "high" and row["location"] == location for row in table)
+
+    assert client.get("/scans/export", params={"format": "xml"}).status_code == 422
@@ -0,0 +1,44 @@
+"""Test single-decode image ingest."""
+import io
+import pytest
+from PIL import Image
+from analysis.ingest import SIGNATURE_BYTES, InvalidImageError, decode_image, probe_image, sniff_format
+
+def encode(width, height, format):
+    """Encode a plain image to bytes."""
+    img_bytes = io.BytesIO()
+    Image.new('RGB', (width, height), color=(200, 190, 180)).save(img_bytes, format=format)
+    return img_bytes.getvalue()
+
+def test_jpeg_decodes_close_to_target_size():
+    """Test that large JPEGs are DCT-downscaled but never below target_size."""
+    image = decode_image(encode(4032, 3024, 'JPEG'), target_size=(800, 600), mode="L")
+    assert image.mode == "L"
+    assert image.size == (1008, 756)
+
+def test_png_decodes_full_size():
+    """Test that PNGs decode at full resolution in the requested mode."""
+    image = decode_image(encode(1200, 900, 'PNG'), target_size=(800, 600), mode="L")
+    assert image.mode == "L"
+    assert image.size == (1200, 900)
+
+def test_header_checks_reject_before_decode():
+    """Test that format and dimension errors come from the header."""
+    assert probe_image(encode(640, 480, 'PNG')) == ("PNG", 640, 480)
+    with pytest.raises(InvalidImageError, match="dimensions"):
+        probe_image(encode(50, 480, 'PNG'))
+    with pytest.raises(InvalidImageError, match="format"):
+        probe_image(encode(640, 480, 'BMP'))
+
+def test_truncated_image_is_rejected():
+    """Test that corrupted pixel data surfaces as InvalidImageError."""
+    data = encode(1200, 900, 'JPEG')
+    with pytest.raises(InvalidImageError):
+        decode_image(data[:len(data) // 3], target_size=(800, 600), mode="L")
+
+def test_sniff_format_from_leading_bytes():
+    """Test that the format is recognised from the first few bytes only."""
+    assert sniff_format(encode(640, 480, 'JPEG')[:SIGNATURE_BYTES]) == "JPEG"
+    assert sniff_format(encode(640, 480, 'PNG')[:SIGNATURE_BYTES]) == "PNG"
+    assert sniff_format(encode(640, 480, 'BMP')[:SIGNATURE_BYTES]) is None
+    assert sniff_format(b"") is None
@@ -0,0 +1,134 @@
+"""Test live frame scoring over websocket."""
+import asyncio
+import io
+import pytest
+from PIL import Image, ImageDraw
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+from analysis.live import CapturesFullError, LiveSession
+from database.db import get_db, init_db
+from database.models import Scan
+from middleware.auth import api_keys
+import main
+
+def create_test_image(spots=0):
+    """Create a white test image with some dark spots."""
+    img = Image.new('RGB', (500, 500), color='white')
+    draw = ImageDraw.Draw(img)
+    for i in range(spots):
+        x, y = 40 + (i * 37) % 420, 40 + (i * 53) % 420
+        draw.ellipse([x - 8, y - 8, x + 8, y + 8], fill='gray')
+    img_bytes = io.BytesIO()
+    img.save(img_bytes, format='JPEG')
+    return img_bytes.getvalue()
+
+def test_latest_frame_wins_and_captures_are_kept():
+    """Test that stale previews are dropped while every captured frame is delivered."""
+    async def run():
+        session = LiveSession(max_fps=0, cpu_budget=0)
+        for i in range(5):
+            session.push(b"preview %d" % i)
+        session.push(b"capture", {"sample_name": "bench"})
+        session.push(b"preview 5")
+        session.close()
+        return [frame async for frame in session.frames()], session
+
+    frames, session = asyncio.run(run())
+    assert [frame.contents for frame in frames] == [b"capture", b"preview 5"]
+    assert session.dropped == 5
+
+def test_waiting_captures_are_bounded():
+    """Test that a capture beyond max_captures is rejected while previews still replace each other."""
+    session = LiveSession(max_captures=2)
+    session.push(b"capture 0", {})
+    session.push(b"capture 1", {})
+    with pytest.raises(CapturesFullError):
+        session.push(b"capture 2", {})
+    session.push(b"preview")
+    assert len(session._captures) == 2
+    assert session.stats()["rejected"] == 1
+    assert session.push(b"preview 2").index == 4
+
+def test_pacing_respects_cpu_budget():
+    """Test that a session waits busy / cpu_budget between frames."""
+    async def run():
+        session = LiveSession(max_fps=1000, cpu_budget=0.5)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        session.push(b"a")
+        async for frame in session.frames():
+            await asyncio.sleep(0.05) # pretend scoring took 50ms
+            if frame.contents == b"a":
+                session.push(b"b")
+            else:
+                session.close()
+        return loop.time() - started
+
+    # two frames of 50ms each at half a core: the second starts no sooner than 100ms in
+    assert asyncio.run(run()) >= 0.15
+
+def test_websocket_scores_previews_and_stores_captures(monkeypatch):
+    """Test that previews get smoothed scores back and only captured frames are stored."""
+    monkeypatch.setattr(main, "LIVE_MAX_FPS", 100)
+    monkeypatch.setattr(main, "LIVE_CPU_BUDGET", 1.0)
+    init_db()
+    location = "Live-Test"
+    with get_db() as db:
+        initial = db.query(Scan).filter(Scan.location == location).count()
+
+    with TestClient(main.app) as client:
+        with client.websocket_connect(f"/ws/live?location={location}") as websocket:
+            websocket.send_bytes(create_test_image())
+            first = websocket.receive_json()
+            assert first["type"] == "score" and first["score"] == first["smoothed"]
+
+            websocket.send_bytes(create_test_image(spots=40))
+            second = websocket.receive_json()
+            assert second["type"] == "score"
+            assert first["smoothed"] < second["smoothed"] < second["score"]
+
+            websocket.send_bytes(b"not an image")
+            assert websocket.receive_json()["status_code"] == 400
+
+            websocket.send_text("[1, 2]")
+            assert websocket.receive_json() == {"type": "error", "status_code": 400, "message": "control messages must be json objects"}
+            websocket.send_text("not json")
+            assert websocket.receive_json()["status_code"] == 400
+
+            websocket.send_json({"type": "capture", "sample_name": "bench", "notes": "live"})
+            websocket.send_bytes(create_test_image(spots=10))
+            captured = websocket.receive_json()
+            assert captured["type"] == "captured"
+            assert captured["result"]["scan_id"] is not None
+            assert captured["result"]["sample_name"] == "bench"
+
+    with get_db() as db:
+        assert db.query(Scan).filter(Scan.location == location).count() == initial + 1
+
+def test_unexpected_frame_error_keeps_the_session_open(monkeypatch):
+    """Test that a frame failing with an unexpected error is answered with a 500 and later frames still score."""
+    async def broken_write(scan):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(main, "LIVE_MAX_FPS", 100)
+    monkeypatch.setattr(main, "LIVE_CPU_BUDGET", 1.0)
+    monkeypatch.setattr(main.scan_writer, "write", broken_write)
+    with TestClient(main.app) as client:
+        with client.websocket_connect("/ws/live") as websocket:
+            websocket.send_json({"type": "capture", "sample_name": "broken"})
+            websocket.send_bytes(create_test_image())
+            assert websocket.receive_json() == {"type": "error", "frame": 0, "status_code": 500, "message": "Internal server error"}
+
+            websocket.send_bytes(create_test_image())
+            assert websocket.receive_json()["type"] == "score"
+
+def test_websocket_requires_api_key(monkeypatch):
+    """Test that live sessions are refused without a valid API key."""
+    monkeypatch.setattr(api_keys, "keys", (b"live-key",))
+    client = TestClient(main.app)
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect("/ws/live"):
+            pass
+    with client.websocket_connect("/ws/live?api_key=live-key") as websocket:
+        websocket.send_bytes(create_test_image())
+        assert websocket.receive_json()["type"] == "score"
@@ -0,0 +1,57 @@
+"""Test prometheus metrics."""
+import io
+import os
+import subprocess
+import sys
+from pathlib import Path
+from PIL import Image
+from fastapi.testclient import TestClient
+from database.db import init_db
+from main import app
+
+BACKEND_DIR = Path(__file__).parent.parent
+
+def create_test_image():
+    """Create a plain white test image."""
+    img_bytes = io.BytesIO()
+    Image.new('RGB', (400, 300), color='white').save(img_bytes, format='PNG')
+    return img_bytes.getvalue()
+
+def sample(text, name):
+    """Return the value of one sample line from the exposition text."""
+    for line in text.splitlines():
+        if line.startswith(name + " "):
+            return float(line.split()[-1])
+    return 0.0
+
+def test_analyze_feeds_stage_histograms_and_counters():
+    """Test that /analyze shows up in stage histograms, reject counters and label counts."""
+    init_db()
+    client = TestClient(app)
+    before = client.get("/metrics").text
+
+    assert client.post("/analyze", files={"image": ("test.png", create_test_image(), "image/png")}).status_code == 200
+    assert client.post("/analyze", files={"image": ("test.txt", b"hello", "text/plain")}).status_code == 400
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    after = response.text
+    for stage in ("read", "validate", "score", "persist", "total"):
+        name = f'analyze_stage_seconds_count{{stage="{stage}"}}'
+        assert sample(after, name) >= sample(before, name) + (1 if stage in ("read", "validate", "total") else 0)
+    assert sample(after, 'analyze_rejects_total{reason="content_type"}') == sample(before, 'analyze_rejects_total{reason="content_type"}') + 1
+    assert sample(after, 'scans_total{label="low"}') >= 1
+    assert 'db_session_seconds_count{engine="async",phase="commit"}' in after
+    assert 'analyze_in_flight{endpoint="analyze"} 0.0' in after
+
+def test_multiprocess_registry_merges_workers(tmp_path):
+    """Test that counters from separate worker processes are summed on /metrics."""
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+    bump = "from monitoring.metrics import SCANS; SCANS.labels(label='high').inc({})"
+    for amount in (2, 3):
+        subprocess.run([sys.executable, "-c", bump.format(amount)], cwd=BACKEND_DIR, env=env, check=True)
+
+    render = "import sys; from monitoring.metrics import render_metrics; sys.stdout.write(render_metrics().decode())"
+    output = subprocess.run([sys.executable, "-c", render], cwd=BACKEND_DIR, env=env, check=True, capture_output=True, text=True).stdout
+    assert sample(output, 'scans_total{label="high"}') == 5.0
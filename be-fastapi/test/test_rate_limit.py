@@ -0,0 +1,70 @@
+"""Test the shared sqlite rate limit storage and tiers."""
+import sqlite3
+import subprocess
+import sys
+import time
+from pathlib import Path
+from fastapi.testclient import TestClient
+from middleware.rate_limit import RateLimitTiers, SQLiteStorage, api_key_digest
+import main
+
+BACKEND_DIR = Path(__file__).parent.parent
+
+def test_counts_are_shared_across_processes(tmp_path):
+    """Test that concurrent worker processes increment one shared counter exactly."""
+    uri = f"sqlite:///{tmp_path}/ratelimit.db"
+    script = (
+        "import sys; from middleware.rate_limit import SQLiteStorage; "
+        "storage = SQLiteStorage(sys.argv[1]); [storage.incr('ip:1.2.3.4', 60) for _ in range(200)]"
+    )
+    workers = [subprocess.Popen([sys.executable, "-c", script, uri], cwd=BACKEND_DIR) for _ in range(4)]
+    assert all(worker.wait(timeout=60) == 0 for worker in workers)
+
+    storage = SQLiteStorage(uri)
+    assert storage.get("ip:1.2.3.4") == 800
+    assert storage.get_expiry("ip:1.2.3.4") > time.time()
+
+def test_expired_window_starts_over(tmp_path):
+    """Test that a hit after the window expired resets the count."""
+    storage = SQLiteStorage(f"sqlite:///{tmp_path}/ratelimit.db")
+    assert storage.incr("k", 0.05) == 1
+    assert storage.incr("k", 0.05) == 2
+    time.sleep(0.06)
+    assert storage.get("k") == 0
+    assert storage.incr("k", 0.05) == 1
+
+    started = time.perf_counter()
+    for _ in range(1000):
+        storage.incr("hot", 60)
+    assert (time.perf_counter() - started) / 1000 < 0.001 # well under a millisecond per check
+
+def test_tiers_pick_limits_per_key():
+    """Test that api keys map to their tier and everything else gets the default."""
+    tiers = RateLimitTiers({"partner": {"analyze": "600/minute"}}, {"abc": "partner"})
+    assert tiers.limit_for(f"api_key:{api_key_digest('abc')}", "analyze") == "600/minute"
+    assert tiers.limit_for(f"api_key:{api_key_digest('abc')}", "batch") == "10/minute"
+    assert tiers.limit_for("api_key:abc", "analyze") == "60/minute"
+    assert tiers.limit_for(f"api_key:{api_key_digest('other')}", "analyze") == "60/minute"
+    assert tiers.limit_for("ip:10.0.0.1", "analyze") == "60/minute"
+
+def test_endpoint_enforces_tier_quota(monkeypatch):
+    """Test that /analyze answers 429 once a key's tier quota is used up."""
+    monkeypatch.setitem(main.rate_limit_tiers.tiers, "tiny", {"analyze": "2/minute"})
+    api_key = f"tiny-{time.time()}"
+    monkeypatch.setitem(main.rate_limit_tiers.key_tiers, api_key_digest(api_key), "tiny")
+    client = TestClient(main.app)
+
+    statuses = [
+        client.post("/analyze", files={"image": ("a.txt", b"x", "text/plain")}, headers={"X-API-Key": api_key}).status_code
+        for _ in range(3)
+    ]
+    assert statuses == [400, 400, 429]
+    retry = client.post("/analyze", files={"image": ("a.txt", b"x", "text/plain")}, headers={"X-API-Key": api_key})
+    # the window opened with the first request a moment ago, so nearly all of the minute is left
+    assert 55 <= int(retry.headers["Retry-After"]) <= 60
+
+    # counters are keyed by the digest, the raw key never reaches the file
+    path = main.RATE_LIMIT_STORAGE.split(":///", 1)[1]
+    keys = [key for key, in sqlite3.connect(path).execute("SELECT key FROM rate_limits")]
+    assert any(api_key_digest(api_key) in key for key in keys)
+    assert not any(api_key in key for key in keys)
@@ -0,0 +1,125 @@
+"""Test scoring profiles and re-scoring stored scans."""
+from datetime import datetime
+import numpy as np
+import pytest
+from sqlalchemy import text
+from analysis.profiles import ScoringProfile, UnknownProfileError, get_profile
+from database import rescore
+from database.db import get_db, init_db, rebuild_stats
+from database.models import Scan, ScanStats
+from database.rescore import rescore_chunk, rescore_scans
+
+def aggregates(location):
+    """scan_stats, the label counts and the location's rollups as plain tuples."""
+    with get_db() as db:
+        stats = db.execute(text("SELECT total, round(score_sum, 6), min_score, max_score FROM scan_stats")).all()
+        labels = db.execute(text("SELECT label, count FROM scan_label_counts WHERE count > 0 ORDER BY label")).all()
+        rollups = [
+            db.execute(text(
+                f"SELECT bucket, count, round(score_sum, 6), score_min, score_max, low_count, moderate_count, high_count "
+                f"FROM {table} WHERE location = :location ORDER BY bucket"
+            ), {"location": location}).all()
+            for table in ("scan_rollups_hourly", "scan_rollups_daily")
+        ]
+    return stats, labels, rollups
+
+def test_array_scoring_matches_scalar():
+    """Test that score_array/label_array agree with score/label, cutoffs included."""
+    profile = get_profile("v1")
+    rng = np.random.default_rng(7)
+    spot, edge, texture = rng.random(1000), rng.random(1000) * 0.4, rng.random(1000) * 300
+    scores = profile.score_array(spot, edge, texture)
+    assert scores.tolist() == [profile.score(*values) for values in zip(spot, edge, texture)]
+
+    boundaries = np.array([0.0, 32.99, 33.0, 66.99, 67.0, 100.0])
+    assert profile.label_array(boundaries).tolist() == [profile.label(score) for score in boundaries]
+    assert profile.label_array(boundaries).tolist() == ["low", "low", "moderate", "moderate", "high", "high"]
+
+    with pytest.raises(UnknownProfileError):
+        get_profile("v0")
+
+def test_rescore_chunk_only_returns_changed_rows():
+    """Test that unchanged rows are only re-tagged and changed rows carry new values."""
+    profile = get_profile("v1")
+    score = profile.score(0.2, 0.1, 64.0)
+    # id, spot, edge, texture, baseline, score, delta, label code, tagged
+    chunk = np.array([
+        [1, 0.2, 0.1, 64.0, 15.0, round(score, 2), round(score - 15.0, 2), 0, 1],
+        [2, 0.2, 0.1, 64.0, 15.0, round(score, 2), round(score - 15.0, 2), 0, 0],
+        [3, 0.9, 0.3, 120.0, 15.0, 10.0, -5.0, 0, 1],
+    ])
+    changes, retag = rescore_chunk(profile, chunk)
+    assert retag.tolist() == [2.0]
+    assert changes[:, 0].tolist() == [3.0]
+    assert changes[0, 3] == 2 # high
+
+def test_rescore_scans_with_retuned_profile():
+    """Test re-scoring stored scans in chunks, tagging them and keeping /stats aggregates and rollups exact."""
+    init_db()
+    location = f"Rescore-Test-{datetime.utcnow().timestamp()}"
+    with get_db() as db:
+        scans = [
+            Scan(score=10.0, baseline_id="clean_surface", baseline_score=15.0, delta=-5.0, label="low",
+                 spot_coverage=spot, edge_density=0.1, texture_variance=50.0, mean_intensity=200.0, sample_name="Rescore-Test",
+                 location=location, timestamp=datetime(2025, 5, 5, hour), scoring_mode=mode)
+            for spot, hour, mode in ((0.1, 8, None), (0.4, 8, "standard"), (0.8, 9, "standard"), (0.9, 9, "tiled"))
+        ]
+        db.add_all(scans)
+        db.flush()
+        ids = [scan.id for scan in scans]
+
+    retuned = ScoringProfile("test-spots", spot_weight=1.0, edge_weight=0.0, texture_weight=0.0, moderate_cutoff=30, high_cutoff=60)
+    try:
+        result = rescore_scans(retuned, chunk_rows=2)
+        assert result["scanned"] >= 4 and result["updated"] >= 3
+
+        with get_db() as db:
+            rows = db.query(Scan).filter(Scan.id.in_(ids)).order_by(Scan.id).all()
+            assert [(row.score, row.delta, row.label, row.score_version) for row in rows] == [
+                (10.0, -5.0, "low", "test-spots"),
+                (40.0, 25.0, "moderate", "test-spots"),
+                (80.0, 65.0, "high", "test-spots"),
+                (90.0, 75.0, "high", "test-spots"),
+            ]
+            stats = db.query(ScanStats).one()
+            assert stats.total == db.query(Scan).filter(Scan.scoring_mode.is_distinct_from("tiled")).count()
+
+        # the per-chunk deltas leave the aggregates exactly where a full rebuild puts them
+        adjusted = aggregates(location)
+        assert adjusted[2][0][1][3:5] == (80.0, 80.0) # 9:00 bucket, the tiled scan isn't counted
+        rebuild_stats()
+        assert aggregates(location) == adjusted
+
+        assert rescore_scans(retuned)["scanned"] == 0 # everything is tagged already
+    finally:
+        rescore_scans(get_profile("v1"))
+        with get_db() as db:
+            db.query(Scan).filter(Scan.id.in_(ids)).delete(synchronize_session=False)
+
+def test_failed_chunk_rolls_back_and_keeps_triggers(monkeypatch):
+    """Test that an error while applying a chunk undoes its updates and leaves the triggers in place."""
+    init_db()
+    with get_db() as db:
+        scan = Scan(score=10.0, baseline_id="clean_surface", baseline_score=15.0, delta=-5.0, label="low",
+                    spot_coverage=0.5, edge_density=0.1, texture_variance=50.0, mean_intensity=200.0, sample_name="Rescore-Fail")
+        db.add(scan)
+        db.flush()
+        scan_id = scan.id
+
+    def triggers():
+        with get_db() as db:
+            return set(db.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger'")).scalars())
+
+    installed = triggers()
+    monkeypatch.setattr(rescore, "APPLY_DELTAS", rescore.APPLY_DELTAS + ("SELECT no_such_function()",))
+    retuned = ScoringProfile("test-fail", spot_weight=1.0, edge_weight=0.0, texture_weight=0.0, moderate_cutoff=30, high_cutoff=60)
+    try:
+        with pytest.raises(Exception, match="no_such_function"):
+            rescore_scans(retuned)
+        assert triggers() == installed
+        with get_db() as db:
+            stored = db.get(Scan, scan_id)
+            assert stored is not None and (stored.score, stored.score_version) == (10.0, None)
+    finally:
+        with get_db() as db:
+            db.query(Scan).filter(Scan.id == scan_id).delete(synchronize_session=False)
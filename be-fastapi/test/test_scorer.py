@@ -0,0 +1,72 @@
+"""Test fused scoring pipeline against the legacy one."""
+import random
+import numpy as np
+from PIL import Image, ImageDraw
+from analysis.scorer import ContaminationScorer, FUSED_METRIC_TOLERANCE, FUSED_SCORE_TOLERANCE
+
+def create_surface(width, height, spots, seed):
+    """Create a noisy light surface with dark spots."""
+    rng = random.Random(seed)
+    img = Image.new('RGB', (width, height), color=(230, 225, 215))
+    draw = ImageDraw.Draw(img)
+    for _ in range(spots):
+        x, y, r = rng.randint(0, width), rng.randint(0, height), rng.randint(3, 30)
+        c = rng.randint(60, 200)
+        draw.ellipse([x - r, y - r, x + r, y + r], fill=(c, c - 10, c - 20))
+    noise = np.random.RandomState(seed).randint(-8, 8, (height, width, 3))
+    return Image.fromarray(np.clip(np.array(img).astype(np.int16) + noise, 0, 255).astype(np.uint8))
+
+def test_fused_matches_legacy_within_tolerance():
+    """Test that the fused pipeline gives the legacy metrics within the documented tolerance."""
+    fused = ContaminationScorer()
+    legacy = ContaminationScorer(fused=False)
+
+    for seed, (width, height, spots) in enumerate([(800, 600, 100), (2000, 1500, 300), (1200, 1600, 50), (640, 480, 800)]):
+        image = create_surface(width, height, spots, seed)
+        fused_score, fused_metrics = fused.analyze(image)
+        legacy_score, legacy_metrics = legacy.analyze(image)
+
+        assert abs(fused_score - legacy_score) <= FUSED_SCORE_TOLERANCE
+        for name, tolerance in FUSED_METRIC_TOLERANCE.items():
+            assert abs(getattr(fused_metrics, name) - getattr(legacy_metrics, name)) <= tolerance
+
+def test_fused_is_exact_at_target_size():
+    """Test that no resize means identical gray pixels and metrics."""
+    image = create_surface(800, 600, 150, seed=7)
+    fused_score, fused_metrics = ContaminationScorer().analyze(image)
+    legacy_score, legacy_metrics = ContaminationScorer(fused=False).analyze(image)
+    assert fused_metrics == legacy_metrics
+    assert abs(fused_score - legacy_score) < 1e-9
+
+def test_tiled_single_tile_matches_full_image():
+    """Test that a tile covering the whole image gives the same metrics as analyzing it untiled."""
+    scorer = ContaminationScorer(tile_size=1024)
+    gray = np.asarray(create_surface(900, 700, 150, 7).convert("L"))
+
+    score, metrics = scorer.analyze_gray(gray)
+    tiled_score, tiled_metrics, heatmap = scorer.analyze_tiled(gray)
+
+    assert (heatmap.rows, heatmap.cols) == (1, 1)
+    assert tiled_metrics.spot_coverage == metrics.spot_coverage
+    assert tiled_metrics.edge_density == metrics.edge_density
+    assert abs(tiled_metrics.texture_variance - metrics.texture_variance) <= 0.01
+    assert abs(tiled_score - score) <= 0.01
+
+def test_tiled_heatmap_highlights_dirty_region():
+    """Test that the heatmap grid covers the image and the dirty tile scores highest."""
+    scorer = ContaminationScorer(tile_size=256, tile_workers=4)
+    image = create_surface(1000, 700, 0, 3)
+    draw = ImageDraw.Draw(image)
+    for i in range(60):
+        x, y = 520 + (i * 37) % 220, 280 + (i * 53) % 200
+        draw.ellipse([x - 6, y - 6, x + 6, y + 6], fill=(70, 60, 50))
+    gray = np.asarray(image.convert("L"))
+
+    score, metrics, heatmap = scorer.analyze_tiled(gray)
+
+    assert (heatmap.rows, heatmap.cols) == (3, 4)
+    assert all(len(row) == 4 for row in heatmap.scores)
+    worst = max((value, r, c) for r, row in enumerate(heatmap.scores) for c, value in enumerate(row))
+    assert (worst[1], worst[2]) in {(1, 2), (2, 2)}
+    assert min(min(row) for row in heatmap.scores) < worst[0] / 2
+    assert 0 <= score <= 100 and metrics.phash
@@ -0,0 +1,61 @@
+"""Test perceptual hashing and the similarity index."""
+import random
+import threading
+import time
+import cv2
+import numpy as np
+from analysis.similarity import SimilarityIndex, dhash, hamming
+
+def brute_force(hashes, query, max_distance):
+    """Linear scan reference."""
+    return sorted((scan_id, hamming(query, value)) for scan_id, value in hashes.items() if hamming(query, value) <= max_distance)
+
+def test_dhash_survives_rescaling():
+    """Test that a rescaled copy hashes close to the original."""
+    rng = np.random.RandomState(0)
+    gray = (rng.rand(60, 80) * 255).astype(np.uint8).repeat(10, axis=0).repeat(10, axis=1)
+    smaller = cv2.resize(gray, (400, 300), interpolation=cv2.INTER_AREA)
+    other = (rng.rand(600, 800) * 255).astype(np.uint8)
+    assert hamming(dhash(gray), dhash(smaller)) <= 4
+    assert hamming(dhash(gray), dhash(other)) > 10
+
+def test_index_matches_linear_scan():
+    """Test that multi-index lookup returns exactly what a full scan would."""
+    rng = random.Random(3)
+    base = rng.getrandbits(64)
+    hashes = {}
+    for scan_id in range(1, 3001):
+        value = rng.getrandbits(64)
+        if scan_id % 10 == 0:
+            value = base
+            for bit in rng.sample(range(64), rng.randint(0, 14)):
+                value ^= 1 << bit
+        hashes[scan_id] = value
+
+    index = SimilarityIndex()
+    index.refresh(lambda last_id: [(scan_id, f"{value:016x}") for scan_id, value in hashes.items() if scan_id > last_id])
+    assert len(index) == 3000
+    assert index.last_id == 3000
+
+    for max_distance in (0, 3, 8, 12):
+        found = sorted(index.search(base, max_distance))
+        assert found == brute_force(hashes, base, max_distance)
+
+def test_concurrent_refreshes_load_history_once():
+    """Test that simultaneous first lookups don't each load the full history."""
+    calls = []
+
+    def load_since(last_id):
+        calls.append(last_id)
+        time.sleep(0.05) # a slow full load
+        return [(scan_id, f"{scan_id:016x}") for scan_id in range(1, 101) if scan_id > last_id]
+
+    index = SimilarityIndex()
+    threads = [threading.Thread(target=index.refresh, args=(load_since,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [0, 100, 100, 100]
+    assert len(index) == 100
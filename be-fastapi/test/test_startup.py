@@ -0,0 +1,140 @@
+"""Test lazy app loading and warm-up readiness."""
+import asyncio
+import json
+import sys
+import time
+from analysis.warmup import WarmUp, synthetic_surface
+from analysis.ingest import probe_image
+from server import LazyApp
+
+SLOW_APP = '''
+import time
+time.sleep(0.3) # a heavy import
+events = []
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            events.append(message["type"])
+            await send({"type": message["type"] + ".complete"})
+            if message["type"] == "lifespan.shutdown":
+                return
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": scope["path"].encode()})
+'''
+
+async def call(app, path):
+    """Send a GET through the app, return (status, body)."""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app({"type": "http", "method": "GET", "path": path, "headers": [], "query_string": b""}, receive, send)
+    return messages[0]["status"], messages[1]["body"]
+
+def run_lifespan(app, during):
+    """Start the app's lifespan, await during(), then shut it down."""
+    async def run():
+        inbox = asyncio.Queue()
+        outbox = asyncio.Queue()
+        await inbox.put({"type": "lifespan.startup"})
+        lifespan = asyncio.create_task(app({"type": "lifespan", "state": {}}, inbox.get, outbox.put))
+        assert (await outbox.get())["type"] == "lifespan.startup.complete"
+        result = await during()
+        await inbox.put({"type": "lifespan.shutdown"})
+        assert (await outbox.get())["type"] == "lifespan.shutdown.complete"
+        await lifespan
+        return result
+
+    return asyncio.run(run())
+
+def test_health_answers_while_app_imports(tmp_path, monkeypatch):
+    """Test that /health and /ready are answered during the import and other requests wait for the app."""
+    (tmp_path / "slow_app.py").write_text(SLOW_APP)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    app = LazyApp("slow_app:app")
+
+    async def during():
+        health = await call(app, "/health")
+        ready = await call(app, "/ready")
+        loaded_before = app.app is not None
+        other = await call(app, "/scans")
+        return health, ready, loaded_before, other
+
+    health, ready, loaded_before, other = run_lifespan(app, during)
+    assert health[0] == 200
+    assert ready[0] == 503 and json.loads(ready[1])["detail"]["status"] == "starting"
+    assert not loaded_before
+    assert other == (200, b"/scans")
+
+    assert sys.modules["slow_app"].events == ["lifespan.startup", "lifespan.shutdown"]
+    assert set(app.timings) == {"import", "startup"}
+
+def test_failed_import_fails_health(tmp_path, monkeypatch):
+    """Test that an app that can't be imported makes /health fail instead of hanging."""
+    (tmp_path / "broken_app.py").write_text("raise RuntimeError('missing config')\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    app = LazyApp("broken_app:app", wait_seconds=5, exit_on_error=False)
+
+    async def during():
+        other = await call(app, "/scans")
+        return other, await call(app, "/health")
+
+    other, health = run_lifespan(app, during)
+    assert other[0] == 503
+    assert health[0] == 503 and "missing config" in json.loads(health[1])["error"]
+
+def test_warm_up_gates_readiness():
+    """Test that readiness waits for every step and a failed step keeps it not ready."""
+    async def ok():
+        await asyncio.sleep(0)
+
+    async def broken():
+        raise RuntimeError("no opencv")
+
+    warm_up = WarmUp()
+    assert not warm_up.ready
+    asyncio.run(warm_up.run([("scorer", ok), ("database", ok)]))
+    assert warm_up.ready and set(warm_up.stats()["steps"]) == {"scorer", "database"}
+
+    failed = WarmUp()
+    asyncio.run(failed.run([("scorer", broken), ("database", ok)]))
+    assert failed.done and not failed.ready
+    assert failed.stats()["error"] == "scorer: no opencv" and "database" not in failed.steps
+
+    assert WarmUp(enabled=False).ready
+
+def test_synthetic_surface_is_a_valid_upload():
+    """Test that the warm-up image goes through the same probe as an upload."""
+    assert probe_image(synthetic_surface())[1:] == (1024, 768)
+
+def test_startup_keeps_the_event_loop_free(monkeypatch):
+    """Test that the migration and baseline rebuild at startup run off the event loop."""
+    import main
+    from database.db import init_db
+
+    def slow_init_db():
+        time.sleep(0.2) # a long migration
+        init_db()
+
+    async def start():
+        ticks = [0]
+
+        async def tick():
+            while True:
+                ticks[0] += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.create_task(tick())
+        await main.startup_event()
+        ticker.cancel()
+        await main.shutdown_event()
+        return ticks[0]
+
+    monkeypatch.setattr(main, "init_db", slow_init_db)
+    assert asyncio.run(start()) >= 10
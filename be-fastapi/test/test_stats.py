@@ -0,0 +1,148 @@
+"""Test trigger-maintained /stats aggregates."""
+from fastapi.testclient import TestClient
+from datetime import datetime, timedelta
+from sqlalchemy import func, text
+from database.db import get_db, init_db, rebuild_stats
+from database.models import Scan
+from main import app
+
+AGGREGATED = Scan.scoring_mode.is_distinct_from("tiled")
+
+def full_scan_stats():
+    """The original three full-table queries /stats used to run, without tiled scans."""
+    with get_db() as db:
+        total = db.query(func.count(Scan.id)).filter(AGGREGATED).scalar() or 0
+        stats = db.query(func.avg(Scan.score), func.min(Scan.score), func.max(Scan.score)).filter(AGGREGATED).one()
+        by_label = {"low": 0, "moderate": 0, "high": 0}
+        for label, count in db.query(Scan.label, func.count(Scan.id)).filter(AGGREGATED).group_by(Scan.label).all():
+            by_label[label] = count
+    return {
+        "total_scans": total,
+        "average_score": round(stats[0] or 0.0, 2),
+        "min_score": round(stats[1] or 0.0, 2),
+        "max_score": round(stats[2] or 0.0, 2),
+        "by_label": by_label
+    }
+
+def make_scan(score, label, sample_name="Stats-Test", **kwargs):
+    """Build a scan row with fixed metrics."""
+    return Scan(score=score, baseline_id=kwargs.pop("baseline_id", "clean_surface"), baseline_score=15.0, delta=score - 15.0, label=label,
+                spot_coverage=0.1, edge_density=0.1, texture_variance=10.0, mean_intensity=200.0, sample_name=sample_name, **kwargs)
+
+def raw_rollup(location, start, end):
+    """Per-day aggregates straight from scans."""
+    with get_db() as db:
+        day = func.strftime('%Y-%m-%d 00:00:00', Scan.timestamp)
+        rows = db.query(
+            day, func.count(Scan.id), func.avg(Scan.score), func.min(Scan.score), func.max(Scan.score)
+        ).filter(AGGREGATED, Scan.location == location, Scan.timestamp >= start, Scan.timestamp < end).group_by(day).order_by(day).all()
+    return [(bucket, count, round(avg, 2), round(low, 2), round(high, 2)) for bucket, count, avg, low, high in rows]
+
+def test_stats_track_inserts_updates_and_deletes():
+    """Test that /stats matches the full-table queries after every kind of write."""
+    init_db()
+    client = TestClient(app)
+
+    with get_db() as db:
+        db.add_all([make_scan(0.5, "low"), make_scan(99.5, "high"), make_scan(50.0, "moderate")])
+    assert client.get("/stats").json() == full_scan_stats()
+
+    with get_db() as db:
+        lowest = db.query(Scan).filter(Scan.sample_name == "Stats-Test", Scan.score == 0.5).first()
+        assert lowest is not None
+        lowest.score = 70.0
+        lowest.label = "high"
+    assert client.get("/stats").json() == full_scan_stats()
+
+    with get_db() as db:
+        db.query(Scan).filter(Scan.sample_name == "Stats-Test").delete()
+    assert client.get("/stats").json() == full_scan_stats()
+
+def test_tiled_scans_stay_out_of_the_aggregates():
+    """Test that tiled scans are listed but never counted in /stats or the rollups."""
+    init_db()
+    client = TestClient(app)
+    location = f"Tiled-Test-{datetime.utcnow().timestamp()}"
+    day = datetime(2025, 4, 7, 10)
+    before = client.get("/stats").json()
+
+    with get_db() as db:
+        db.add_all([
+            make_scan(100.0, "high", location=location, timestamp=day, scoring_mode="tiled"),
+            make_scan(0.0, "low", location=location, timestamp=day, scoring_mode="tiled"),
+            make_scan(40.0, "moderate", location=location, timestamp=day, scoring_mode="standard"),
+        ])
+    stats = client.get("/stats").json()
+    assert stats == full_scan_stats()
+    assert stats["total_scans"] == before["total_scans"] + 1
+
+    def daily():
+        params = {"bucket": "day", "start": day.isoformat(), "end": (day + timedelta(days=1)).isoformat(), "location": location}
+        return [(p["count"], p["min_score"], p["max_score"]) for p in client.get("/stats/timeseries", params=params).json()["series"]]
+
+    assert daily() == [(1, 40.0, 40.0)]
+    listed = client.get("/scans", params={"location": location}).json()["items"]
+    assert sorted(scan["scoring_mode"] for scan in listed) == ["standard", "tiled", "tiled"]
+
+    with get_db() as db:
+        db.query(Scan).filter(Scan.location == location, Scan.scoring_mode == "tiled").update({"score": 55.0, "label": "moderate"})
+        db.query(Scan).filter(Scan.location == location, Scan.score == 0.0).delete()
+    assert client.get("/stats").json() == full_scan_stats()
+    assert daily() == [(1, 40.0, 40.0)]
+
+    rebuild_stats(day, day)
+    assert client.get("/stats").json() == full_scan_stats()
+    assert daily() == [(1, 40.0, 40.0)]
+
+def test_rebuild_restores_aggregates():
+    """Test that rebuild_stats recovers from a corrupted summary."""
+    init_db()
+    with get_db() as db:
+        db.add(make_scan(42.0, "moderate"))
+    with get_db() as db:
+        db.execute(text("UPDATE scan_stats SET total = total + 1000"))
+
+    rebuild_stats()
+    assert TestClient(app).get("/stats").json() == full_scan_stats()
+
+def test_timeseries_rollups_follow_writes():
+    """Test that daily and weekly rollups match raw GROUP BY results after inserts, updates and deletes."""
+    init_db()
+    client = TestClient(app)
+    location = f"Rollup-Test-{datetime.utcnow().timestamp()}"
+    start = datetime(2025, 3, 3)
+    end = start + timedelta(days=14)
+
+    with get_db() as db:
+        db.add_all([
+            make_scan(10.0 + i * 7 % 80, ["low", "moderate", "high"][i % 3], location=location,
+                      baseline_id=["clean_surface", "light_use"][i % 2], timestamp=start + timedelta(hours=i * 13))
+            for i in range(20)
+        ])
+
+    def daily():
+        response = client.get("/stats/timeseries", params={"bucket": "day", "start": start.isoformat(), "end": end.isoformat(), "location": location})
+        assert response.status_code == 200
+        return [(p["bucket"], p["count"], p["average_score"], p["min_score"], p["max_score"]) for p in response.json()["series"]]
+
+    assert daily() == raw_rollup(location, start, end)
+
+    with get_db() as db:
+        first = db.query(Scan).filter(Scan.location == location).order_by(Scan.timestamp).first()
+        assert first is not None
+        first.score = 95.0
+        first.timestamp = start + timedelta(days=9)
+        db.query(Scan).filter(Scan.location == location, Scan.score == 17.0).delete()
+    assert daily() == raw_rollup(location, start, end)
+
+    weekly = client.get("/stats/timeseries", params={"bucket": "week", "start": start.isoformat(), "end": end.isoformat(), "location": location}).json()
+    assert [p["bucket"] for p in weekly["series"]] == ["2025-03-03 00:00:00", "2025-03-10 00:00:00"]
+    assert sum(p["count"] for p in weekly["series"]) == 19
+
+    by_baseline = client.get("/stats/timeseries", params={"bucket": "week", "start": start.isoformat(), "end": end.isoformat(), "location": location, "group_by": "baseline_id"}).json()
+    assert {p["baseline_id"] for p in by_baseline["series"]} == {"clean_surface", "light_use"}
+
+    with get_db() as db:
+        db.execute(text("DELETE FROM scan_rollups_daily WHERE location = :location"), {"location": location})
+    rebuild_stats(start, end)
+    assert daily() == raw_rollup(location, start, end)
@@ -0,0 +1,90 @@
+"""Test streaming upload limits."""
+import asyncio
+import io
+from PIL import Image
+from fastapi.testclient import TestClient
+from database.db import init_db
+from middleware.upload_limit import UploadLimitMiddleware
+from main import MAX_FILE_SIZE, app
+
+def create_test_image():
+    """Create a plain white test image."""
+    img_bytes = io.BytesIO()
+    Image.new('RGB', (400, 300), color='white').save(img_bytes, format='PNG')
+    return img_bytes.getvalue()
+
+def run_middleware(headers, chunks, limit=100):
+    """Send one request through the middleware, return (body bytes the app saw, response start status)."""
+    async def run():
+        seen = []
+
+        async def inner(scope, receive, send):
+            while True:
+                message = await receive()
+                seen.append(message["body"])
+                if not message["more_body"]:
+                    break
+
+        pending = [{"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1} for i, chunk in enumerate(chunks)]
+
+        async def receive():
+            if not pending:
+                raise AssertionError("body must not be read")
+            return pending.pop(0)
+
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        middleware = UploadLimitMiddleware(inner, default_limit=limit)
+        scope = {"type": "http", "method": "POST", "path": "/analyze", "headers": headers, "query_string": b""}
+        try:
+            await middleware(scope, receive, send)
+        except Exception as e:
+            return seen, getattr(e, "status_code", None)
+        return seen, messages[0]["status"] if messages else None
+
+    return asyncio.run(run())
+
+def test_content_length_rejected_before_body():
+    """Test that a declared oversized body is answered from the headers."""
+    seen, status = run_middleware([(b"content-length", b"101")], [])
+    assert seen == [] and status == 413
+
+def test_streamed_body_cut_off_at_limit():
+    """Test that a body without Content-Length stops at the first chunk over the limit."""
+    seen, status = run_middleware([], [b"x" * 60, b"x" * 60, b"x" * 60])
+    assert status == 413
+    assert len(seen) == 1
+
+    seen, status = run_middleware([], [b"x" * 50, b"x" * 50])
+    assert status is None and len(seen) == 2
+
+def test_analyze_rejects_oversized_and_mislabelled_uploads():
+    """Test 413 for oversized uploads and 400 when the bytes aren't an image."""
+    init_db()
+    client = TestClient(app)
+
+    response = client.post("/analyze", files={"image": ("big.png", b"\x89PNG\r\n\x1a\n" + b"0" * MAX_FILE_SIZE, "image/png")})
+    assert response.status_code == 413
+    assert response.json()["error"] == "payload_too_large"
+
+    response = client.post("/analyze", files={"image": ("fake.png", b"GIF89a" + b"0" * 1000, "image/png")})
+    assert response.status_code == 400
+    assert "not a JPEG or PNG" in response.json()["message"]
+
+    assert client.post("/analyze", files={"image": ("ok.png", create_test_image(), "image/png")}).status_code == 200
+
+def test_analyze_chunked_upload_cut_off():
+    """Test that a chunked body with no Content-Length gets the app's 413 error response."""
+    def body():
+        yield b'--b\r\nContent-Disposition: form-data; name="image"; filename="a.png"\r\nContent-Type: image/png\r\n\r\n'
+        for _ in range(200):
+            yield b"0" * 65536
+
+    client = TestClient(app)
+    response = client.post("/analyze", content=body(), headers={"content-type": "multipart/form-data; boundary=b"})
+    assert response.status_code == 413
+    assert response.json()["error"] == "payload_too_large"
+    assert response.json()["request_id"] == response.headers["X-Request-ID"]
@@ -0,0 +1,96 @@
+"""Test write-behind group commit."""
+import asyncio
+import time
+from sqlalchemy import func
+from database.db import get_db, init_db
+from database.models import Scan
+from database.writer import ScanWriter
+
+def make_scan(i):
+    """Build a scan row tagged for this test."""
+    return Scan(score=float(i), baseline_id="clean_surface", baseline_score=15.0, delta=i - 15.0, label="low",
+                spot_coverage=0.1, edge_density=0.1, texture_variance=10.0, mean_intensity=200.0, sample_name="Writer-Test")
+
+def count_scans():
+    """Count scans written by this test module."""
+    with get_db() as db:
+        return db.query(func.count(Scan.id)).filter(Scan.sample_name == "Writer-Test").scalar()
+
+def test_concurrent_writes_share_batches():
+    """Test that concurrent writers get real ids from a few batched commits."""
+    init_db()
+    initial = count_scans()
+    writer = ScanWriter(enabled=True, batch_size=10, max_latency=0.05)
+
+    async def run():
+        writer.start()
+        ids = await asyncio.gather(*(writer.write(make_scan(i)) for i in range(25)))
+        await writer.stop()
+        return ids
+
+    ids = asyncio.run(run())
+    assert len(set(ids)) == 25 and all(ids)
+    assert writer.batches == 3
+    assert count_scans() == initial + 25
+
+def test_stop_flushes_and_full_queue_falls_back():
+    """Test that queued scans are committed on stop and overflow is written synchronously."""
+    init_db()
+    initial = count_scans()
+    writer = ScanWriter(enabled=True, batch_size=100, max_latency=1.0, max_queue=3, wait=False)
+
+    async def run():
+        writer.start()
+        results = [await writer.write(make_scan(i)) for i in range(5)]
+        await writer.stop()
+        return results
+
+    results = asyncio.run(run())
+    assert results[:3] == [None, None, None]
+    assert isinstance(results[3], int)
+    assert writer.fallbacks >= 1
+    assert count_scans() == initial + 5
+
+def test_failed_batch_only_fails_the_bad_scan():
+    """Test that one bad row in a batch is retried alone and the rest of the batch still gets committed."""
+    init_db()
+    initial = count_scans()
+    writer = ScanWriter(enabled=True, batch_size=10, max_latency=0.05)
+    bad = make_scan(99)
+    setattr(bad, "label", None) # NOT NULL, fails the batch commit and then its own
+
+    async def run():
+        writer.start()
+        results = await asyncio.gather(*(writer.write(scan) for scan in [make_scan(i) for i in range(4)] + [bad]), return_exceptions=True)
+        await writer.stop()
+        return results
+
+    results = asyncio.run(run())
+    assert all(isinstance(scan_id, int) for scan_id in results[:4]) and len(set(results[:4])) == 4
+    assert isinstance(results[4], Exception)
+    assert count_scans() == initial + 4
+
+def test_unwaited_write_returns_a_uid_to_find_the_scan(monkeypatch):
+    """Test that /analyze without waiting for the commit still returns an id the scan can be found by."""
+    import io
+    from PIL import Image
+    from fastapi.testclient import TestClient
+    import main
+
+    monkeypatch.setattr(main, "scan_writer", ScanWriter(enabled=True, max_latency=0.05, wait=False))
+    init_db()
+    image = io.BytesIO()
+    Image.new('RGB', (200, 200), color='white').save(image, format='PNG')
+
+    with TestClient(main.app) as client:
+        result = client.post("/analyze", files={"image": ("w.png", image.getvalue(), "image/png")}).json()
+        assert result["scan_id"] is None
+        uid = result["scan_uid"]
+        assert len(uid) == 32
+        for _ in range(50):
+            items = client.get("/scans", params={"uid": uid}).json()["items"]
+            if items:
+                break
+            time.sleep(0.02) # the batch commits within max_latency
+
+    assert [item["uid"] for item in items] == [uid]